@@ -102,6 +102,12 @@ print(cfg.get("worldscore", {}).get("sampled_json_path", ""))
 PY
 )
 
+# 配置了 sweep.checkpoints 时为每个 checkpoint 生成一份配置和 sweep.json，推理和评测在本次作业内依次处理所有 checkpoint
+SWEEP_JSON=$(python "$ROOT_DIR/tools/sweep.py" expand --config-json "$RESOLVED_CONFIG")
+if [[ -n "$SWEEP_JSON" ]]; then
+  echo "Checkpoint sweep: $SWEEP_JSON"
+fi
+
 RUN_MODE=$(python - "$RESOLVED_CONFIG" <<'PY'
 import json
 import sys
@@ -113,57 +119,233 @@ print(cfg.get("run", {}).get("mode", "full"))
 PY
 )
 
+RDZV_DIR="$RUN_OUTPUT_ROOT/rendezvous"
+BG_PIDS=()
+# 节点 0 随机生成本次运行的 ID（写到 $RDZV_DIR/run_id.json 并由同步服务下发），其它节点向它领取；调度系统有任务 ID 时直接用
+if [[ -z "${RDZV_RUN_ID:-}" ]]; then
+  RDZV_RUN_ID=$(python "$ROOT_DIR/tools/rendezvous.py" run-id \
+    --rank "$NODE_RANK_VALUE" --file-dir "$RDZV_DIR" --timeout "${RDZV_RUN_ID_TIMEOUT:-600}")
+fi
+export RDZV_RUN_ID
+export RDZV_DIR
+
+cleanup_rendezvous() {
+  local status=$?
+  if [[ "$status" -ne 0 && ( "$NNODES_VALUE" -gt 1 || "$RUN_MODE" == "pipeline" ) ]]; then
+    # 通知其它节点本节点已失败，避免它们一直等到超时
+    python "$ROOT_DIR/tools/rendezvous.py" abort \
+      --rank "$NODE_RANK_VALUE" --file-dir "$RDZV_DIR" --connect-timeout 5 \
+      --reason "node ${NODE_RANK_VALUE} exited with status ${status}" || true
+  fi
+  if [[ ${#BG_PIDS[@]} -gt 0 ]]; then
+    kill "${BG_PIDS[@]}" 2>/dev/null || true
+  fi
+}
+trap cleanup_rendezvous EXIT
+
+if [[ "$NNODES_VALUE" -gt 1 ]]; then
+  echo "Rendezvous run id: $RDZV_RUN_ID"
+  if [[ "$NODE_RANK_VALUE" == "0" ]]; then
+    python "$ROOT_DIR/tools/rendezvous.py" serve --run-id "$RDZV_RUN_ID" &
+    BG_PIDS+=("$!")
+  fi
+  python "$ROOT_DIR/tools/rendezvous.py" heartbeat --rank "$NODE_RANK_VALUE" --file-dir "$RDZV_DIR" &
+  BG_PIDS+=("$!")
+fi
+
+seal_instance_manifests() {
+  # 推理全部结束后为生成的实例写清单，评测端读一个文件即可得到工作集，不再逐层遍历输出目录
+  local configs=("$RESOLVED_CONFIG")
+  if [[ -n "$SWEEP_JSON" ]]; then
+    mapfile -t configs < <(python -c 'import json, sys; print("\n".join(e["config_json"] for e in json.load(open(sys.argv[1]))["checkpoints"]))' "$SWEEP_JSON")
+  fi
+  local config
+  for config in "${configs[@]}"; do
+    python "$ROOT_DIR/tools/completion.py" \
+      --config-json "$config" \
+      --cases-json "$FILTERED_JSON" \
+      --seal-manifest
+  done
+}
+
+publish_completed_instances() {
+  # 非流水线模式没有发布进程：推理正常退出后，把本次推理写出的实例补上完成记录，推理计划续跑时才能跳过它们
+  # 只认推理开始后写过的输出，旧运行崩溃时留下的半成品不会被当成已完成
+  local configs=("$RESOLVED_CONFIG")
+  if [[ -n "$SWEEP_JSON" ]]; then
+    mapfile -t configs < <(python -c 'import json, sys; print("\n".join(e["config_json"] for e in json.load(open(sys.argv[1]))["checkpoints"]))' "$SWEEP_JSON")
+  fi
+  local config
+  for config in "${configs[@]}"; do
+    python "$ROOT_DIR/tools/completion.py" \
+      --config-json "$config" \
+      --cases-json "$FILTERED_JSON" \
+      --stable-seconds 0 --once \
+      --since "$1"
+  done
+}
+
+reset_instance_streams() {
+  # 推理开始前撤回上一次运行给这些用例留下的完成记录和清单条目，流水线评测端不会把旧输出当成本次已写完的实例
+  local configs=("$RESOLVED_CONFIG")
+  if [[ -n "$SWEEP_JSON" ]]; then
+    mapfile -t configs < <(python -c 'import json, sys; print("\n".join(e["config_json"] for e in json.load(open(sys.argv[1]))["checkpoints"]))' "$SWEEP_JSON")
+  fi
+  local config
+  for config in "${configs[@]}"; do
+    python "$ROOT_DIR/tools/completion.py" \
+      --config-json "$config" \
+      --cases-json "$FILTERED_JSON" \
+      --reset
+  done
+}
+
+# 节点 0 顺带写出按 rank 分配的推理计划（compute.infer_plan），其它节点等计划写完再启动推理
+PLAN_ARGS=()
+if [[ "$RUN_MODE" != "eval-only" && "$NODE_RANK_VALUE" == "0" ]]; then
+  PLAN_ARGS=(--plan --nnodes "$NNODES_VALUE")
+fi
 python "$ROOT_DIR/tools/filter_cases.py" \
   --config-json "$RESOLVED_CONFIG" \
   --input-json "$SAMPLED_JSON" \
-  --output-json "$FILTERED_JSON"
+  --output-json "$FILTERED_JSON" \
+  --index-dir "$RUN_OUTPUT_ROOT/case_index" \
+  ${PLAN_ARGS[@]+"${PLAN_ARGS[@]}"}
+if [[ "$RUN_MODE" != "eval-only" && "$NODE_RANK_VALUE" == "0" ]]; then
+  # 在计划屏障之前完成，其它节点的推理和评测都在这之后启动
+  reset_instance_streams
+fi
+if [[ "$RUN_MODE" != "eval-only" && "$NNODES_VALUE" -gt 1 ]]; then
+  if [[ "$NODE_RANK_VALUE" == "0" ]]; then
+    python "$ROOT_DIR/tools/rendezvous.py" arrive \
+      --name infer_plan --rank 0 --file-dir "$RDZV_DIR" --connect-timeout 5
+  else
+    python "$ROOT_DIR/tools/rendezvous.py" wait \
+      --name infer_plan \
+      --rank "$NODE_RANK_VALUE" \
+      --world-size 1 \
+      --timeout "${INFER_WAIT_TIMEOUT:-36000}" \
+      --file-dir "$RDZV_DIR"
+  fi
+fi
+
+if [[ "$RUN_MODE" == "pipeline" ]]; then
+  # 推理与评测同时进行：按配置切分本机 GPU，评测端持续消费已完成的实例
+  eval "$(python - "$RESOLVED_CONFIG" <<'PY'
+import json
+import os
+import sys
+
+with open(sys.argv[1], "r", encoding="utf-8") as f:
+    cfg = json.load(f)
+compute = cfg.get("compute", {})
+visible = [g for g in os.environ.get("CUDA_VISIBLE_DEVICES", "").split(",") if g.strip()]
+gpus = visible or [str(i) for i in range(int(compute.get("num_gpus", 1)))]
+eval_gpus = int(compute.get("pipeline_eval_gpus", max(len(gpus) // 2, 1)))
+if not 0 < eval_gpus < len(gpus):
+    raise SystemExit(f"compute.pipeline_eval_gpus must be between 1 and {len(gpus) - 1}, got {eval_gpus}")
+print(f"PIPELINE_INFER_GPUS={','.join(gpus[:-eval_gpus])}")
+print(f"PIPELINE_EVAL_GPUS={','.join(gpus[-eval_gpus:])}")
+print(f"PIPELINE_PUBLISH={compute.get('pipeline_publish', 'watch')}")
+print(f"PIPELINE_STABLE_SECONDS={compute.get('pipeline_stable_seconds', 60)}")
+PY
+)"
+  echo "Pipeline: inference on GPUs $PIPELINE_INFER_GPUS, evaluation on GPUs $PIPELINE_EVAL_GPUS"
+
+  (
+    activate_conda /ML-vePFS/research_gen/jmy/jmy_ws/envs_conda/worldscore6
+    export WORLDSCORE_PATH DATA_PATH
+    export CUDA_VISIBLE_DEVICES="$PIPELINE_EVAL_GPUS"
+    export EVAL_FOLLOW=1
+    bash "$ROOT_DIR/tools/run_eval.sh" "$RESOLVED_CONFIG" 2>&1 | tee -a "$LOG_DIR/eval.log"
+  ) &
+  EVAL_PID=$!
+  BG_PIDS+=("$EVAL_PID")
+
+  WATCH_PID=""
+  if [[ "$NODE_RANK_VALUE" == "0" && "$PIPELINE_PUBLISH" == "watch" ]]; then
+    # 推理脚本自身不写完成记录时，由节点 0 根据输出文件是否稳定来发布
+    python "$ROOT_DIR/tools/completion.py" \
+      --config-json "$RESOLVED_CONFIG" \
+      --cases-json "$FILTERED_JSON" \
+      --stable-seconds "$PIPELINE_STABLE_SECONDS" >> "$LOG_DIR/publish.log" 2>&1 &
+    WATCH_PID=$!
+    BG_PIDS+=("$WATCH_PID")
+  fi
+
+  (
+    activate_conda /ML-vePFS/research_gen/jmy/jmy_ws/envs_conda/diffsynth
+    export WORLDSCORE_PATH DATA_PATH
+    export CUDA_VISIBLE_DEVICES="$PIPELINE_INFER_GPUS"
+    INFER_NUM_GPUS=$(awk -F, '{print NF}' <<< "$PIPELINE_INFER_GPUS")
+    export INFER_NUM_GPUS
+    bash "$ROOT_DIR/tools/run_infer.sh" "$RESOLVED_CONFIG" 2>&1 | tee -a "$LOG_DIR/infer.log"
+  )
+
+  python "$ROOT_DIR/tools/rendezvous.py" arrive \
+    --name infer_node --rank "$NODE_RANK_VALUE" --file-dir "$RDZV_DIR" --connect-timeout 5
+  if [[ "$NODE_RANK_VALUE" == "0" ]]; then
+    if [[ "$NNODES_VALUE" -gt 1 ]]; then
+      echo "Waiting for all nodes to finish inference..."
+      python "$ROOT_DIR/tools/rendezvous.py" wait \
+        --name infer_node \
+        --rank "$NODE_RANK_VALUE" \
+        --world-size "$NNODES_VALUE" \
+        --timeout "${INFER_WAIT_TIMEOUT:-36000}" \
+        --file-dir "$RDZV_DIR"
+    fi
+    if [[ -n "$WATCH_PID" ]]; then
+      kill "$WATCH_PID" 2>/dev/null || true
+      # 推理已全部退出，剩余输出不必再等稳定时间
+      python "$ROOT_DIR/tools/completion.py" \
+        --config-json "$RESOLVED_CONFIG" \
+        --cases-json "$FILTERED_JSON" \
+        --stable-seconds 0 --once >> "$LOG_DIR/publish.log" 2>&1
+    fi
+    seal_instance_manifests >> "$LOG_DIR/publish.log" 2>&1
+    python "$ROOT_DIR/tools/rendezvous.py" arrive \
+      --name infer_stream_end --rank 0 --file-dir "$RDZV_DIR" --connect-timeout 5
+  fi
+  wait "$EVAL_PID"
+  exit 0
+fi
 
 if [[ "$RUN_MODE" != "eval-only" ]]; then
   # Inference in diffsynth environment
   activate_conda /ML-vePFS/research_gen/jmy/jmy_ws/envs_conda/diffsynth
   export WORLDSCORE_PATH
   export DATA_PATH
+  INFER_START=$(date +%s)
   bash "$ROOT_DIR/tools/run_infer.sh" "$RESOLVED_CONFIG" 2>&1 | tee -a "$LOG_DIR/infer.log"
 fi
 
 if [[ "$RUN_MODE" != "eval-only" && "$RUN_MODE" != "infer-only" && "$NNODES_VALUE" -gt 1 ]]; then
-  INFER_OUTPUT_ROOT=$(python - "$RESOLVED_CONFIG" <<'PY'
-import json
-import sys
-
-cfg_path = sys.argv[1]
-with open(cfg_path, "r", encoding="utf-8") as f:
-  cfg = json.load(f)
-print(cfg.get("run", {}).get("output_root", ""))
-PY
-  )
-  if [[ -z "$INFER_OUTPUT_ROOT" ]]; then
-    echo "run.output_root is required for multi-node inference sync"
-    exit 1
-  fi
-  INFER_DONE_DIR="$INFER_OUTPUT_ROOT/infer_nodes"
-  mkdir -p "$INFER_DONE_DIR"
-  echo "done" > "$INFER_DONE_DIR/node_${NODE_RANK_VALUE}.done"
   echo "Waiting for all nodes to finish inference..."
-  timeout_sec=${INFER_WAIT_TIMEOUT:-36000}
-  waited=0
-  while [[ "$waited" -lt "$timeout_sec" ]]; do
-    missing=0
-    for i in $(seq 0 $((NNODES_VALUE - 1))); do
-      if [[ ! -f "$INFER_DONE_DIR/node_${i}.done" ]]; then
-        missing=1
-        break
-      fi
-    done
-    if [[ "$missing" -eq 0 ]]; then
-      break
+  python "$ROOT_DIR/tools/rendezvous.py" barrier \
+    --name infer_node \
+    --rank "$NODE_RANK_VALUE" \
+    --world-size "$NNODES_VALUE" \
+    --timeout "${INFER_WAIT_TIMEOUT:-36000}" \
+    --file-dir "$RDZV_DIR"
+fi
+
+# 多机 infer-only 没有推理屏障，节点 0 无法确定其它节点已写完，不写清单（评测时回退为遍历目录）
+if [[ "$RUN_MODE" != "eval-only" && ( "$RUN_MODE" != "infer-only" || "$NNODES_VALUE" -le 1 ) ]]; then
+  if [[ "$NODE_RANK_VALUE" == "0" ]]; then
+    # 走到这里说明各节点推理都已正常结束（任一节点失败时推理屏障会中止）
+    publish_completed_instances "$INFER_START" 2>&1 | tee -a "$LOG_DIR/infer.log"
+    seal_instance_manifests 2>&1 | tee -a "$LOG_DIR/infer.log"
+    if [[ "$NNODES_VALUE" -gt 1 ]]; then
+      python "$ROOT_DIR/tools/rendezvous.py" arrive \
+        --name instance_manifest --rank 0 --file-dir "$RDZV_DIR" --connect-timeout 5
     fi
-    sleep 10
-    waited=$((waited + 10))
-  done
-  if [[ "$missing" -ne 0 ]]; then
-    echo "Timed out waiting for all nodes to finish inference"
-    exit 1
+  else
+    python "$ROOT_DIR/tools/rendezvous.py" wait \
+      --name instance_manifest \
+      --rank "$NODE_RANK_VALUE" \
+      --world-size 1 \
+      --timeout "${INFER_WAIT_TIMEOUT:-36000}" \
+      --file-dir "$RDZV_DIR"
   fi
 fi
 
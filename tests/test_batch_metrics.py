@@ -0,0 +1,105 @@
+import numpy as np
+import pytest
+
+from batch_metrics import BatchEngine, PyiqaFrameScore, ToyFrameScore, _max_diff, verify, worldscore_normalization
+
+CELL = (ToyFrameScore.aspect, ToyFrameScore.metric)
+
+
+@pytest.fixture
+def toy():
+    toy = ToyFrameScore()
+    rng = np.random.default_rng(1)
+    for i in range(9):
+        # 帧数不同、两种分辨率，覆盖跨实例拼批和按形状分组
+        size = 64 if i % 3 else 32
+        toy.frames[f"instance_{i}"] = rng.integers(0, 256, (3 + i % 4, size, size, 3), dtype=np.uint8)
+    return toy
+
+
+def _jobs(toy):
+    return [(instance_dir, [CELL]) for instance_dir in toy.frames]
+
+
+def test_batched_scores_match_unbatched(toy):
+    ok, worst = verify([toy], _jobs(toy), {}, batch_size=16, atol=1e-5)
+    assert ok, worst
+
+
+def test_chunk_scores_match_single_instance_runs(toy):
+    engine = BatchEngine([toy], batch_size=8)
+    batched = engine.evaluate(_jobs(toy), {})
+    assert sorted(batched) == sorted(toy.frames)
+    for job in _jobs(toy):
+        alone = BatchEngine([toy], batch_size=1).evaluate([job], {})
+        expected = alone[job[0]][CELL]
+        assert batched[job[0]][CELL]["score"] == pytest.approx(expected["score"], abs=1e-5)
+        assert batched[job[0]][CELL]["score_normalized"] == pytest.approx(expected["score_normalized"], abs=1e-5)
+    # 每个分辨率一组，组内按 batch_size 切分
+    frames = {}
+    for stack in toy.frames.values():
+        frames[stack.shape[1:]] = frames.get(stack.shape[1:], 0) + len(stack)
+    assert engine.stats["items"] == sum(frames.values())
+    assert engine.stats["batches"] == sum(-(-n // 8) for n in frames.values())
+
+
+def test_only_requested_cells_are_scored(toy):
+    jobs = [(instance_dir, [CELL] if i % 2 else []) for i, instance_dir in enumerate(toy.frames)]
+    results = BatchEngine([toy]).evaluate(jobs, {})
+    assert sorted(results) == sorted(d for d, cells in jobs if cells)
+
+
+def test_out_of_memory_halves_the_batch(toy):
+    class Limited(ToyFrameScore):
+        def forward(self, batch):
+            if len(batch) > 2:
+                raise RuntimeError("CUDA out of memory")
+            return super().forward(batch)
+
+    limited = Limited()
+    limited.frames = toy.frames
+    engine = BatchEngine([limited], batch_size=8, grow_after=1000)
+    results = engine.evaluate(_jobs(toy), {})
+    assert engine.stats["oom_splits"] == 2
+    assert engine.batch_sizes[CELL] == 2
+    expected = BatchEngine([toy], batch_size=1).evaluate(_jobs(toy), {})
+    assert _max_diff(expected, results) <= 1e-5
+
+
+def test_missing_scores_never_match(toy):
+    expected = BatchEngine([toy]).evaluate(_jobs(toy), {})
+    actual = {d: dict(cells) for d, cells in expected.items()}
+    actual["instance_0"][CELL] = None
+    assert _max_diff(expected, actual) == float("inf")
+
+
+def test_normalization_comes_from_worldscore(monkeypatch):
+    import evaluate_filtered as ef
+
+    metrics = {"musiq": {"empirical_min": 20.0, "empirical_max": 80.0, "higher_is_better": True}, "clip_iqa+": 1}
+    monkeypatch.setattr(ef, "Evaluator", object)
+    monkeypatch.setattr(ef, "aspect_info", {"subjective_quality": {"type": "static", "metrics": metrics}})
+    assert worldscore_normalization("subjective_quality", "musiq") == (20.0, 80.0, True)
+    # 没有经验范围时拒绝构建，不用猜的范围
+    with pytest.raises(ValueError, match="no empirical range"):
+        worldscore_normalization("subjective_quality", "clip_iqa+")
+
+
+def test_pyiqa_batched_scores_match_unbatched(tmp_path):
+    pytest.importorskip("torch")
+    pytest.importorskip("pyiqa")
+    cv2 = pytest.importorskip("cv2")
+
+    rng = np.random.default_rng(2)
+    for name, frames in (("a", 5), ("b", 3)):
+        video = tmp_path / name / "videos" / "output.mp4"
+        video.parent.mkdir(parents=True)
+        writer = cv2.VideoWriter(str(video), cv2.VideoWriter_fourcc(*"mp4v"), 8, (96, 64))
+        for _ in range(frames):
+            writer.write(rng.integers(0, 256, (64, 96, 3), dtype=np.uint8))
+        writer.release()
+    adapter = PyiqaFrameScore("cpu", {}, "musiq", normalization=(0.0, 100.0, True))
+    cell = (adapter.aspect, adapter.metric)
+    jobs = [(str(tmp_path / name), [cell]) for name in ("a", "b")]
+    ok, worst = verify([adapter], jobs, {"resolution": [48, 48]}, batch_size=8, atol=1e-4)
+    assert ok, worst
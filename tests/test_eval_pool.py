@@ -0,0 +1,54 @@
+import os
+import time
+
+from eval_pool import EvalPool
+
+
+def _setup(worker_id, device):
+    return {}
+
+
+def _crash_runner(state, payload):
+    if "crash" in payload["instances"]:
+        # 模拟算到一半被 OOM killer 杀掉的 worker：先让已排队的消息发出去，再不声不响地退出
+        time.sleep(0.5)
+        os._exit(3)
+    return len(payload["instances"])
+
+
+def _oom_runner(state, payload):
+    raise RuntimeError("CUDA out of memory")
+
+
+def _feed_run(pool, payloads):
+    outstanding = {id(payload) for payload in payloads}
+    results = []
+    fed = []
+
+    def _feed():
+        if not fed:
+            fed.append(True)
+            return payloads, False
+        return [], not outstanding
+
+    def _on_result(payload, ok, result):
+        outstanding.discard(id(payload))
+        results.append((payload["instances"], ok, result))
+
+    pool.run([], on_result=_on_result, feed=_feed, poll_interval=0.2)
+    return sorted(results, key=lambda row: row[0])
+
+
+def test_crashed_chunk_is_reported_once_dropped():
+    payloads = [{"instances": ["a", "b"]}, {"instances": ["crash"]}, {"instances": ["c"]}]
+    with EvalPool(2, _setup, _crash_runner, device="cpu", max_retries=1) as pool:
+        results = _feed_run(pool, payloads)
+    assert results == [(["a", "b"], True, 2), (["c"], True, 1), (["crash"], False, None)]
+
+
+def test_chunk_dropped_after_out_of_memory_is_reported():
+    payloads = [{"instances": ["a"]}]
+    with EvalPool(2, _setup, _oom_runner, device="cpu", max_retries=0, oom_retries=0, oom_backoff=0.0) as pool:
+        stats = pool.run(payloads, on_result=lambda payload, ok, result: payloads.append((ok, result)))
+    assert payloads[1:] == [(False, None)]
+    assert sum(row["failed"] for row in stats.values()) == 1
@@ -0,0 +1,74 @@
+import json
+
+from gpu_packing import (
+    WORKER_BASE_MB,
+    describe_plan,
+    device_inventory,
+    estimate_footprint,
+    load_memory_table,
+    plan_workers,
+)
+
+INVENTORY = json.dumps(
+    [
+        {"id": 0, "total_mb": 81920},
+        {"id": 1, "total_mb": 81920, "free_mb": 40000},
+        {"id": 2, "total_mb": 24576, "free_mb": 2000},
+    ]
+)
+
+
+def test_inventory_from_spec(monkeypatch):
+    monkeypatch.delenv("EVAL_GPU_INVENTORY", raising=False)
+    inventory = device_inventory(INVENTORY)
+    assert [d["id"] for d in inventory] == ["0", "1", "2"]
+    assert inventory[0]["free_mb"] == 81920
+    assert inventory[1]["free_mb"] == 40000
+    monkeypatch.setenv("EVAL_GPU_INVENTORY", INVENTORY)
+    assert device_inventory() == inventory
+
+
+def test_packing_fills_each_gpu_by_free_memory():
+    footprint, source = estimate_footprint(["clip_score", "musiq"])
+    assert (footprint, source) == (WORKER_BASE_MB + 2500 + 1500, "table")
+    plan = plan_workers(device_inventory(INVENTORY), footprint, max_workers=0, memory_fraction=0.9)
+    counts = {gpu: plan.count(gpu) for gpu in set(plan)}
+    # 81920*0.9 // 5500 = 13，40000*0.9 // 5500 = 6，第三张卡放不下也给一个
+    assert counts == {"0": 13, "1": 6, "2": 1}
+    assert "20 worker(s)" in describe_plan(plan, footprint, source)
+
+
+def test_fewer_workers_are_spread_by_room_left():
+    twins = device_inventory(json.dumps([{"id": 0, "total_mb": 81920}, {"id": 1, "total_mb": 81920}]))
+    assert sorted(plan_workers(twins, 5500, max_workers=4)) == ["0", "0", "1", "1"]
+    # 空余多的卡先放，直到两张卡剩余空间持平
+    plan = plan_workers(device_inventory(INVENTORY), 5500, max_workers=9, memory_fraction=0.9)
+    assert plan.count("0") == 8 and plan.count("1") == 1
+
+
+def test_requests_beyond_capacity_are_capped():
+    plan = plan_workers(device_inventory(INVENTORY), 5500, max_workers=100, memory_fraction=0.9)
+    assert len(plan) == 20
+
+
+def test_unknown_metric_gets_one_worker_per_gpu():
+    footprint, source = estimate_footprint(["clip_score", "not_a_metric"])
+    assert footprint is None
+    assert "not_a_metric" in source
+    plan = plan_workers(device_inventory(INVENTORY), footprint, max_workers=0)
+    assert sorted(plan) == ["0", "1", "2"]
+    assert sorted(plan_workers(device_inventory(INVENTORY), footprint, max_workers=2)) == ["0", "1"]
+
+
+def test_memory_table_and_trace_calibration(tmp_path):
+    table_path = tmp_path / "table.json"
+    table_path.write_text(json.dumps({"not_a_metric": 3000}))
+    table, calibration = load_memory_table(str(table_path))
+    assert estimate_footprint(["clip_score", "not_a_metric"], table, calibration) == (WORKER_BASE_MB + 5500, "table")
+
+    summary_path = tmp_path / "trace_summary.json"
+    summary_path.write_text(
+        json.dumps({"metrics": {"a/clip_score": {"peak_mem_mb": 3000}, "a/musiq": {"peak_mem_mb": 7000}}})
+    )
+    table, calibration = load_memory_table(str(summary_path))
+    assert calibration["worker_peak_mb"] == 7000
@@ -0,0 +1,37 @@
+import json
+
+from completion import reset, seal_manifest
+from instance_manifest import is_sealed, load_records, rebuild
+
+CASES = [
+    {"image": f"img{i}.png", "visual_movement": "dynamic", "visual_style": "photo", "motion_type": "walk"}
+    for i in range(3)
+]
+
+
+def _generate(runs_root, names):
+    for name in names:
+        video = runs_root / "dynamic" / "photo" / "walk" / name / "videos" / "output.mp4"
+        video.parent.mkdir(parents=True, exist_ok=True)
+        video.write_bytes(b"video")
+
+
+def test_reset_unseals_the_index_until_inference_seals_it(tmp_path):
+    runs_root = tmp_path / "runs"
+    movement_root = runs_root / "dynamic"
+    _generate(runs_root, ["img0", "img9"])
+    rebuild(movement_root, "dynamic")
+    assert sorted(load_records(movement_root)) == ["photo/walk/img0", "photo/walk/img9"]
+
+    cases = tmp_path / "cases.json"
+    cases.write_text(json.dumps(CASES))
+    reset(str(cases), str(runs_root))
+    # 新一轮推理会生成清单里没有的实例，封存之前评测端回退为遍历目录
+    assert load_records(movement_root) is None
+    assert not is_sealed(movement_root)
+    assert sorted(load_records(movement_root, unsealed=True)) == ["photo/walk/img9"]
+
+    _generate(runs_root, ["img0", "img1", "img2"])
+    seal_manifest(str(cases), str(runs_root))
+    assert is_sealed(movement_root)
+    assert sorted(load_records(movement_root)) == [f"photo/walk/img{i}" for i in (0, 1, 2, 9)]
@@ -0,0 +1,118 @@
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+
+import rendezvous
+from rendezvous import _request
+
+SCRIPT = rendezvous.__file__
+RUN_ID = "test-run"
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _rank(command, rank, port, *extra):
+    return subprocess.Popen(
+        [sys.executable, SCRIPT, command, "--rank", str(rank), "--addr", "127.0.0.1", "--port", str(port), *extra],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+
+
+def _barrier(rank, port, world_size, *extra, run_id=RUN_ID, timeout=60):
+    options = ["--run-id", run_id, "--name", "sync", "--world-size", str(world_size), "--timeout", str(timeout)]
+    return _rank("barrier", rank, port, *options, *extra)
+
+
+@pytest.fixture
+def server():
+    port = _free_port()
+    proc = subprocess.Popen(
+        [sys.executable, SCRIPT, "serve", "--host", "127.0.0.1", "--port", str(port)]
+        + ["--dead-after", "2", "--start-grace", "3", "--run-id", RUN_ID],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = time.time() + 10
+    while True:
+        try:
+            _request("127.0.0.1", port, {"op": "ping"}, timeout=1.0)
+            break
+        except OSError:
+            if time.time() > deadline:
+                proc.kill()
+                raise
+            time.sleep(0.1)
+    yield port
+    proc.kill()
+    proc.wait()
+
+
+def test_barrier_releases_every_rank(server):
+    ranks = []
+    for rank in range(3):
+        ranks.append(_barrier(rank, server, 3))
+        time.sleep(0.5)
+    for proc in ranks:
+        _, err = proc.communicate(timeout=30)
+        assert proc.returncode == 0, err
+
+
+def test_barrier_aborts_when_a_rank_stops_heartbeating(server):
+    # rank 1 到过另一个屏障（留下心跳）后退出，再也没有心跳
+    early = _rank("arrive", 1, server, "--run-id", RUN_ID, "--name", "warmup")
+    early.communicate(timeout=30)
+    assert early.returncode == 0
+    start = time.time()
+    waiting = _barrier(0, server, 2)
+    _, err = waiting.communicate(timeout=60)
+    assert waiting.returncode == 1
+    assert "Rank(s) [1] stopped heart-beating" in err
+    assert time.time() - start < 20
+
+
+def test_barrier_aborts_when_a_rank_never_starts(server):
+    start = time.time()
+    waiting = _barrier(0, server, 2)
+    _, err = waiting.communicate(timeout=60)
+    assert waiting.returncode == 1
+    assert "Rank(s) [1] stopped heart-beating" in err
+    assert 3 <= time.time() - start < 20
+
+
+def test_marker_files_release_without_a_server(tmp_path):
+    port = _free_port()
+    files = ("--file-dir", str(tmp_path), "--connect-timeout", "0.5")
+    ranks = [_barrier(rank, port, 2, *files, run_id="file-run") for rank in range(2)]
+    for proc in ranks:
+        _, err = proc.communicate(timeout=40)
+        assert proc.returncode == 0, err
+    # 旧运行的标记不会放行新运行
+    stale = _barrier(0, port, 2, *files, run_id="other-run", timeout=3)
+    _, err = stale.communicate(timeout=30)
+    assert stale.returncode == 1
+    assert "Timed out" in err
+
+
+def test_stream_end_waits_on_a_rank_without_heartbeat(tmp_path):
+    port = _free_port()
+    options = dict(run_id="stream-run", addr="127.0.0.1", port=port, file_dir=str(tmp_path), connect_timeout=0.5)
+    watcher = rendezvous.Rendezvous(1, start_grace=0.1, **options)
+    follower = rendezvous.Rendezvous(1, start_grace=0.1, dead_after=None, **options)
+    assert not watcher.released("stream_end", 1)
+    assert not follower.released("stream_end", 1)
+    time.sleep(0.3)
+    with pytest.raises(rendezvous.RendezvousError, match="stopped heart-beating"):
+        watcher.released("stream_end", 1)
+    # 单机流水线的推理端没有心跳，跟随评测只等结束标记
+    assert not follower.released("stream_end", 1)
+    rendezvous.Rendezvous(0, **options).arrive("stream_end")
+    assert follower.released("stream_end", 1)
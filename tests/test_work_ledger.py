@@ -0,0 +1,78 @@
+import json
+import os
+import time
+
+import pytest
+
+from work_ledger import WorkLedger, status
+
+KEYS = [f"style/scene/cat/inst{i}" for i in range(4)]
+LEASE_TIMEOUT = 1.0
+
+
+def _ledger(path, node_rank, **kwargs):
+    kwargs.setdefault("lease_timeout", LEASE_TIMEOUT)
+    return WorkLedger(str(path), KEYS, block_size=2, node_rank=node_rank, num_nodes=2, **kwargs)
+
+
+def _record(path, sub, block):
+    with open(os.path.join(path, sub, f"{block:07d}"), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_live_lease_is_not_stolen(tmp_path):
+    first = _ledger(tmp_path, 0).start()
+    second = _ledger(tmp_path, 1).start()
+    try:
+        assert [block for block, _ in first.claim(1)] == [0]
+        assert second.claim(2) == [(1, KEYS[2:])]
+        time.sleep(LEASE_TIMEOUT * 1.5)
+        # 心跳仍在，租约过了 lease_timeout 也不能被抢
+        assert first.claim(1) == []
+        assert second.stats["stolen"] == 0 and first.stats["stolen"] == 0
+    finally:
+        first.close()
+        second.close()
+
+
+@pytest.mark.parametrize("heartbeat", [False, True], ids=["never-beat", "stopped-beating"])
+def test_expired_lease_is_stolen(tmp_path, heartbeat):
+    dead = _ledger(tmp_path, 1)
+    if heartbeat:
+        dead.start()
+    assert dead.claim(1) == [(1, KEYS[2:])]
+    dead.close()
+
+    live = _ledger(tmp_path, 0).start()
+    try:
+        assert live.claim(2) == [(0, KEYS[:2])]
+        time.sleep(LEASE_TIMEOUT * 1.5)
+        assert live.claim(1) == [(1, KEYS[2:])]
+        assert live.stats["stolen"] == 1
+        assert _record(tmp_path, "leases", 1)["holder"] == live.holder
+        assert not [name for name in os.listdir(os.path.join(tmp_path, "leases")) if ".stale." in name]
+        live.complete(0)
+        live.complete(1)
+        assert live.all_done()
+        assert status(str(tmp_path), LEASE_TIMEOUT)["done"] == 2
+    finally:
+        live.close()
+
+
+def test_failed_block_is_retried_then_given_up(tmp_path):
+    ledger = WorkLedger(str(tmp_path), KEYS[:2], block_size=2, lease_timeout=LEASE_TIMEOUT, retries=1)
+    assert ledger.claim(1) == [(0, KEYS[:2])]
+    ledger.complete(0, ok=False)
+    assert not ledger.all_done()
+    assert ledger.claim(1) == [(0, KEYS[:2])]
+    assert ledger.stats["retried"] == 1
+    ledger.complete(0, ok=False)
+    assert ledger.all_done()
+    assert ledger.claim(1) == []
+    assert _record(tmp_path, "done", 0)["ok"] is False
+
+
+def test_different_instance_list_is_rejected(tmp_path):
+    _ledger(tmp_path, 0)
+    with pytest.raises(RuntimeError, match="different instance list"):
+        WorkLedger(str(tmp_path), KEYS[:3], block_size=2)
@@ -0,0 +1,397 @@
+import argparse
+import importlib
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+
+
+class BatchedMetric:
+    """Adapter for a metric whose model can run on items gathered from many instances.
+
+    ``inputs(instance_dir, config)`` returns ``(items, context)``: a list of
+    arrays (typically frames) fed to the model one per row, and whatever
+    ``reduce`` needs. ``forward(batch)`` maps a stacked ``(n, ...)`` array to
+    ``n`` per-item outputs and must treat rows independently, so gathering
+    rows from several instances cannot change any result. ``reduce(outputs,
+    context)`` turns one instance's outputs into its ``evaluation.json`` entry.
+    ``bytes_per_item`` scales the memory-based batch bound.
+    """
+
+    aspect = ""
+    metric = ""
+    bytes_per_item = 0
+
+    def inputs(self, instance_dir, config):
+        raise NotImplementedError
+
+    def forward(self, batch):
+        raise NotImplementedError
+
+    def reduce(self, outputs, context):
+        raise NotImplementedError
+
+
+def _is_oom(exc):
+    return type(exc).__name__ == "OutOfMemoryError" or "out of memory" in str(exc).lower()
+
+
+def _free_device_bytes(device):
+    if device != "cuda":
+        return None
+    try:
+        import torch
+    except ImportError:
+        return None
+    if not torch.cuda.is_available():
+        return None
+    torch.cuda.empty_cache()
+    return torch.cuda.mem_get_info()[0]
+
+
+def load_adapters(specs, device, models=None):
+    """Build adapters from ``"module:factory"`` specs; ``factory(device, models)`` returns a ``BatchedMetric``.
+
+    ``models`` is the worker's dict of loaded models, shared with the metrics ``process_batch`` builds.
+    """
+    models = {} if models is None else models
+    adapters = []
+    for spec in specs:
+        module_name, _, attr = spec.partition(":")
+        factory = getattr(importlib.import_module(module_name), attr)
+        adapter = factory(device, models)
+        if not adapter.aspect or not adapter.metric:
+            raise ValueError(f"Batched metric {spec!r} must set aspect and metric")
+        adapters.append(adapter)
+    return adapters
+
+
+class BatchEngine:
+    """Evaluates batched metrics for a whole chunk of instances at once.
+
+    Items of every instance are grouped by shape and run through ``forward``
+    in batches of up to ``batch_size`` rows; outputs are scattered back per
+    instance before ``reduce``. The batch size starts at the smaller of
+    ``batch_size`` and what fits in ``memory_fraction`` of free device memory,
+    halves on out-of-memory and doubles back after ``grow_after`` clean
+    batches.
+    """
+
+    def __init__(self, adapters, batch_size=64, device="cpu", memory_fraction=0.5, grow_after=8):
+        self.adapters = {(a.aspect, a.metric): a for a in adapters}
+        self.max_batch_size = max(int(batch_size), 1)
+        self.device = device
+        self.memory_fraction = memory_fraction
+        self.grow_after = grow_after
+        self.batch_sizes = {}
+        self.stats = {"items": 0, "batches": 0, "oom_splits": 0}
+
+    def handles(self, cell):
+        return tuple(cell) in self.adapters
+
+    def _initial_batch_size(self, cell, item):
+        if cell in self.batch_sizes:
+            return self.batch_sizes[cell]
+        size = self.max_batch_size
+        free = _free_device_bytes(self.device)
+        per_item = self.adapters[cell].bytes_per_item or item.nbytes
+        if free is not None and per_item:
+            size = max(1, min(size, int(free * self.memory_fraction // per_item)))
+        self.batch_sizes[cell] = size
+        return size
+
+    def _run_group(self, cell, rows):
+        adapter = self.adapters[cell]
+        batch_size = self._initial_batch_size(cell, rows[0])
+        outputs = []
+        clean = 0
+        start = 0
+        while start < len(rows):
+            stop = min(start + batch_size, len(rows))
+            try:
+                result = adapter.forward(np.stack(rows[start:stop]))
+            except Exception as e:
+                if not _is_oom(e) or batch_size == 1:
+                    raise
+                # 显存不足：释放缓存后把批大小减半重试同一段
+                _free_device_bytes(self.device)
+                batch_size = max(batch_size // 2, 1)
+                self.stats["oom_splits"] += 1
+                clean = 0
+                continue
+            outputs.extend(result[i] for i in range(stop - start))
+            self.stats["batches"] += 1
+            start = stop
+            clean += 1
+            if clean >= self.grow_after and batch_size < self.max_batch_size:
+                batch_size = min(batch_size * 2, self.max_batch_size)
+                clean = 0
+        self.batch_sizes[cell] = batch_size
+        return outputs
+
+    def evaluate(self, jobs, config):
+        """``jobs`` is ``[(instance_dir, cells)]``; returns ``{instance_dir: {(aspect, metric): score}}``."""
+        results = {}
+        for cell in self.adapters:
+            wanted = [instance_dir for instance_dir, cells in jobs if cell in {tuple(c) for c in cells}]
+            if not wanted:
+                continue
+            adapter = self.adapters[cell]
+            contexts = {}
+            groups = {}
+            for instance_dir in wanted:
+                items, contexts[instance_dir] = adapter.inputs(instance_dir, config)
+                for index, item in enumerate(items):
+                    item = np.asarray(item)
+                    groups.setdefault((item.shape, item.dtype.str), []).append((instance_dir, index, item))
+            per_instance = {instance_dir: {} for instance_dir in wanted}
+            for members in groups.values():
+                outputs = self._run_group(cell, [item for _, _, item in members])
+                for (instance_dir, index, _), output in zip(members, outputs):
+                    per_instance[instance_dir][index] = output
+                self.stats["items"] += len(members)
+            for instance_dir in wanted:
+                ordered = [per_instance[instance_dir][i] for i in sorted(per_instance[instance_dir])]
+                results.setdefault(instance_dir, {})[cell] = adapter.reduce(ordered, contexts[instance_dir])
+        return results
+
+    def reset_stats(self):
+        stats, self.stats = self.stats, {key: 0 for key in self.stats}
+        return stats
+
+
+class ToyFrameScore(BatchedMetric):
+    """Small CLIP-like scorer (pooled frames, fixed projection, cosine to a fixed target) for CPU checks."""
+
+    aspect = "toy"
+    metric = "toy_frame_score"
+
+    def __init__(self, device="cpu", seed=0, dim=32):
+        rng = np.random.default_rng(seed)
+        self.projection = rng.standard_normal((8 * 8 * 3, dim)).astype(np.float32)
+        self.target = rng.standard_normal(dim).astype(np.float32)
+        self.target /= np.linalg.norm(self.target)
+        self.frames = {}
+
+    def inputs(self, instance_dir, config):
+        frames = self.frames[instance_dir]
+        return list(frames), {"frames": len(frames)}
+
+    def forward(self, batch):
+        n, h, w, c = batch.shape
+        pooled = batch.astype(np.float32).reshape(n, 8, h // 8, 8, w // 8, c).mean(axis=(2, 4)).reshape(n, -1)
+        embedding = pooled @ self.projection
+        embedding /= np.linalg.norm(embedding, axis=1, keepdims=True)
+        return embedding @ self.target
+
+    def reduce(self, outputs, context):
+        score = float(np.mean(outputs))
+        return {"score": score, "score_normalized": (score + 1) / 2}
+
+
+def worldscore_normalization(aspect, metric):
+    """``(low, high, higher_is_better)`` that WorldScore's ``aspect_info`` declares for ``metric``.
+
+    Raises ``ValueError`` when the entry carries no empirical range, so an
+    adapter never falls back to a guessed one.
+    """
+    import evaluate_filtered as ef
+
+    ef._load_worldscore()
+    entry = ef.aspect_info.get(aspect, {}).get("metrics", {}).get(metric)
+    if not isinstance(entry, dict) or "empirical_min" not in entry or "empirical_max" not in entry:
+        raise ValueError(f"WorldScore's aspect_info has no empirical range for {aspect}/{metric}: {entry!r}")
+    return float(entry["empirical_min"]), float(entry["empirical_max"]), bool(entry.get("higher_is_better", True))
+
+
+class PyiqaFrameScore(BatchedMetric):
+    """Per-frame no-reference quality from a pyiqa model, averaged over the video (``subjective_quality``).
+
+    Frames of ``videos/output.mp4`` are resized to the WorldScore config's
+    ``resolution`` and scored independently by the model WorldScore loads
+    through ``pyiqa.create_metric``; the instance score is their mean, mapped
+    to ``score_normalized`` with the range and direction from
+    ``worldscore_normalization`` unless ``normalization`` is given. Check it
+    against ``process_batch`` with ``--config-json`` before registering it.
+    """
+
+    aspect = "subjective_quality"
+
+    def __init__(self, device, models, metric, normalization=None):
+        import pyiqa
+        import torch
+
+        self.metric = metric
+        self.low, self.high, self.higher_is_better = normalization or worldscore_normalization(self.aspect, metric)
+        self.device = torch.device(device)
+        key = f"batch_metrics.pyiqa:{metric}:{device}"
+        if key not in models:
+            models[key] = pyiqa.create_metric(metric, device=self.device)
+        self.model = models[key]
+
+    def inputs(self, instance_dir, config):
+        import cv2
+
+        resolution = config.get("resolution")
+        capture = cv2.VideoCapture(str(Path(instance_dir) / "videos" / "output.mp4"))
+        frames = []
+        try:
+            while True:
+                ok, frame = capture.read()
+                if not ok:
+                    break
+                if resolution:
+                    # 与 WorldScore 读帧后送入指标的尺寸一致（resolution 为 [高, 宽]）
+                    frame = cv2.resize(frame, (int(resolution[1]), int(resolution[0])), interpolation=cv2.INTER_AREA)
+                frames.append(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+        finally:
+            capture.release()
+        if not frames:
+            raise RuntimeError(f"No frames decoded from {instance_dir}/videos/output.mp4")
+        return frames, {"frames": len(frames)}
+
+    def forward(self, batch):
+        import torch
+
+        with torch.no_grad():
+            x = torch.from_numpy(batch).to(self.device).permute(0, 3, 1, 2).float().div_(255)
+            return self.model(x).reshape(len(batch)).float().cpu().numpy()
+
+    def reduce(self, outputs, context):
+        score = float(np.mean(outputs))
+        normalized = min(max((score - self.low) / (self.high - self.low), 0.0), 1.0)
+        if not self.higher_is_better:
+            normalized = 1.0 - normalized
+        return {"score": score, "score_normalized": normalized}
+
+
+def musiq_batched(device, models):
+    return PyiqaFrameScore(device, models, "musiq")
+
+
+def clip_iqa_batched(device, models):
+    return PyiqaFrameScore(device, models, "clip_iqa+")
+
+
+def process_batch_reference(instances, visual_movement, cells, config):
+    """Scores WorldScore's ``process_batch`` writes for ``cells``; returns ``{instance_dir: {cell: score}}``.
+
+    Each instance's ``evaluation.json`` is moved aside for the call and put back afterwards.
+    """
+    import evaluate_filtered as ef
+
+    ef._load_worldscore()
+    base_aspect_info = {
+        aspect: {"type": info["type"], "metrics": dict(info["metrics"])} for aspect, info in ef.aspect_info.items()
+    }
+    unknown = [cell for cell in cells if cell[1] not in base_aspect_info.get(cell[0], {}).get("metrics", {})]
+    if unknown:
+        raise ValueError(f"Batched metrics {unknown} are not WorldScore metrics")
+    config = dict(config, visual_movement=visual_movement)
+    reference = {}
+    for instance in instances:
+        path = Path(instance[-1]) / ef.EVALUATION_FILENAME
+        saved = path.read_bytes() if path.exists() else None
+        try:
+            if saved is not None:
+                path.unlink()
+            ef._process_cells({"aspect_info": base_aspect_info}, config, instance, visual_movement, cells)
+            evaluation = ef.read_evaluation(instance[-1])
+        finally:
+            if saved is not None:
+                path.write_bytes(saved)
+            elif path.exists():
+                path.unlink()
+        reference[str(instance[-1])] = {cell: evaluation.get(cell[0], {}).get(cell[1]) for cell in cells}
+    return reference
+
+
+def _max_diff(expected, actual):
+    worst = 0.0
+    for instance_dir, cells in expected.items():
+        for cell, score in cells.items():
+            other = actual.get(instance_dir, {}).get(cell)
+            if not score or not other:
+                # 参考路径或批量路径没有给出分数
+                return float("inf")
+            for field, value in score.items():
+                if isinstance(value, (int, float)) and isinstance(other.get(field), (int, float)):
+                    worst = max(worst, abs(value - other[field]))
+                elif value != other.get(field):
+                    return float("inf")
+    return worst
+
+
+def verify(adapters, jobs, config, batch_size, atol, reference=None):
+    """Compare batched scores for ``jobs`` against the unbatched path; returns ``(ok, largest difference)``.
+
+    ``reference`` is ``{instance_dir: {cell: score}}`` from ``process_batch_reference``; without it the
+    adapters are run one instance at a time with batch size 1, which only checks that batching is row-independent.
+    """
+    batched_engine = BatchEngine(adapters, batch_size=batch_size)
+    start = time.perf_counter()
+    batched = batched_engine.evaluate(jobs, config)
+    batched_s = time.perf_counter() - start
+    if reference is None:
+        single_engine = BatchEngine(adapters, batch_size=1)
+        reference = {}
+        for job in jobs:
+            reference.update(single_engine.evaluate([job], config))
+        label = f"unbatched: {single_engine.stats['batches']} batches"
+    else:
+        label = "process_batch reference"
+    worst = _max_diff(reference, batched)
+    print(f"batched: {batched_s:.3f}s in {batched_engine.stats['batches']} batches; {label}; max |diff| = {worst:.3g}")
+    return worst <= atol, worst
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Check batched metric adapters against WorldScore's process_batch")
+    parser.add_argument("--adapter", action="append", default=[], help="module:factory; default is the CPU toy scorer")
+    parser.add_argument("--config-json", help="Resolved config JSON; real adapters are checked against process_batch")
+    parser.add_argument("--visual-movement", default="static")
+    parser.add_argument("--limit", type=int, default=4, help="Instances of the run to check")
+    parser.add_argument("--device", default="cuda")
+    parser.add_argument("--synthetic", type=int, default=16, help="Synthetic instances for the toy scorer")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--atol", type=float, default=1e-4)
+    args = parser.parse_args()
+
+    reference = None
+    if args.adapter:
+        if not args.config_json:
+            parser.error("--adapter needs --config-json to compare against process_batch")
+        import evaluate_filtered as ef
+        from case_filter import CaseFilter
+
+        with open(args.config_json, "r", encoding="utf-8") as f:
+            config = ef._build_config(json.load(f))
+        ef._load_worldscore()
+        adapters = load_adapters(args.adapter, args.device)
+        cells = sorted({(a.aspect, a.metric) for a in adapters})
+        evaluator = ef.Evaluator(dict(config, visual_movement=args.visual_movement))
+        instances = ef._collect_instances(evaluator.root_path, args.visual_movement, CaseFilter({}), evaluator)
+        instances = instances[: args.limit]
+        if not instances:
+            raise SystemExit(f"No generated {args.visual_movement} instances under {evaluator.root_path}")
+        reference = process_batch_reference(instances, args.visual_movement, cells, config)
+        jobs = [(str(instance[-1]), cells) for instance in instances]
+    else:
+        config = {}
+        toy = ToyFrameScore()
+        rng = np.random.default_rng(1)
+        for i in range(args.synthetic):
+            # 帧数不同、分辨率两种，覆盖跨实例拼批和按形状分组
+            size = 64 if i % 3 else 32
+            toy.frames[f"instance_{i}"] = rng.integers(0, 256, (8 + i % 5, size, size, 3), dtype=np.uint8)
+        adapters = [toy]
+        jobs = [(d, [(toy.aspect, toy.metric)]) for d in toy.frames]
+    ok, worst = verify(adapters, jobs, config, args.batch_size, args.atol, reference)
+    if not ok:
+        raise SystemExit(f"Batched scores differ from the reference by {worst:.3g} (> {args.atol})")
+    print("Batched scores match the reference.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,364 @@
+import argparse
+import gc
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+STYLES = ["photorealistic", "anime", "oil_painting", "pixel_art", "watercolor"]
+SCENE_TYPES = ["indoor", "outdoor"]
+CATEGORIES = [f"category_{i:02d}" for i in range(10)]
+MOTION_TYPES = ["walk", "drive", "fly", "pan"]
+CAMERA_PATHS = ["push_in", "pull_out", "orbit_left", "orbit_right", "pan_left", "pan_right"]
+METRICS = {
+    "camera_control": ["camera_error"],
+    "object_control": ["object_detection"],
+    "content_alignment": ["clip_score"],
+    "3d_consistency": ["reprojection_error"],
+    "photometric_consistency": ["optical_flow_aepe"],
+    "style_consistency": ["gram_matrix"],
+    "subjective_quality": ["clip_iqa+", "musiq"],
+    "motion_accuracy": ["motion_accuracy"],
+    "motion_magnitude": ["optical_flow"],
+    "motion_smoothness": ["motion_smoothness"],
+}
+FILTERS = {
+    "enable": True,
+    "visual_style": ["photo*", "anime"],
+    "scene_type": [],
+    "category": ["re:category_0[0-4]"],
+    "camera_path_any": ["orbit_*"],
+}
+NUM_SHARDS = 8
+# 报告阶段的 bootstrap 次数，耗时与实例数 x 次数成正比
+REPORT_RESAMPLES = 1000
+
+
+def _import_startup():
+    # 新进程里导入 evaluate_filtered，输出是被连带导入的重依赖；模块级新增重导入会同时改变耗时和输出
+    code = (
+        "import sys, evaluate_filtered; "
+        "print(','.join(m for m in ('torch', 'omegaconf', 'worldscore') if m in sys.modules) or 'none')"
+    )
+    proc = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return proc.stdout.strip()
+
+
+class StubEvaluator:
+    """Stand-in for WorldScore's Evaluator: same root layout and ``data_exists`` check."""
+
+    def __init__(self, config):
+        self.root_path = Path(config["runs_root"]) / config["output_dir"] / config["visual_movement"]
+
+    def data_exists(self, instance_dir):
+        return os.path.exists(os.path.join(instance_dir, "videos", "output.mp4"))
+
+    def build_full_aspect_list(self):
+        return list(METRICS)
+
+
+def _catalogue(num_instances, seed=0):
+    rng = random.Random(seed)
+    items = []
+    for i in range(num_instances):
+        item = {
+            "visual_movement": "static" if i % 2 == 0 else "dynamic",
+            "visual_style": rng.choice(STYLES),
+            "image": f"data/images/{i // 1000:04d}/img_{i:07d}.png",
+            "camera_path": rng.sample(CAMERA_PATHS, 2),
+            "prompt": f"synthetic prompt {i}",
+        }
+        if item["visual_movement"] == "static":
+            item["scene_type"] = rng.choice(SCENE_TYPES)
+            item["category"] = rng.choice(CATEGORIES)
+        else:
+            item["motion_type"] = rng.choice(MOTION_TYPES)
+        items.append(item)
+    return items
+
+
+def _instance_parts(item):
+    instance = os.path.splitext(os.path.basename(item["image"]))[0]
+    if item["visual_movement"] == "static":
+        return [item["visual_style"], item["scene_type"], item["category"], instance]
+    return [item["visual_style"], item["motion_type"], instance]
+
+
+def generate(work_dir, num_instances):
+    """Create (or reuse) the tree and catalogues for ``num_instances``; returns their paths."""
+    base = Path(work_dir) / f"n{num_instances}"
+    runs_root = base / "runs"
+    marker = base / "generated.json"
+    paths = {
+        "runs_root": str(runs_root),
+        "catalogue": str(base / "sampled.json"),
+        "catalogue_jsonl": str(base / "sampled.jsonl"),
+        "index_dir": str(base / "case_index"),
+    }
+    if marker.exists():
+        return paths
+
+    rng = random.Random(1)
+    items = _catalogue(num_instances)
+    base.mkdir(parents=True, exist_ok=True)
+    with open(paths["catalogue"], "w", encoding="utf-8") as f:
+        json.dump(items, f, indent=2)
+    with open(paths["catalogue_jsonl"], "w", encoding="utf-8") as f:
+        for item in items:
+            f.write(json.dumps(item) + "\n")
+    for i, item in enumerate(items):
+        instance_dir = runs_root / "out" / item["visual_movement"] / Path(*_instance_parts(item))
+        (instance_dir / "videos").mkdir(parents=True, exist_ok=True)
+        (instance_dir / "videos" / "output.mp4").touch()
+        # 约 5% 的样本没有评测结果，模拟评测未完成
+        if i % 20 == 7:
+            continue
+        evaluation = {
+            aspect: {metric: {"score_normalized": round(rng.random(), 4)} for metric in metrics}
+            for aspect, metrics in METRICS.items()
+        }
+        with open(instance_dir / "evaluation.json", "w", encoding="utf-8") as f:
+            json.dump(evaluation, f)
+    with open(marker, "w", encoding="utf-8") as f:
+        json.dump({"instances": num_instances}, f)
+    return paths
+
+
+def _stages(paths):
+    import evaluate_filtered as ef
+    from completion import seal_manifest
+    from case_filter import CaseFilter, CaseIndex, iter_cases
+    from partial_aggregate import build_partial, merge_partials, write_partial
+    from result_store import load_scores, mean_scores
+
+    case_filter = CaseFilter(FILTERS)
+    no_filter = CaseFilter({})
+    state = {}
+
+    def discover():
+        state["instances"] = {}
+        for visual_movement in ("static", "dynamic"):
+            config = {"runs_root": paths["runs_root"], "output_dir": "out", "visual_movement": visual_movement}
+            evaluator = StubEvaluator(config)
+            state["instances"][visual_movement] = ef._collect_instances(
+                evaluator.root_path, visual_movement, no_filter, evaluator, use_manifest=False
+            )
+        return sum(len(v) for v in state["instances"].values())
+
+    def discover_filtered():
+        total = 0
+        for visual_movement in ("static", "dynamic"):
+            config = {"runs_root": paths["runs_root"], "output_dir": "out", "visual_movement": visual_movement}
+            evaluator = StubEvaluator(config)
+            total += len(
+                ef._collect_instances(evaluator.root_path, visual_movement, case_filter, evaluator, use_manifest=False)
+            )
+        return total
+
+    def manifest_seal():
+        summary = seal_manifest(paths["catalogue"], os.path.join(paths["runs_root"], "out"))
+        return sum(indexed for indexed, _ in summary.values())
+
+    def discover_manifest():
+        total = 0
+        for visual_movement in ("static", "dynamic"):
+            root_path = Path(paths["runs_root"]) / "out" / visual_movement
+            instances = ef._collect_instances(root_path, visual_movement, no_filter, None)
+            # 清单与遍历目录得到的工作集（含顺序）必须一致，否则分片会错位
+            walked = ["/".join(inst[:-1]) for inst in state["instances"][visual_movement]]
+            if ["/".join(inst[:-1]) for inst in instances] != walked:
+                raise RuntimeError(f"Manifest discovery differs from the tree walk for {visual_movement}")
+            total += len(instances)
+        return total
+
+    def filter_scan():
+        return sum(1 for item in iter_cases(paths["catalogue"]) if case_filter(item))
+
+    def filter_scan_jsonl():
+        return sum(1 for item in iter_cases(paths["catalogue_jsonl"]) if case_filter(item))
+
+    def filter_index_build():
+        if os.path.exists(paths["index_dir"]):
+            shutil.rmtree(paths["index_dir"])
+        return CaseIndex.open(paths["catalogue"], paths["index_dir"]).count
+
+    def filter_index_query():
+        return sum(1 for _ in CaseIndex.open(paths["catalogue"], paths["index_dir"]).query(case_filter))
+
+    def shard_modulo():
+        counts = [0] * NUM_SHARDS
+        for instances in state["instances"].values():
+            for shard_index in range(NUM_SHARDS):
+                counts[shard_index] += len([inst for idx, inst in enumerate(instances) if idx % NUM_SHARDS == shard_index])
+        return max(counts)
+
+    def shard_hash():
+        counts = [0] * NUM_SHARDS
+        for instances in state["instances"].values():
+            for inst in instances:
+                counts[ef._stream_shard(inst, NUM_SHARDS)] += 1
+        return max(counts)
+
+    def store_rebuild():
+        for visual_movement in ("static", "dynamic"):
+            ef._rebuild_store(Path(paths["runs_root"]) / "out" / visual_movement)
+        return 2
+
+    def store_mean():
+        scores = {}
+        rows = 0
+        for visual_movement in ("static", "dynamic"):
+            keys, columns, matrix = load_scores(Path(paths["runs_root"]) / "out" / visual_movement)
+            scores[visual_movement] = mean_scores(columns, matrix, list(METRICS))
+            rows += len(keys)
+        state["store_scores"] = scores
+        return rows
+
+    def store_report():
+        from report import build_report
+
+        rows = 0
+        for visual_movement in ("static", "dynamic"):
+            keys, columns, matrix = load_scores(Path(paths["runs_root"]) / "out" / visual_movement)
+            report = build_report(keys, columns, matrix, visual_movement, list(METRICS), resamples=REPORT_RESAMPLES)
+            rows += len(report["rows"])
+        return rows
+
+    def partial_merge():
+        from result_cache import read_evaluation
+
+        partial_dir = os.path.join(paths["runs_root"], "partials")
+        scores = {}
+        for visual_movement, instances in state["instances"].items():
+            for shard_index in range(NUM_SHARDS):
+                shard = [inst for idx, inst in enumerate(instances) if idx % NUM_SHARDS == shard_index]
+                evaluations = {"/".join(inst[:-1]): read_evaluation(inst[-1]) for inst in shard}
+                evaluations = {k: v for k, v in evaluations.items() if v}
+                partial = build_partial(
+                    evaluations, list(evaluations), visual_movement, shard_index, NUM_SHARDS, list(METRICS), ""
+                )
+                write_partial(partial_dir, partial)
+            scores[visual_movement], _ = merge_partials(partial_dir, visual_movement, NUM_SHARDS)
+        state["partial_scores"] = scores
+        return sum(len(v) for v in state["instances"].values())
+
+    stages = [
+        ("startup_import", _import_startup),
+        ("discover", discover),
+        ("discover_filtered", discover_filtered),
+        ("manifest_seal", manifest_seal),
+        ("discover_manifest", discover_manifest),
+        ("filter_scan_json", filter_scan),
+        ("filter_scan_jsonl", filter_scan_jsonl),
+        ("filter_index_build", filter_index_build),
+        ("filter_index_query", filter_index_query),
+        ("shard_modulo", shard_modulo),
+        ("shard_hash", shard_hash),
+        ("store_rebuild", store_rebuild),
+        ("store_mean", store_mean),
+        ("store_report", store_report),
+        ("partial_merge", partial_merge),
+    ]
+    return stages, state
+
+
+def _measure(fn, memory):
+    gc.collect()
+    start = time.perf_counter()
+    output = fn()
+    seconds = time.perf_counter() - start
+    peak_mb = None
+    if memory:
+        # 第二遍只用来测 Python 堆峰值，tracemalloc 自身的开销不计入耗时
+        gc.collect()
+        tracemalloc.start()
+        fn()
+        peak_mb = tracemalloc.get_traced_memory()[1] / (1 << 20)
+        tracemalloc.stop()
+    return {"seconds": round(seconds, 4), "peak_mb": None if peak_mb is None else round(peak_mb, 2), "output": output}
+
+
+def run(work_dir, sizes, memory=True, only=None):
+    results = {}
+    for num_instances in sizes:
+        start = time.perf_counter()
+        paths = generate(work_dir, num_instances)
+        print(f"[n={num_instances}] tree ready in {time.perf_counter() - start:.1f}s ({paths['runs_root']})")
+        stages, state = _stages(paths)
+        results[str(num_instances)] = {}
+        for name, fn in stages:
+            if only and name not in only:
+                continue
+            row = _measure(fn, memory)
+            results[str(num_instances)][name] = row
+            peak = f"{row['peak_mb']:>9.1f}" if row["peak_mb"] is not None else f"{'-':>9}"
+            print(f"[n={num_instances}] {name:<20} {row['seconds']:>9.3f}s {peak} MB  -> {row['output']}")
+        if "store_scores" in state and "partial_scores" in state and state["store_scores"] != state["partial_scores"]:
+            print(f"[n={num_instances}] Warning: store and partial-merge means differ")
+    return results
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    print(f"{'size':>8} {'stage':<20} {'base_s':>9} {'now_s':>9} {'ratio':>7}")
+    for size, stages in results.items():
+        for name, row in stages.items():
+            base = baseline.get(size, {}).get(name)
+            if not base or not base["seconds"]:
+                continue
+            ratio = row["seconds"] / base["seconds"]
+            flag = "  REGRESSION" if ratio > threshold else ""
+            print(f"{size:>8} {name:<20} {base['seconds']:>9.3f} {row['seconds']:>9.3f} {ratio:>7.2f}{flag}")
+            if base.get("output") is not None and base["output"] != row["output"]:
+                print(f"{size:>8} {name:<20} output changed: {base['output']} -> {row['output']}")
+                regressions.append((size, name, "output"))
+            if flag:
+                regressions.append((size, name, ratio))
+    return regressions
+
+
+def main() -> None:
+    # 不需要 GPU 和 WorldScore 代码：Evaluator 用桩实现，只统计发现、过滤、分片、汇总这些 CPU 阶段
+    parser = argparse.ArgumentParser(description="Benchmark discovery/filter/shard/aggregate on synthetic trees")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="Comma-separated instance counts (up to 1000000)")
+    parser.add_argument("--work-dir", default="/tmp/worldscore_bench", help="Generated trees are reused from here")
+    parser.add_argument("--stages", default="", help="Comma-separated subset of stages to run")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the tracemalloc pass")
+    parser.add_argument("--output-json", default="", help="Write this run's results here")
+    parser.add_argument("--save-baseline", default="", help="Store this run as the baseline")
+    parser.add_argument("--baseline", default="", help="Compare against a stored baseline")
+    parser.add_argument("--threshold", type=float, default=1.25, help="Slowdown ratio reported as a regression")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    only = {s.strip() for s in args.stages.split(",") if s.strip()} or None
+    results = run(args.work_dir, sizes, memory=not args.no_memory, only=only)
+
+    for path in (args.output_json, args.save_baseline):
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions and args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+import fnmatch
+import json
+import os
+import re
+import shutil
+from array import array
+
+# 建立倒排索引的字段，列表型字段（camera_path）按每个取值分别建索引
+INDEXED_FIELDS = ("visual_movement", "visual_style", "scene_type", "category", "motion_type", "camera_path")
+
+_GLOB_CHARS = re.compile(r"[*?\[]")
+_READ_BLOCK = 1 << 20
+
+
+def _compile_values(allowed):
+    exact = set()
+    patterns = []
+    for value in allowed:
+        value = str(value)
+        if value.startswith("re:"):
+            patterns.append(re.compile(value[3:]))
+        elif _GLOB_CHARS.search(value):
+            patterns.append(re.compile(fnmatch.translate(value)))
+        else:
+            exact.add(value)
+    return frozenset(exact), tuple(patterns)
+
+
+class ValueMatcher:
+    """Allowlist of exact values, ``fnmatch`` globs and ``re:``-prefixed regexes."""
+
+    def __init__(self, allowed):
+        self.exact, self.patterns = _compile_values(allowed)
+
+    def __call__(self, value):
+        if value is None:
+            return False
+        if value in self.exact:
+            return True
+        return any(p.fullmatch(str(value)) for p in self.patterns)
+
+
+def compile_matcher(allowed):
+    """Return a predicate for ``allowed``, or ``None`` when it accepts everything."""
+    return ValueMatcher(allowed) if allowed else None
+
+
+class CaseFilter:
+    """Compiled form of the ``filters`` config block.
+
+    Shared by ``filter_cases.py`` (catalogue items) and ``evaluate_filtered.py``
+    (directory names), so both apply identical matching rules.
+    """
+
+    def __init__(self, filters):
+        filters = filters or {}
+        self.enabled = bool(filters.get("enable", False))
+        self.fields = {}
+        for name in ("visual_movement", "visual_style", "scene_type", "motion_type", "category", "instance", "image_name"):
+            matcher = compile_matcher(filters.get(name, [])) if self.enabled else None
+            if matcher is not None:
+                self.fields[name] = matcher
+        needles = filters.get("image_contains", []) if self.enabled else []
+        self.contains = re.compile("|".join(re.escape(str(n)) for n in needles)) if needles else None
+        self.camera_path = compile_matcher(filters.get("camera_path_any", [])) if self.enabled else None
+
+    def field_matches(self, name, value):
+        matcher = self.fields.get(name)
+        return matcher is None or matcher(value)
+
+    def field_matcher(self, name):
+        if name == "camera_path":
+            return self.camera_path
+        return self.fields.get(name)
+
+    def __call__(self, item):
+        if not self.enabled:
+            return True
+        fields = self.fields
+        for name in ("visual_movement", "visual_style", "scene_type", "motion_type"):
+            if name in fields and not fields[name](item.get(name)):
+                return False
+
+        image_path = item.get("image", "")
+        image_name = os.path.basename(image_path)
+        if "image_name" in fields and not fields["image_name"](image_name):
+            return False
+        if self.contains is not None and not (image_path and self.contains.search(image_path)):
+            return False
+        if self.camera_path is not None:
+            camera_path = item.get("camera_path", [])
+            if not camera_path or not any(self.camera_path(v) for v in camera_path):
+                return False
+        if "category" in fields and not fields["category"](item.get("category")):
+            return False
+        if "instance" in fields and not fields["instance"](os.path.splitext(image_name)[0]):
+            return False
+        return True
+
+
+def _is_jsonl(path):
+    if path.endswith(".jsonl"):
+        return True
+    with open(path, "r", encoding="utf-8") as f:
+        while True:
+            ch = f.read(1)
+            if not ch or not ch.isspace():
+                return ch != "["
+
+
+def iter_cases(path):
+    """Yield items from a JSON array or JSONL file without loading it whole."""
+    if _is_jsonl(path):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        return
+
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as f:
+        buf = ""
+        pos = 0
+        started = False
+        eof = False
+        while True:
+            # 跳过空白和分隔符
+            while True:
+                while pos < len(buf) and (buf[pos].isspace() or buf[pos] == "," or (not started and buf[pos] == "[")):
+                    if buf[pos] == "[":
+                        started = True
+                    pos += 1
+                if pos < len(buf) or eof:
+                    break
+                buf, pos = f.read(_READ_BLOCK), 0
+                eof = not buf
+            if pos >= len(buf) or buf[pos] == "]":
+                return
+            try:
+                item, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                chunk = f.read(_READ_BLOCK)
+                eof = not chunk
+                buf, pos = buf[pos:] + chunk, 0
+                continue
+            yield item
+            pos = end
+
+
+class CaseWriter:
+    """Stream items to JSON (same layout as ``json.dump(..., indent=2)``) or JSONL."""
+
+    def __init__(self, path):
+        self.path = path
+        self.jsonl = path.endswith(".jsonl")
+        self.count = 0
+        self._f = open(path, "w", encoding="utf-8")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def write(self, item):
+        if self.jsonl:
+            self._f.write(json.dumps(item, ensure_ascii=True) + "\n")
+        else:
+            text = json.dumps(item, indent=2, ensure_ascii=True).replace("\n", "\n  ")
+            self._f.write(("[\n  " if self.count == 0 else ",\n  ") + text)
+        self.count += 1
+
+    def close(self):
+        if self._f.closed:
+            return
+        if not self.jsonl:
+            self._f.write("\n]" if self.count else "[]")
+        self._f.close()
+
+
+def _source_stamp(path):
+    st = os.stat(path)
+    return {"path": os.path.abspath(path), "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def _field_values(item, field):
+    value = item.get(field)
+    if value is None:
+        return ()
+    if isinstance(value, (list, tuple)):
+        return tuple(str(v) for v in value)
+    return (str(value),)
+
+
+def build_index(source_path, index_dir):
+    """Build an inverted index over ``INDEXED_FIELDS`` for ``source_path``.
+
+    ``index_dir`` receives ``cases.jsonl`` (one item per line), ``offsets.bin``
+    (byte offset of every line), ``postings.bin`` (uint32 item ordinals) and a
+    small ``index.json`` header mapping each field value to its postings slice.
+    """
+    os.makedirs(index_dir, exist_ok=True)
+    postings = {field: {} for field in INDEXED_FIELDS}
+    offsets = array("Q")
+    with open(os.path.join(index_dir, "cases.jsonl"), "wb") as out:
+        for ordinal, item in enumerate(iter_cases(source_path)):
+            offsets.append(out.tell())
+            out.write(json.dumps(item, ensure_ascii=True).encode("ascii") + b"\n")
+            for field in INDEXED_FIELDS:
+                for value in _field_values(item, field):
+                    postings[field].setdefault(value, array("I")).append(ordinal)
+
+    header = {"source": _source_stamp(source_path), "count": len(offsets), "fields": {}}
+    with open(os.path.join(index_dir, "postings.bin"), "wb") as f:
+        for field, values in postings.items():
+            header["fields"][field] = {}
+            for value, ordinals in values.items():
+                header["fields"][field][value] = [f.tell() // ordinals.itemsize, len(ordinals)]
+                ordinals.tofile(f)
+    with open(os.path.join(index_dir, "offsets.bin"), "wb") as f:
+        offsets.tofile(f)
+    with open(os.path.join(index_dir, "index.json"), "w", encoding="utf-8") as f:
+        json.dump(header, f, ensure_ascii=True)
+    return header
+
+
+class CaseIndex:
+    def __init__(self, index_dir):
+        self.index_dir = index_dir
+        with open(os.path.join(index_dir, "index.json"), "r", encoding="utf-8") as f:
+            self.header = json.load(f)
+
+    @classmethod
+    def open(cls, source_path, index_dir):
+        """Open the index for ``source_path``, rebuilding it when stale or absent."""
+        if os.path.exists(os.path.join(index_dir, "index.json")):
+            index = cls(index_dir)
+            if index.header.get("source") == _source_stamp(source_path):
+                return index
+        # 多节点可能同时构建：先写到临时目录再原子改名，失败的一方直接使用对方的结果
+        tmp_dir = f"{index_dir}.tmp.{os.getpid()}"
+        build_index(source_path, tmp_dir)
+        if os.path.exists(index_dir):
+            stale_dir = f"{index_dir}.stale.{os.getpid()}"
+            try:
+                os.rename(index_dir, stale_dir)
+                shutil.rmtree(stale_dir, ignore_errors=True)
+            except OSError:
+                pass
+        try:
+            os.rename(tmp_dir, index_dir)
+        except OSError:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        return cls(index_dir)
+
+    @property
+    def count(self):
+        return self.header["count"]
+
+    def _postings(self, f, field, matcher):
+        ordinals = set()
+        for value, (start, length) in self.header["fields"].get(field, {}).items():
+            if matcher(value):
+                f.seek(start * 4)
+                chunk = array("I")
+                chunk.fromfile(f, length)
+                ordinals.update(chunk)
+        return ordinals
+
+    def candidates(self, case_filter):
+        """Item ordinals that can match, from the indexed fields; ``None`` means all."""
+        if not case_filter.enabled:
+            return None
+        result = None
+        with open(os.path.join(self.index_dir, "postings.bin"), "rb") as f:
+            for field in INDEXED_FIELDS:
+                matcher = case_filter.field_matcher(field)
+                if matcher is None:
+                    continue
+                ordinals = self._postings(f, field, matcher)
+                result = ordinals if result is None else result & ordinals
+                if not result:
+                    return []
+        return None if result is None else sorted(result)
+
+    def iter_items(self, ordinals=None):
+        path = os.path.join(self.index_dir, "cases.jsonl")
+        if ordinals is None:
+            yield from iter_cases(path)
+            return
+        offsets = array("Q")
+        with open(os.path.join(self.index_dir, "offsets.bin"), "rb") as f:
+            offsets.fromfile(f, self.count)
+        with open(path, "rb") as f:
+            for ordinal in ordinals:
+                f.seek(offsets[ordinal])
+                yield json.loads(f.readline())
+
+    def query(self, case_filter):
+        for item in self.iter_items(self.candidates(case_filter)):
+            if case_filter(item):
+                yield item
@@ -0,0 +1,213 @@
+import argparse
+import json
+import os
+import time
+from pathlib import Path
+
+from case_filter import iter_cases
+from instance_manifest import append_record, drop_records, instance_record, load_records, locate, write_index
+from result_cache import _content_signature
+
+COMPLETION_FILENAME = "_COMPLETE.json"
+STREAM_END = "infer_stream_end"
+
+
+def mark_complete(instance_dir, **info):
+    """Publish ``instance_dir`` as fully written by atomically dropping a completion record.
+
+    Inference scripts can call this right after saving an instance; the
+    evaluation consumer (``evaluate_filtered.py --follow``) only picks up
+    instances that carry the record.
+    """
+    instance_dir = Path(instance_dir)
+    signature = _content_signature(instance_dir)
+    record = dict(info, time=time.time(), files=signature)
+    path = instance_dir / COMPLETION_FILENAME
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(record, f, ensure_ascii=True)
+    os.replace(tmp_path, path)
+    located = locate(instance_dir)
+    if located is not None:
+        movement_root = located[0]
+        append_record(movement_root, instance_record(movement_root, instance_dir, "complete", signature))
+    return path
+
+
+def is_complete(instance_dir):
+    return os.path.exists(os.path.join(instance_dir, COMPLETION_FILENAME))
+
+
+def resolve_runs_root(cfg):
+    """Directory holding ``<visual_movement>/...`` instance trees, as WorldScore resolves it."""
+    worldscore = cfg.get("worldscore", {})
+    model_name = worldscore.get("model_name", "fantasy_world")
+    base = worldscore.get("runs_root_base") or os.environ.get("MODEL_PATH") or cfg.get("wan", {}).get("base_model_root", "")
+    return os.path.join(base, model_name, worldscore.get("output_dir") or ".")
+
+
+def expected_instance_dir(runs_root, item):
+    instance = os.path.splitext(os.path.basename(item.get("image", "")))[0]
+    visual_movement = item.get("visual_movement")
+    if visual_movement == "static":
+        parts = [item.get("visual_style"), item.get("scene_type"), item.get("category"), instance]
+    else:
+        parts = [item.get("visual_style"), item.get("motion_type"), instance]
+    if not instance or not all(parts):
+        return None
+    return os.path.join(runs_root, visual_movement, *parts)
+
+
+def settled(instance_dir, stable_seconds, since=0.0):
+    if not os.path.isdir(instance_dir):
+        return False
+    signature = _content_signature(Path(instance_dir))
+    # 只有 json 元数据而没有视频/帧时说明推理还没写完
+    if not any(not relpath.endswith(".json") for relpath, _, _ in signature):
+        return False
+    newest = max(mtime_ns for _, _, mtime_ns in signature) / 1e9
+    # since 之前就没再改过的是上一次运行留下的输出，本次推理还会重写
+    return newest >= since and time.time() - newest >= stable_seconds
+
+
+def watch(cases_path, runs_root, stable_seconds, interval, once=False, since=None):
+    """Fallback publisher for inference scripts that never call ``mark_complete``.
+
+    Marks an expected instance complete once its outputs exist and have not
+    been modified for ``stable_seconds``. While watching, outputs last written
+    before the watch started are left from an earlier run and are not
+    published; a ``once`` sweep after inference has exited publishes them too,
+    unless ``since`` (epoch seconds) limits it to outputs written after that.
+    Only directories still pending are re-checked on each sweep.
+    """
+    if since is None:
+        since = 0.0 if once else time.time()
+    pending = set()
+    for item in iter_cases(cases_path):
+        instance_dir = expected_instance_dir(runs_root, item)
+        if instance_dir and not is_complete(instance_dir):
+            pending.add(instance_dir)
+    print(f"Watching {len(pending)} pending instance(s) under {runs_root}", flush=True)
+    while pending:
+        published = [d for d in sorted(pending) if settled(d, stable_seconds, since)]
+        for instance_dir in published:
+            mark_complete(instance_dir, source="watch")
+            pending.discard(instance_dir)
+        if published:
+            print(f"Published {len(published)} instance(s); {len(pending)} pending", flush=True)
+        if once:
+            break
+        time.sleep(interval)
+    return pending
+
+
+def seal_manifest(cases_path, runs_root):
+    """Write the instance manifest of every expected instance once inference has finished.
+
+    Only the expected instance directories are checked, so this costs one
+    listing per generated instance instead of a walk of the whole tree;
+    earlier index entries for instances outside ``cases_path`` are kept.
+    Returns ``{visual_movement: (indexed, complete)}``.
+    """
+    expected = {}
+    for item in iter_cases(cases_path):
+        instance_dir = expected_instance_dir(runs_root, item)
+        if instance_dir:
+            expected.setdefault(item["visual_movement"], set()).add(instance_dir)
+    summary = {}
+    for visual_movement, instance_dirs in expected.items():
+        movement_root = Path(runs_root) / visual_movement
+        # 撤回后未封存的索引仍保留其它用例的条目，封存时一并写回
+        records = load_records(movement_root, unsealed=True) or {}
+        for instance_dir in sorted(instance_dirs):
+            if os.path.isdir(instance_dir):
+                record = instance_record(movement_root, instance_dir)
+                records[record["key"]] = record
+        write_index(movement_root, records.values())
+        complete = sum(1 for r in records.values() if r["status"] == "complete")
+        summary[visual_movement] = (len(records), complete)
+    return summary
+
+
+def reset(cases_path, runs_root, keep_markers=False):
+    """Withdraw what an earlier run published for the cases about to be generated again.
+
+    Removes the completion records of the expected instances, so a
+    ``--follow`` consumer started with this run waits for the new outputs,
+    and drops every instance left without a record from the manifest index
+    (other entries are kept). ``keep_markers`` keeps the records, for a
+    planned run that skips exactly the instances carrying one.
+    Returns ``{visual_movement: (records_removed, manifest_entries_dropped)}``.
+    """
+    expected = {}
+    for item in iter_cases(cases_path):
+        instance_dir = expected_instance_dir(runs_root, item)
+        if instance_dir:
+            expected.setdefault(item["visual_movement"], set()).add(instance_dir)
+    summary = {}
+    for visual_movement, instance_dirs in expected.items():
+        movement_root = Path(runs_root) / visual_movement
+        removed = 0
+        stale = []
+        for instance_dir in sorted(instance_dirs):
+            if not keep_markers:
+                try:
+                    os.remove(os.path.join(instance_dir, COMPLETION_FILENAME))
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+            if not is_complete(instance_dir):
+                stale.append(Path(instance_dir).absolute().relative_to(movement_root.absolute()).as_posix())
+        summary[visual_movement] = (removed, drop_records(movement_root, stale))
+    return summary
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Publish finished inference outputs to the evaluation stream")
+    parser.add_argument("--config-json", required=True, help="Resolved config JSON")
+    parser.add_argument("--cases-json", required=True, help="Cases being generated (filtered or sampled JSON/JSONL)")
+    parser.add_argument("--stable-seconds", type=float, default=60.0)
+    parser.add_argument("--interval", type=float, default=30.0)
+    parser.add_argument(
+        "--once",
+        action="store_true",
+        help="Single sweep; with --stable-seconds 0 after inference has exited it publishes everything written",
+    )
+    parser.add_argument(
+        "--since",
+        type=float,
+        help="Only publish outputs last written after this epoch time (e.g. when inference started)",
+    )
+    parser.add_argument(
+        "--seal-manifest",
+        action="store_true",
+        help="Write the instance manifest (see instance_manifest.py) for the cases and exit",
+    )
+    parser.add_argument(
+        "--reset",
+        action="store_true",
+        help="Before inference: withdraw completion records and manifest entries an earlier run left for the cases",
+    )
+    args = parser.parse_args()
+
+    with open(args.config_json, "r", encoding="utf-8") as f:
+        cfg = json.load(f)
+    if args.reset:
+        # 推理计划只跳过带完成记录的实例，这些记录仍然有效，保留
+        keep_markers = bool(cfg.get("compute", {}).get("infer_plan", False))
+        for visual_movement, (removed, dropped) in reset(args.cases_json, resolve_runs_root(cfg), keep_markers).items():
+            print(f"[{visual_movement}] reset: {removed} completion record(s) removed, {dropped} manifest entries dropped")
+        return
+    if args.seal_manifest:
+        for visual_movement, (indexed, complete) in seal_manifest(args.cases_json, resolve_runs_root(cfg)).items():
+            print(f"[{visual_movement}] manifest: {indexed} instance(s), {complete} with outputs")
+        return
+    pending = watch(
+        args.cases_json, resolve_runs_root(cfg), args.stable_seconds, args.interval, once=args.once, since=args.since
+    )
+    if args.once and pending:
+        print(f"{len(pending)} instance(s) have no outputs yet")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+import json
+import math
+import os
+import random
+from statistics import NormalDist
+
+DEFAULT_CONFIDENCE = 0.95
+DEFAULT_MIN_INSTANCES = 30
+
+
+def _score_value(metric_score):
+    value = metric_score.get("score_normalized") if isinstance(metric_score, dict) else None
+    if value is None:
+        return None
+    if isinstance(value, (list, tuple)):
+        return math.fsum(value) / len(value) if value else None
+    return float(value)
+
+
+def stratum(instance):
+    # static: (visual_style, scene_type)；dynamic: (visual_style, motion_type)
+    return "/".join(instance[:2])
+
+
+def stratified_order(instances, seed=0):
+    """Shuffle within each stratum, then interleave strata in proportion to their size.
+
+    Every prefix of the order is (up to rounding) a proportionally allocated
+    stratified sample, so stopping anywhere keeps the style/scene/motion mix
+    of the full set.
+    """
+    rng = random.Random(seed)
+    strata = {}
+    for instance in instances:
+        strata.setdefault(stratum(instance), []).append(instance)
+    for members in strata.values():
+        rng.shuffle(members)
+    total = len(instances)
+    taken = {name: 0 for name in strata}
+    order = []
+    for position in range(1, total + 1):
+        # 选“应取数 - 已取数”最大的层，同分时按层名，结果只取决于种子
+        name = max(
+            (name for name in strata if taken[name] < len(strata[name])),
+            key=lambda name: (len(strata[name]) * position / total - taken[name], name),
+        )
+        order.append(strata[name][taken[name]])
+        taken[name] += 1
+    return order
+
+
+class SequentialEstimate:
+    """Running per-aspect mean and confidence interval over instances evaluated so far.
+
+    An instance's aspect score is the mean of its metric scores (x100, as in
+    the score files). The interval is the normal approximation with a finite
+    population correction for the ``population`` instances the sample is drawn
+    from, so it shrinks to zero once every instance has been evaluated.
+    """
+
+    def __init__(
+        self, aspect_list, population, halfwidth, confidence=DEFAULT_CONFIDENCE, min_instances=DEFAULT_MIN_INSTANCES
+    ):
+        self.aspect_list = list(aspect_list)
+        self.population = population
+        self.halfwidth = halfwidth
+        self.confidence = confidence
+        self.min_instances = min_instances
+        self.z = NormalDist().inv_cdf(0.5 + confidence / 2)
+        # Welford 累加：[n, mean, m2]
+        self.moments = {aspect: [0, 0.0, 0.0] for aspect in self.aspect_list}
+        self.instances = []
+
+    def add(self, instance_key, evaluation):
+        self.instances.append(instance_key)
+        for aspect in self.aspect_list:
+            values = [_score_value(score) for score in evaluation.get(aspect, {}).values() if score]
+            values = [value for value in values if value is not None]
+            if not values:
+                continue
+            value = math.fsum(values) / len(values) * 100
+            moment = self.moments[aspect]
+            moment[0] += 1
+            delta = value - moment[1]
+            moment[1] += delta / moment[0]
+            moment[2] += delta * (value - moment[1])
+
+    def interval(self, aspect):
+        n, mean, m2 = self.moments[aspect]
+        if n < 2:
+            return {"n": n, "mean": round(mean, 4) if n else None, "halfwidth": None}
+        fpc = max(1 - n / self.population, 0.0) if self.population else 1.0
+        halfwidth = self.z * math.sqrt(m2 / (n - 1) / n * fpc)
+        return {
+            "n": n,
+            "mean": round(mean, 4),
+            "halfwidth": round(halfwidth, 4),
+            "low": round(mean - halfwidth, 4),
+            "high": round(mean + halfwidth, 4),
+        }
+
+    def converged(self):
+        for aspect in self.aspect_list:
+            row = self.interval(aspect)
+            if row["n"] < min(self.min_instances, self.population) or row["halfwidth"] is None:
+                return False
+            if row["halfwidth"] > self.halfwidth:
+                return False
+        return True
+
+    def summary(self, visual_movement, seed, submitted, failed=0):
+        return {
+            "visual_movement": visual_movement,
+            "halfwidth_target": self.halfwidth,
+            "confidence": self.confidence,
+            "min_instances": self.min_instances,
+            "seed": seed,
+            "converged": self.converged(),
+            "instances_used": len(self.instances),
+            "instances_submitted": submitted,
+            "instances_failed": failed,
+            "instances_available": self.population,
+            "fraction_used": round(len(self.instances) / self.population, 4) if self.population else 0.0,
+            "aspects": {aspect: self.interval(aspect) for aspect in self.aspect_list},
+            "instances": sorted(self.instances),
+        }
+
+
+def summary_path(output_path):
+    return os.path.splitext(str(output_path))[0] + "_early_stop.json"
+
+
+def write_summary(summary, output_path):
+    path = summary_path(output_path)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2, ensure_ascii=True)
+    return path
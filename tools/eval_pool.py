@@ -0,0 +1,471 @@
+import os
+import queue as queue_module
+import time
+import traceback
+from collections import defaultdict, deque
+
+import numpy as np
+
+
+def chunk_instances(instances, chunk_size):
+    chunk_size = max(int(chunk_size), 1)
+    return [instances[start_idx : start_idx + chunk_size] for start_idx in range(0, len(instances), chunk_size)]
+
+
+def _bind_device(gpu_id, device):
+    if device != "cuda":
+        # CPU 模式下隐藏所有 GPU，便于在无 CUDA 的机器上验证进程池生命周期
+        os.environ["CUDA_VISIBLE_DEVICES"] = ""
+        return
+    # Bind this worker to a single visible GPU without clobbering os.environ.
+    os.environ["CUDA_VISIBLE_DEVICES"] = str(gpu_id)
+    import torch
+
+    if torch.cuda.is_available():
+        torch.cuda.set_device(0)
+
+
+def _is_oom(exc):
+    return type(exc).__name__ == "OutOfMemoryError" or "out of memory" in str(exc).lower()
+
+
+def _release_device_memory():
+    import gc
+
+    gc.collect()
+    try:
+        import torch
+    except ImportError:
+        return
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
+
+
+def _run_with_backoff(runner, state, payload, oom_retries, oom_backoff):
+    """Run one chunk; on a CUDA OOM free the allocator cache, wait and retry.
+
+    Returns ``(ok, result, oom)``; ``oom`` is True when the chunk still ran out
+    of memory after ``oom_retries`` retries.
+    """
+    attempt = 0
+    while True:
+        try:
+            return True, runner(state, payload), False
+        except Exception as e:
+            if not _is_oom(e):
+                traceback.print_exc()
+                return False, None, False
+            _release_device_memory()
+            if attempt >= oom_retries:
+                print(f"Warning: out of memory after {attempt} retries: {e}")
+                return False, None, True
+            # 同卡其它 worker 的峰值通常是暂时的，等待后重试，而不是直接丢弃这批样本
+            delay = oom_backoff * (2**attempt)
+            print(f"Warning: out of memory ({e}); retrying in {delay:.0f}s")
+            time.sleep(delay)
+            attempt += 1
+
+
+def _pool_worker(
+    worker_id,
+    gpu_id,
+    device,
+    setup,
+    setup_args,
+    runner,
+    hint,
+    lookahead,
+    oom_retries,
+    oom_backoff,
+    task_queue,
+    result_queue,
+):
+    try:
+        _bind_device(gpu_id, device)
+        # 模型只在进程启动时加载一次，之后所有任务（包括不同 visual_movement）复用
+        state = setup(worker_id, device, *setup_args)
+    except Exception:
+        traceback.print_exc()
+        result_queue.put(("exit", worker_id, False))
+        return
+    result_queue.put(("ready", worker_id, True))
+    if isinstance(state, dict):
+        # runner 可通过 state["progress"](event) 在块内逐个实例上报进度
+        state["progress"] = lambda event: result_queue.put(("progress", worker_id, event))
+
+    backlog = deque()
+    stopping = False
+
+    def _claim(task):
+        job_id, chunk_index, payload = task
+        result_queue.put(("claim", worker_id, job_id, chunk_index))
+        if hint is not None:
+            try:
+                hint(state, payload)
+            except Exception:
+                traceback.print_exc()
+        backlog.append(task)
+
+    while True:
+        if not backlog:
+            if stopping:
+                break
+            task = task_queue.get()
+            if task is None:
+                break
+            _claim(task)
+        # 多领取 lookahead 个任务交给 hint 在后台准备输入，当前任务计算时下一个任务的读取同时进行
+        while len(backlog) <= lookahead and not stopping:
+            try:
+                task = task_queue.get_nowait()
+            except queue_module.Empty:
+                break
+            if task is None:
+                stopping = True
+            else:
+                _claim(task)
+        job_id, chunk_index, payload = backlog.popleft()
+        result_queue.put(("start", worker_id, job_id, chunk_index))
+        start = time.perf_counter()
+        ok, result, oom = _run_with_backoff(runner, state, payload, oom_retries, oom_backoff)
+        if oom:
+            # 退出以降低这张卡上的并发：预领取的任务放回队列，父进程重投当前任务
+            for task in backlog:
+                task_queue.put(task)
+            if stopping:
+                task_queue.put(None)
+            result_queue.put(("oom", worker_id, job_id, chunk_index))
+            return
+        elapsed = time.perf_counter() - start
+        result_queue.put(("done", worker_id, job_id, chunk_index, len(payload["instances"]), elapsed, ok, result))
+    result_queue.put(("exit", worker_id, True))
+
+
+def new_worker_stats(gpu_id):
+    return {"gpu_id": gpu_id, "chunks": 0, "instances": 0, "failed": 0, "busy": 0.0, "latencies": []}
+
+
+def record_chunk(stats, num_instances, elapsed, ok):
+    stats["chunks"] += 1
+    stats["instances"] += num_instances
+    stats["busy"] += elapsed
+    if not ok:
+        stats["failed"] += num_instances
+    per_instance = elapsed / max(num_instances, 1)
+    stats["latencies"].extend([per_instance] * num_instances)
+
+
+def print_worker_stats(worker_stats, wall_time, label):
+    print(f"[{label}] evaluation finished in {wall_time:.1f}s")
+    print(f"{'worker':>6} {'gpu':>4} {'inst':>6} {'fail':>5} {'busy_s':>9} {'util':>6} {'inst/s':>8} {'p50_s':>8} {'p95_s':>8} {'max_s':>8}")
+    all_latencies = []
+    for worker_id in sorted(worker_stats):
+        stats = worker_stats[worker_id]
+        latencies = np.array(stats["latencies"]) if stats["latencies"] else np.zeros(1)
+        all_latencies.extend(stats["latencies"])
+        util = stats["busy"] / wall_time if wall_time > 0 else 0.0
+        throughput = stats["instances"] / stats["busy"] if stats["busy"] > 0 else 0.0
+        print(
+            f"{worker_id:>6} {stats['gpu_id']:>4} {stats['instances']:>6} {stats['failed']:>5} "
+            f"{stats['busy']:>9.1f} {util:>6.1%} {throughput:>8.3f} "
+            f"{np.percentile(latencies, 50):>8.1f} {np.percentile(latencies, 95):>8.1f} {latencies.max():>8.1f}"
+        )
+    if all_latencies:
+        latencies = np.array(all_latencies)
+        print(
+            f"[{label}] per-instance latency p50={np.percentile(latencies, 50):.1f}s "
+            f"p95={np.percentile(latencies, 95):.1f}s p99={np.percentile(latencies, 99):.1f}s max={latencies.max():.1f}s"
+        )
+
+
+class EvalPool:
+    """Long-lived evaluation workers that keep imports and metric models resident.
+
+    ``setup(worker_id, device, *setup_args)`` runs once per worker and returns a
+    state object; ``runner(state, payload)`` then evaluates one chunk, where
+    ``payload["instances"]`` is the instance list. Jobs for any visual movement
+    or evaluation round can be submitted through ``run`` until ``close``.
+    With ``num_workers <= 1`` everything runs inline in the calling process.
+    ``hint(state, payload)`` (optional) is called as soon as a worker claims a
+    chunk; each worker claims up to ``lookahead`` chunks beyond the one it runs.
+    A dict state gets ``state["progress"]``, which the runner may call with an
+    event at any point; the parent hands it to ``run``'s ``on_progress``.
+    ``gpu_ids`` lists one GPU per worker when workers are packed by memory
+    (``gpu_packing.plan_workers``), otherwise workers cycle through it. A chunk
+    that runs out of GPU memory is retried in place ``oom_retries`` times with
+    exponential backoff; if it still fails the worker retires, reducing that
+    GPU's concurrency, and the chunk goes back on the queue.
+    """
+
+    def __init__(
+        self,
+        num_workers,
+        setup,
+        runner,
+        setup_args=(),
+        device="cuda",
+        gpu_ids=None,
+        max_retries=1,
+        hint=None,
+        lookahead=0,
+        oom_retries=2,
+        oom_backoff=10.0,
+    ):
+        self.num_workers = max(int(num_workers), 1)
+        self.setup = setup
+        self.runner = runner
+        self.setup_args = tuple(setup_args)
+        self.device = device
+        self.gpu_ids = list(gpu_ids) if gpu_ids else [0]
+        self.max_retries = max_retries
+        self.hint = hint
+        self.lookahead = max(int(lookahead), 0)
+        self.oom_retries = max(int(oom_retries), 0)
+        self.oom_backoff = oom_backoff
+        self.inline = self.num_workers <= 1
+        self._job_id = 0
+        self._started = False
+        self._processes = {}
+        self._inline_state = None
+        self._ctx = None
+        self._task_queue = None
+        self._result_queue = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def gpu_for(self, worker_id):
+        return self.gpu_ids[worker_id % len(self.gpu_ids)]
+
+    def start(self):
+        if self._started:
+            return
+        self._started = True
+        if self.inline:
+            return
+        try:
+            import torch.multiprocessing as mp
+        except ImportError:
+            import multiprocessing as mp
+
+        try:
+            self._ctx = mp.get_context("spawn")
+        except RuntimeError:
+            self._ctx = mp
+        self._task_queue = self._ctx.Queue()
+        self._result_queue = self._ctx.Queue()
+        for worker_id in range(self.num_workers):
+            self._spawn(worker_id)
+
+    def _spawn(self, worker_id):
+        p = self._ctx.Process(
+            target=_pool_worker,
+            args=(
+                worker_id,
+                self.gpu_for(worker_id),
+                self.device,
+                self.setup,
+                self.setup_args,
+                self.runner,
+                self.hint,
+                self.lookahead,
+                self.oom_retries,
+                self.oom_backoff,
+                self._task_queue,
+                self._result_queue,
+            ),
+        )
+        p.start()
+        self._processes[worker_id] = p
+
+    def run(self, payloads, on_result=None, feed=None, poll_interval=5.0, on_progress=None):
+        """Evaluate ``payloads`` and block until every chunk is accounted for.
+
+        Returns per-worker stats; ``on_result(payload, ok, result)`` is called
+        in the parent as each chunk finishes, and with ``(payload, False, None)``
+        when a chunk is dropped after its retries. ``feed()`` (optional) is polled
+        every ``poll_interval`` seconds and returns ``(new_payloads, finished)``;
+        the run keeps going until it reports ``finished`` and everything drained.
+        ``on_progress(worker_id, event)`` receives the runner's progress events.
+        """
+        self.start()
+        self._job_id += 1
+        payloads = list(payloads)
+        if self.inline:
+            return self._run_inline(payloads, on_result, feed, poll_interval, on_progress)
+
+        job_id = self._job_id
+        for chunk_index, payload in enumerate(payloads):
+            self._task_queue.put((job_id, chunk_index, payload))
+
+        worker_stats = {worker_id: new_worker_stats(self.gpu_for(worker_id)) for worker_id in self._processes}
+        pending = set(range(len(payloads)))
+        in_flight = {}
+        claimed = defaultdict(set)
+        retries = defaultdict(int)
+        last_feed = 0.0
+        while pending or feed is not None:
+            if feed is not None and time.time() - last_feed >= poll_interval:
+                last_feed = time.time()
+                new_payloads, finished = feed()
+                for payload in new_payloads:
+                    pending.add(len(payloads))
+                    self._task_queue.put((job_id, len(payloads), payload))
+                    payloads.append(payload)
+                if finished:
+                    feed = None
+                continue
+            try:
+                message = self._result_queue.get(timeout=min(5.0, poll_interval))
+            except queue_module.Empty:
+                dropped = self._reap_dead_workers(job_id, payloads, pending, in_flight, claimed, retries)
+                self._report_dropped(dropped, payloads, worker_stats, on_result)
+                continue
+            kind, worker_id = message[0], message[1]
+            if kind == "progress":
+                if on_progress is not None:
+                    on_progress(worker_id, message[2])
+            elif kind == "claim":
+                _, _, msg_job, chunk_index = message
+                if msg_job == job_id:
+                    claimed[worker_id].add(chunk_index)
+            elif kind == "start":
+                _, _, msg_job, chunk_index = message
+                if msg_job == job_id:
+                    claimed[worker_id].discard(chunk_index)
+                    in_flight[worker_id] = chunk_index
+            elif kind == "done":
+                _, _, msg_job, chunk_index, num_instances, elapsed, ok, result = message
+                if msg_job != job_id or chunk_index not in pending:
+                    continue
+                in_flight.pop(worker_id, None)
+                pending.discard(chunk_index)
+                record_chunk(worker_stats.setdefault(worker_id, new_worker_stats(self.gpu_for(worker_id))), num_instances, elapsed, ok)
+                if not ok:
+                    print(f"Warning: worker {worker_id} failed on chunk {chunk_index}.")
+                if on_result is not None:
+                    on_result(payloads[chunk_index], ok, result)
+            elif kind == "oom":
+                _, _, msg_job, chunk_index = message
+                dropped = self._retire_after_oom(
+                    worker_id, job_id, msg_job, chunk_index, payloads, pending, in_flight, claimed, retries
+                )
+                self._report_dropped(dropped, payloads, worker_stats, on_result)
+            elif kind == "exit" and not message[2]:
+                print(f"Warning: worker {worker_id} failed to initialise.")
+                self._processes.pop(worker_id, None)
+                if not self._processes:
+                    raise RuntimeError("All evaluation workers failed to initialise.")
+        return worker_stats
+
+    def _report_dropped(self, dropped, payloads, worker_stats, on_result):
+        # 丢弃的块也要回报给调用方，否则账本租约、在途计数等一直等着它
+        for worker_id, chunk_index in dropped:
+            stats = worker_stats.setdefault(worker_id, new_worker_stats(self.gpu_for(worker_id)))
+            stats["failed"] += len(payloads[chunk_index]["instances"])
+            if on_result is not None:
+                on_result(payloads[chunk_index], False, None)
+
+    def _reap_dead_workers(self, job_id, payloads, pending, in_flight, claimed, retries):
+        """Restart workers that died without a message; returns ``[(worker_id, chunk_index)]`` of dropped chunks."""
+        dropped = []
+        for worker_id, p in list(self._processes.items()):
+            if p.is_alive():
+                continue
+            if p.exitcode == 0:
+                # 正常退出只发生在显存不足退役时，其 "oom" 消息随后处理
+                continue
+            # 子进程被 OOM killer 等直接杀死时不会发送任何消息，这里重新拉起并重投在途任务
+            print(f"Warning: worker {worker_id} exited unexpectedly (exitcode={p.exitcode}); restarting.")
+            # 只是预领取、还没开始算的任务不计入重试次数
+            for chunk_index in sorted(claimed.pop(worker_id, ())):
+                if chunk_index in pending:
+                    self._task_queue.put((job_id, chunk_index, payloads[chunk_index]))
+            chunk_index = in_flight.pop(worker_id, None)
+            if chunk_index is not None and chunk_index in pending:
+                if retries[chunk_index] < self.max_retries:
+                    retries[chunk_index] += 1
+                    self._task_queue.put((job_id, chunk_index, payloads[chunk_index]))
+                else:
+                    print(f"Warning: dropping chunk {chunk_index} after {retries[chunk_index]} retries.")
+                    pending.discard(chunk_index)
+                    dropped.append((worker_id, chunk_index))
+            self._spawn(worker_id)
+        return dropped
+
+    def _retire_after_oom(self, worker_id, job_id, msg_job, chunk_index, payloads, pending, in_flight, claimed, retries):
+        in_flight.pop(worker_id, None)
+        # 预领取的任务已由该 worker 自己放回队列
+        claimed.pop(worker_id, None)
+        process = self._processes.pop(worker_id, None)
+        if process is not None:
+            process.join()
+        gpu_id = self.gpu_for(worker_id)
+        if not self._processes:
+            # 最后一个 worker 不能退役，重启一个干净的进程再试
+            self._spawn(worker_id)
+            if msg_job == job_id and chunk_index in pending:
+                if retries[chunk_index] < self.max_retries:
+                    retries[chunk_index] += 1
+                    self._task_queue.put((job_id, chunk_index, payloads[chunk_index]))
+                else:
+                    print(f"Warning: dropping chunk {chunk_index} after repeated out-of-memory failures.")
+                    pending.discard(chunk_index)
+                    return [(worker_id, chunk_index)]
+            return []
+        remaining = sum(1 for other in self._processes if self.gpu_for(other) == gpu_id)
+        print(
+            f"Warning: worker {worker_id} on GPU {gpu_id} kept running out of memory; retiring it "
+            f"({remaining} worker(s) left on that GPU) and requeueing chunk {chunk_index}."
+        )
+        if msg_job == job_id and chunk_index in pending:
+            self._task_queue.put((job_id, chunk_index, payloads[chunk_index]))
+        return []
+
+    def _run_inline(self, payloads, on_result, feed, poll_interval, on_progress):
+        if self._inline_state is None:
+            self._inline_state = self.setup(0, self.device, *self.setup_args)
+        if isinstance(self._inline_state, dict):
+            self._inline_state["progress"] = (lambda event: on_progress(0, event)) if on_progress is not None else None
+        worker_stats = {0: new_worker_stats(self.gpu_for(0))}
+        queued = deque(payloads)
+        hinted = set()
+        last_feed = 0.0
+        while queued or feed is not None:
+            if feed is not None and (not queued or time.time() - last_feed >= poll_interval):
+                if not queued:
+                    time.sleep(max(0.0, last_feed + poll_interval - time.time()))
+                last_feed = time.time()
+                new_payloads, finished = feed()
+                queued.extend(new_payloads)
+                if finished:
+                    feed = None
+                continue
+            if self.hint is not None:
+                for upcoming in list(queued)[: self.lookahead + 1]:
+                    if id(upcoming) not in hinted:
+                        hinted.add(id(upcoming))
+                        self.hint(self._inline_state, upcoming)
+            payload = queued.popleft()
+            hinted.discard(id(payload))
+            start = time.perf_counter()
+            ok, result, _ = _run_with_backoff(self.runner, self._inline_state, payload, self.oom_retries, self.oom_backoff)
+            record_chunk(worker_stats[0], len(payload["instances"]), time.perf_counter() - start, ok)
+            if on_result is not None:
+                on_result(payload, ok, result)
+        return worker_stats
+
+    def close(self):
+        if self.inline or not self._processes:
+            return
+        for _ in self._processes:
+            self._task_queue.put(None)
+        for p in self._processes.values():
+            p.join()
+        self._processes = {}
+        self._started = False
+
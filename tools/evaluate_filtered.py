@@ -1,82 +1,207 @@
 import argparse
+import contextlib
+import importlib
 import json
 import os
 import sys
+import time
 import types
-from collections import defaultdict
+import zlib
 from pathlib import Path
 
 import numpy as np
-import torch
-import torch.multiprocessing as mp
-from omegaconf import OmegaConf
-
-worldscore_root = os.environ.get("WORLDSCORE_PATH", "")
-if worldscore_root:
-    local_ws = os.path.join(worldscore_root, "WorldScore")
-    if local_ws not in sys.path:
-        sys.path.insert(0, local_ws)
-    sea_raft_core = os.path.join(
-        worldscore_root,
-        "WorldScore",
-        "worldscore",
-        "benchmark",
-        "metrics",
-        "third_party",
-        "SEA-RAFT",
-    )
-    if sea_raft_core not in sys.path:
-        sys.path.insert(0, sea_raft_core)
-    raft_core = os.path.join(
-        worldscore_root,
-        "WorldScore",
-        "worldscore",
-        "benchmark",
-        "metrics",
-        "third_party",
-        "RAFT",
-    )
-    if raft_core not in sys.path:
-        sys.path.append(raft_core)
-    droid_path = os.path.join(
-        worldscore_root,
-        "WorldScore",
-        "worldscore",
-        "benchmark",
-        "metrics",
-        "third_party",
-        "droid_slam",
-    )
-    if droid_path not in sys.path:
-        sys.path.insert(0, droid_path)
-    vf_mamba_path = os.path.join(
-        worldscore_root,
-        "WorldScore",
-        "worldscore",
-        "benchmark",
-        "metrics",
-        "third_party",
-        "VFIMamba",
-    )
-    if vf_mamba_path not in sys.path:
-        sys.path.insert(0, vf_mamba_path)
-
-try:
-    import droid  # type: ignore
-    _DROID_AVAILABLE = True
-except Exception:
-    _DROID_AVAILABLE = False
-    stub = types.ModuleType("droid")
-
-    class Droid:  # pylint: disable=too-few-public-methods
-        def __init__(self, *args, **kwargs):
-            raise RuntimeError("droid is not available; camera metrics cannot run.")
-
-    stub.Droid = Droid
-    sys.modules["droid"] = stub
-
-from worldscore.benchmark.helpers.evaluator import Evaluator, process_batch
-from worldscore.benchmark.utils.utils import aspect_info
+
+from batch_metrics import BatchEngine, load_adapters
+from case_filter import CaseFilter
+from completion import STREAM_END, is_complete
+from early_stop import DEFAULT_CONFIDENCE, DEFAULT_MIN_INSTANCES, SequentialEstimate, stratified_order, write_summary
+from eval_pool import EvalPool, chunk_instances, print_worker_stats
+from result_cache import (
+    CONTENT_EXTENSIONS,
+    EVALUATION_FILENAME,
+    InstanceCache,
+    bump_generation,
+    bump_metric_epochs,
+    evaluation_generation,
+    load_generation,
+    load_metric_epochs,
+    read_evaluation,
+    write_evaluation,
+)
+from frame_cache import DEFAULT_CACHE_DIR, FrameCache
+from generations import DEFAULT_KEEP, collect_in_background
+from gpu_packing import describe_plan, device_inventory, estimate_footprint, load_memory_table, plan_workers
+from instance_manifest import LEVELS, load_records, walk_instances
+from partial_aggregate import build_partial, write_partial
+from prefetch import Prefetcher, warm_files
+from rendezvous import Rendezvous
+from report import build_report, report_prefix, write_report
+from result_store import ResultStore, has_store, load_scores, mean_scores, remove_store
+from sweep import load_manifest
+from telemetry import Telemetry
+from tracer import Tracer, print_summary, reset_traces, summarize
+from work_ledger import DEFAULT_RETRIES as LEDGER_RETRIES, WorkLedger
+
+# torch/WorldScore 的导入要十几秒；只有真正要跑指标的路径才加载，聚合、列举、dry-run 不碰它们
+Evaluator = None
+process_batch = None
+aspect_info = None
+_DROID_AVAILABLE = None
+_IMPORT_SECONDS = {}
+# --delete-calculated 多分片换代用的屏障客户端，整个进程共用一个（运行 ID 只解析一次）
+_GENERATION_RENDEZVOUS = {}
+
+
+def _timed_import(name, loader):
+    start = time.perf_counter()
+    try:
+        return loader()
+    finally:
+        _IMPORT_SECONDS[name] = round(_IMPORT_SECONDS.get(name, 0.0) + time.perf_counter() - start, 3)
+
+
+def _load_worldscore():
+    """Import WorldScore (and with it torch) on first use; every evaluating process calls this."""
+    if Evaluator is not None:
+        return
+    _timed_import("worldscore", _import_worldscore)
+
+
+def _import_worldscore():
+    global Evaluator, process_batch, aspect_info, _DROID_AVAILABLE
+    worldscore_root = os.environ.get("WORLDSCORE_PATH", "")
+    if worldscore_root:
+        local_ws = os.path.join(worldscore_root, "WorldScore")
+        if local_ws not in sys.path:
+            sys.path.insert(0, local_ws)
+        sea_raft_core = os.path.join(
+            worldscore_root,
+            "WorldScore",
+            "worldscore",
+            "benchmark",
+            "metrics",
+            "third_party",
+            "SEA-RAFT",
+        )
+        if sea_raft_core not in sys.path:
+            sys.path.insert(0, sea_raft_core)
+        raft_core = os.path.join(
+            worldscore_root,
+            "WorldScore",
+            "worldscore",
+            "benchmark",
+            "metrics",
+            "third_party",
+            "RAFT",
+        )
+        if raft_core not in sys.path:
+            sys.path.append(raft_core)
+        droid_path = os.path.join(
+            worldscore_root,
+            "WorldScore",
+            "worldscore",
+            "benchmark",
+            "metrics",
+            "third_party",
+            "droid_slam",
+        )
+        if droid_path not in sys.path:
+            sys.path.insert(0, droid_path)
+        vf_mamba_path = os.path.join(
+            worldscore_root,
+            "WorldScore",
+            "worldscore",
+            "benchmark",
+            "metrics",
+            "third_party",
+            "VFIMamba",
+        )
+        if vf_mamba_path not in sys.path:
+            sys.path.insert(0, vf_mamba_path)
+
+    try:
+        import droid  # type: ignore
+        _DROID_AVAILABLE = True
+    except Exception:
+        _DROID_AVAILABLE = False
+        stub = types.ModuleType("droid")
+
+        class Droid:  # pylint: disable=too-few-public-methods
+            def __init__(self, *args, **kwargs):
+                raise RuntimeError("droid is not available; camera metrics cannot run.")
+
+        stub.Droid = Droid
+        sys.modules["droid"] = stub
+
+    from worldscore.benchmark.helpers.evaluator import Evaluator as _Evaluator, process_batch as _process_batch
+    from worldscore.benchmark.utils.utils import aspect_info as _aspect_info
+
+    Evaluator, process_batch, aspect_info = _Evaluator, _process_batch, _aspect_info
+
+
+def _build_config(cfg):
+    OmegaConf = _timed_import("omegaconf", lambda: importlib.import_module("omegaconf")).OmegaConf
+    base_config = OmegaConf.load(os.path.join(cfg["env"]["worldscore_path"], "WorldScore/config/base_config.yaml"))
+    model_name = cfg.get("worldscore", {}).get("model_name", "fantasy_world")
+    model_cfg_path = os.path.join(
+        cfg["env"]["worldscore_path"],
+        "WorldScore/config/model_configs",
+        f"{model_name}.yaml",
+    )
+    model_config = OmegaConf.load(model_cfg_path)
+    config = OmegaConf.merge(base_config, model_config)
+
+    config = OmegaConf.to_container(config, resolve=True)
+
+    overrides = cfg.get("worldscore", {}).get("config_overrides", {})
+    config.update(overrides)
+
+    runs_root_base = cfg.get("worldscore", {}).get("runs_root_base")
+    if runs_root_base:
+        config["runs_root"] = os.path.join(runs_root_base, model_name)
+
+    output_dir = cfg.get("worldscore", {}).get("output_dir")
+    if output_dir:
+        config["output_dir"] = output_dir
+    return config
+
+
+def _movement_root(config, visual_movement):
+    # 与 WorldScore Evaluator.root_path 的拼法一致
+    return Path(config["runs_root"]) / config["output_dir"] / visual_movement
+
+
+class _OutputProbe:
+    """``Evaluator.data_exists`` stand-in for paths that never import WorldScore: any generated media counts."""
+
+    def data_exists(self, instance_dir):
+        for dirpath, dirnames, filenames in os.walk(instance_dir):
+            if any(filename.lower().endswith(CONTENT_EXTENSIONS) for filename in filenames):
+                return True
+        return False
+
+
+def _record_startup(args, started):
+    if args.dry_run:
+        command = "dry-run"
+    elif args.only_calc_mean:
+        command = "only-calc-mean"
+    else:
+        command = "follow" if args.follow else "evaluate"
+    record = {
+        "command": command,
+        "ready_s": round(time.perf_counter() - started, 3),
+        "cpu_s": round(time.process_time(), 3),
+        "imports": dict(_IMPORT_SECONDS),
+        "shard_index": args.shard_index,
+        "time": time.time(),
+    }
+    imports = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in record["imports"].items()) or "none"
+    print(f"[startup] {command}: ready in {record['ready_s']:.2f}s (cpu {record['cpu_s']:.2f}s; imports: {imports})")
+    if args.startup_log:
+        os.makedirs(os.path.dirname(os.path.abspath(args.startup_log)), exist_ok=True)
+        with open(args.startup_log, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=True) + "\n")
 
 
 def deep_update(target, source):
@@ -108,265 +233,1203 @@ def _apply_metric_filter(selected_metrics):
     aspect_info.update(filtered)
 
 
-def _matches(value, allowed):
-    if not allowed:
-        return True
-    if value is None:
-        return False
-    return value in allowed
-
-
-def _collect_instances(root_path: Path, visual_movement: str, filters: dict, evaluator: Evaluator):
-    instances = []
-    if not root_path.exists():
-        return instances
-
-    if visual_movement == "static":
-        for visual_style in sorted([x.name for x in root_path.iterdir() if x.is_dir()]):
-            if not _matches(visual_style, filters.get("visual_style", [])):
+def _collect_instances(
+    root_path: Path,
+    visual_movement: str,
+    case_filter: CaseFilter,
+    evaluator,
+    completed_only=False,
+    known=(),
+    use_manifest=True,
+):
+    records = load_records(root_path) if use_manifest else None
+    if records is not None:
+        # 推理结束时写好的实例清单：一次读文件代替逐层列目录和逐个 data_exists
+        instances = []
+        levels = LEVELS[visual_movement]
+        matchers = [(i, case_filter.field_matcher(field)) for i, field in enumerate(levels)]
+        matchers = [(i, matcher) for i, matcher in matchers if matcher is not None]
+        for key in sorted(records, key=lambda k: k.split("/")):
+            names = key.split("/")
+            if records[key]["status"] != "complete" or len(names) != len(levels) or key in known:
                 continue
-            visual_style_dir = root_path / visual_style
-            for scene_type in sorted([x.name for x in visual_style_dir.iterdir() if x.is_dir()]):
-                if not _matches(scene_type, filters.get("scene_type", [])):
-                    continue
-                scene_type_dir = visual_style_dir / scene_type
-                for category in sorted([x.name for x in scene_type_dir.iterdir() if x.is_dir()]):
-                    if not _matches(category, filters.get("category", [])):
-                        continue
-                    category_dir = scene_type_dir / category
-                    for instance in sorted([x.name for x in category_dir.iterdir() if x.is_dir()]):
-                        if not _matches(instance, filters.get("instance", [])):
-                            continue
-                        instance_dir = category_dir / instance
-                        if not evaluator.data_exists(str(instance_dir)):
-                            continue
-                        instances.append([visual_style, scene_type, category, instance, instance_dir])
-    else:
-        for visual_style in sorted([x.name for x in root_path.iterdir() if x.is_dir()]):
-            if not _matches(visual_style, filters.get("visual_style", [])):
+            if not all(matcher(names[i]) for i, matcher in matchers):
+                continue
+            instance_dir = root_path / key
+            if completed_only and not is_complete(instance_dir):
                 continue
-            visual_style_dir = root_path / visual_style
-            for motion_type in sorted([x.name for x in visual_style_dir.iterdir() if x.is_dir()]):
-                if not _matches(motion_type, filters.get("motion_type", [])):
-                    continue
-                motion_type_dir = visual_style_dir / motion_type
-                for instance in sorted([x.name for x in motion_type_dir.iterdir() if x.is_dir()]):
-                    if not _matches(instance, filters.get("instance", [])):
-                        continue
-                    instance_dir = motion_type_dir / instance
-                    if not evaluator.data_exists(str(instance_dir)):
-                        continue
-                    instances.append([visual_style, motion_type, instance, instance_dir])
+            instances.append([*names, instance_dir])
+        return instances
+
+    instances = []
+    for names, instance_dir in walk_instances(root_path, visual_movement, case_filter.field_matches):
+        if known and "/".join(names) in known:
+            continue
+        if completed_only and not is_complete(instance_dir):
+            continue
+        if not evaluator.data_exists(str(instance_dir)):
+            continue
+        instances.append([*names, instance_dir])
     return instances
 
 
-def _calculate_mean_scores(metrics_results, aspect_list, output_path):
-    scores = {}
-    for aspect in metrics_results:
-        if aspect not in aspect_list:
-            continue
-        metric_score_list = []
-        for metric_name, metric_scores in metrics_results[aspect].items():
-            metric_score_list.append(
-                np.mean(
-                    np.array([metric_score["score_normalized"] for metric_score in metric_scores]),
-                    axis=0,
-                ).item()
-            )
-        if metric_score_list:
-            scores[aspect] = round(np.mean(metric_score_list).item() * 100, 2)
+# 只缓存重量级的模型对象：WorldScore 每次 process_batch 照常新建 Evaluator 和指标对象，
+# 指标构造时调用的这些加载函数从本 worker 的模型字典里取已加载的模型
+_MODEL_LOADERS = (
+    ("clip", "load"),
+    ("pyiqa", "create_metric"),
+)
+
+
+def _cache_model_loader(models, module_name, attr):
+    try:
+        module = importlib.import_module(module_name)
+    except Exception:
+        return
+    loader = getattr(module, attr, None)
+    if loader is None or getattr(loader, "_model_cache", None) is models:
+        return
+    loader = getattr(loader, "_loader", loader)
+
+    def cached_loader(*args, **kwargs):
+        key = f"{module_name}.{attr}:" + json.dumps([args, kwargs], sort_keys=True, default=str)
+        if key not in models:
+            models[key] = loader(*args, **kwargs)
+        return models[key]
+
+    cached_loader._model_cache = models
+    cached_loader._loader = loader
+    setattr(module, attr, cached_loader)
+
+
+def _init_worker(
+    worker_id, device, selected_metrics, prefetch_opts=None, frame_cache_opts=None, trace_opts=None, batch_opts=None
+):
+    # spawn 出来的子进程会重新导入 aspect_info，需要在子进程里再次应用指标过滤
+    _load_worldscore()
+    _apply_metric_filter(selected_metrics)
+    # 本 worker 已加载的模型，键为加载函数和参数；批量指标适配器也从这里取模型
+    models = {}
+    for module_name, attr in _MODEL_LOADERS:
+        _cache_model_loader(models, module_name, attr)
+    base_aspect_info = {
+        aspect: {"type": info["type"], "metrics": dict(info["metrics"])} for aspect, info in aspect_info.items()
+    }
+    prefetcher = None
+    if prefetch_opts and prefetch_opts["depth"] > 0:
+        prefetcher = Prefetcher(
+            _prepare_instance,
+            depth=prefetch_opts["depth"],
+            max_bytes=prefetch_opts["max_bytes"],
+            threads=prefetch_opts["threads"],
+        )
+    frame_cache = None
+    if frame_cache_opts and frame_cache_opts["hooks"]:
+        # 同一样本的多个指标各自解码同一段视频，挂到 WorldScore 的读帧函数上只解码一次
+        frame_cache = FrameCache(frame_cache_opts["dir"], frame_cache_opts["max_bytes"])
+        frame_cache.install(frame_cache_opts["hooks"])
+    tracer = None
+    if trace_opts and trace_opts["dir"]:
+        gpu_label = os.environ.get("CUDA_VISIBLE_DEVICES", "") if device == "cuda" else ""
+        tracer = Tracer(trace_opts["dir"], worker_id, gpu_label, trace_opts["shard_index"])
+    batch_engine = None
+    if batch_opts and batch_opts["adapters"]:
+        batch_engine = BatchEngine(
+            load_adapters(batch_opts["adapters"], device, models),
+            batch_size=batch_opts["batch_size"],
+            device=device,
+        )
+    return {
+        "worker_id": worker_id,
+        "device": device,
+        "models": models,
+        "aspect_info": base_aspect_info,
+        "prefetcher": prefetcher,
+        "frame_cache": frame_cache,
+        "tracer": tracer,
+        "trace_metrics": bool(trace_opts and trace_opts["per_metric"]),
+        "batch_engine": batch_engine,
+    }
 
-    with open(output_path, "w", encoding="utf-8") as f:
-        json.dump(scores, f, indent=2, ensure_ascii=True)
-    return scores
 
+def _prepare_instance(item, files):
+    # 在预取线程里完成缓存查询和内容哈希（首次会整段读取视频），需要重算时再把输入读进页缓存
+    payload, instance = item
+    config = payload["config"]
+    epochs = payload["metric_epochs"]
+    cells = [tuple(cell) for cell in payload["cells"]]
+    cache = InstanceCache(instance[-1], payload["generation"])
+    missing = cache.missing(cells, config, epochs)
+    if missing and files:
+        warm_files(files)
+    return cache, missing
 
-def _worker_wrapper(gpu_id, config, instance_batch, aspect_list, visual_movement, queue):
+
+def _hint_chunk(state, payload):
+    prefetcher = state.get("prefetcher")
+    if prefetcher is None:
+        return
+    for instance in payload["instances"]:
+        prefetcher.schedule(str(instance[-1]), (payload, instance), instance[-1])
+
+
+def _selected_cells(aspect_list):
+    return [
+        (aspect, metric_name)
+        for aspect in aspect_list
+        if aspect in aspect_info
+        for metric_name in aspect_info[aspect]["metrics"]
+    ]
+
+
+@contextlib.contextmanager
+def _metric_subset(base_aspect_info, cells):
+    # process_batch 按 aspect_info 决定要算哪些指标，临时收窄到缺失的单元格
+    subset = {}
+    for aspect, metric_name in cells:
+        info = base_aspect_info[aspect]
+        entry = subset.setdefault(aspect, {"type": info["type"], "metrics": {}})
+        entry["metrics"][metric_name] = info["metrics"][metric_name]
+    aspect_info.clear()
+    aspect_info.update(subset)
     try:
-        # Bind this worker to a single visible GPU without clobbering os.environ.
-        os.environ["CUDA_VISIBLE_DEVICES"] = str(gpu_id)
-        mapped_gpu_id = 0
-        torch.cuda.set_device(mapped_gpu_id)
-        # 执行 process_batch，结果会自动写入磁盘，不需要返回字典
-        process_batch(config, instance_batch, aspect_list, visual_movement)
-        # 仅放回一个 True 代表该子进程顺利完成
-        queue.put(True)
-    except Exception as e:
-        import traceback
-        traceback.print_exc()
-        queue.put(False)
+        yield list(subset)
+    finally:
+        aspect_info.clear()
+        aspect_info.update(base_aspect_info)
+
+
+def _span(state, name, cat, **args):
+    tracer = state.get("tracer")
+    return tracer.span(name, cat, **args) if tracer is not None else contextlib.nullcontext(args)
+
+
+def _evaluate_cells(state, config, instance, visual_movement, cells, timings=None):
+    # timings 收集各指标耗时（逐指标调用时每个都有，一次算多个指标时无法拆分）
+    instance_dir = instance[-1]
+    # WorldScore 看到 evaluation.json 就会整体跳过，缓存里已有其它指标，可以放心移除
+    evaluation_path = Path(instance_dir) / EVALUATION_FILENAME
+    if state.get("trace_metrics"):
+        # 逐个指标调用 process_batch 才能拿到每个指标的耗时；模型常驻，额外开销只是 process_batch 的调度
+        evaluation = {}
+        instance_key = "/".join(instance[:-1])
+        for aspect, metric_name in cells:
+            if evaluation_path.exists():
+                evaluation_path.unlink()
+            start = time.perf_counter()
+            with _span(state, f"{aspect}/{metric_name}", "metric", instance=instance_key):
+                _process_cells(state, config, instance, visual_movement, [(aspect, metric_name)])
+            if timings is not None:
+                timings[f"{aspect}/{metric_name}"] = time.perf_counter() - start
+            for fresh_aspect, scores in read_evaluation(instance_dir).items():
+                evaluation.setdefault(fresh_aspect, {}).update(scores)
+        return evaluation
+    if evaluation_path.exists():
+        evaluation_path.unlink()
+    start = time.perf_counter()
+    if len(cells) == 1:
+        with _span(state, "/".join(cells[0]), "metric", instance="/".join(instance[:-1])):
+            _process_cells(state, config, instance, visual_movement, cells)
+    else:
+        _process_cells(state, config, instance, visual_movement, cells)
+    if timings is not None and len(cells) == 1:
+        timings["/".join(cells[0])] = time.perf_counter() - start
+    return read_evaluation(instance_dir)
+
+
+def _process_cells(state, config, instance, visual_movement, cells):
+    with _metric_subset(state["aspect_info"], cells) as aspects:
+        process_batch(
+            config=config,
+            instance_batch=[instance],
+            aspect_list=aspects,
+            visual_movement=visual_movement,
+        )
+
+
+def _run_chunk(state, payload):
+    config = payload["config"]
+    epochs = payload["metric_epochs"]
+    cells = [tuple(cell) for cell in payload["cells"]]
+    prefetcher = state.get("prefetcher")
+    progress = state.get("progress")
+    stats = dict(_new_run_stats(), evaluations={})
+    remaining = [str(instance[-1]) for instance in payload["instances"]]
+    try:
+        prepared = {}
+        if state.get("batch_engine") is not None:
+            prepared = _run_batched(state, payload, remaining, stats)
+        for instance in payload["instances"]:
+            instance_dir = instance[-1]
+            instance_key = "/".join(instance[:-1])
+            instance_start = time.perf_counter()
+            timings = {}
+            with _span(state, instance_key, "instance", visual_movement=payload["visual_movement"]) as span_args:
+                start = time.perf_counter()
+                with _span(state, "prepare", "io", instance=instance_key):
+                    if str(instance_dir) in prepared:
+                        cache, missing, batched = prepared.pop(str(instance_dir))
+                    else:
+                        cache, missing = _take_prepared(prefetcher, remaining, payload, instance)
+                        batched = 0
+                stats["io_wait"] += time.perf_counter() - start
+
+                start = time.perf_counter()
+                if missing:
+                    fresh = _evaluate_cells(state, config, instance, payload["visual_movement"], missing, timings)
+                    for aspect, metric_name in missing:
+                        score = fresh.get(aspect, {}).get(metric_name)
+                        if score:
+                            cache.put(aspect, metric_name, cache.key(aspect, metric_name, config, epochs), score)
+                stats["compute"] += time.perf_counter() - start
+                span_args["computed"] = len(missing)
+                evaluation = cache.evaluation(cells, config, epochs)
+                if evaluation != read_evaluation(instance_dir):
+                    write_evaluation(instance_dir, evaluation)
+                cache.save()
+            stats["evaluations"][instance_key] = evaluation
+            stats["computed"] += len(missing)
+            stats["cached"] += len(cells) - len(missing) - batched
+            if progress is not None:
+                progress(
+                    {
+                        "visual_movement": payload["visual_movement"],
+                        "instance": instance_key,
+                        "seconds": time.perf_counter() - instance_start,
+                        "computed": len(missing) + batched,
+                        "cached": len(cells) - len(missing) - batched,
+                        "metrics": timings,
+                    }
+                )
+    finally:
+        if state.get("tracer") is not None:
+            state["tracer"].flush()
+        if prefetcher is not None:
+            for key in remaining:
+                prefetcher.drop(key)
+            stats.update(prefetcher.reset_stats())
+        if state.get("frame_cache") is not None:
+            for key, value in state["frame_cache"].reset_stats().items():
+                stats[f"frame_{key}"] = value
+    return stats
+
+
+def _take_prepared(prefetcher, remaining, payload, instance):
+    if prefetcher is not None:
+        return prefetcher.take(remaining.pop(0), (payload, instance), instance[-1])
+    return _prepare_instance((payload, instance), None)
+
+
+def _run_batched(state, payload, remaining, stats):
+    # 先准备好整块实例，批量指标把各实例的帧拼成大批一次前向；其余指标仍逐实例交给 process_batch
+    engine = state["batch_engine"]
+    config = payload["config"]
+    epochs = payload["metric_epochs"]
+    prefetcher = state.get("prefetcher")
+    prepared = {}
+    start = time.perf_counter()
+    with _span(state, "prepare", "io", instances=len(payload["instances"])):
+        for instance in payload["instances"]:
+            prepared[str(instance[-1])] = (*_take_prepared(prefetcher, remaining, payload, instance), 0)
+    stats["io_wait"] += time.perf_counter() - start
+
+    jobs = []
+    for instance_dir, (cache, missing, _) in prepared.items():
+        cells = [cell for cell in missing if engine.handles(cell)]
+        if cells:
+            jobs.append((instance_dir, cells))
+    if not jobs:
+        return prepared
+    start = time.perf_counter()
+    with _span(state, "batched", "metric", instances=len(jobs)) as span_args:
+        results = engine.evaluate(jobs, config)
+        span_args.update(engine.reset_stats())
+    stats["compute"] += time.perf_counter() - start
+    for instance_dir, cells in jobs:
+        cache, missing, _ = prepared[instance_dir]
+        for aspect, metric_name in cells:
+            score = results.get(instance_dir, {}).get((aspect, metric_name))
+            if score:
+                cache.put(aspect, metric_name, cache.key(aspect, metric_name, config, epochs), score)
+        prepared[instance_dir] = (cache, [cell for cell in missing if cell not in cells], len(cells))
+        stats["computed"] += len(cells)
+        stats["batched"] += len(cells)
+    return prepared
+
+
+def _new_run_stats():
+    return {
+        "cached": 0,
+        "computed": 0,
+        "batched": 0,
+        "io_wait": 0.0,
+        "compute": 0.0,
+        "ready": 0,
+        "waited": 0,
+        "frame_hits": 0,
+        "frame_misses": 0,
+        "frame_bypass": 0,
+        "frame_evicted": 0,
+    }
+
+
+def _print_run_stats(run_stats, label):
+    print(
+        f"[{label}] metric cells: {run_stats['computed']} computed, "
+        f"{run_stats['cached']} reused from cache"
+        + (f", {run_stats['batched']} in cross-instance batches" if run_stats["batched"] else "")
+    )
+    busy = run_stats["io_wait"] + run_stats["compute"]
+    if busy > 0:
+        print(
+            f"[{label}] worker time: {run_stats['io_wait']:.1f}s waiting for inputs ({run_stats['io_wait'] / busy:.1%}), "
+            f"{run_stats['compute']:.1f}s in metrics ({run_stats['compute'] / busy:.1%})"
+        )
+    if run_stats["ready"] + run_stats["waited"]:
+        print(
+            f"[{label}] prefetch: {run_stats['ready']} of {run_stats['ready'] + run_stats['waited']} "
+            f"instances ready before they were needed"
+        )
+    if run_stats["frame_hits"] + run_stats["frame_misses"]:
+        print(
+            f"[{label}] frame cache: {run_stats['frame_hits']} hits, {run_stats['frame_misses']} misses, "
+            f"{run_stats['frame_bypass']} bypassed, {run_stats['frame_evicted']} evicted"
+        )
 
 
 def main() -> None:
+    started = time.perf_counter()
     parser = argparse.ArgumentParser()
     parser.add_argument("--config-json", required=True, help="Resolved config JSON")
-    parser.add_argument("--num-jobs", type=int, default=1)
+    parser.add_argument(
+        "--num-jobs",
+        type=int,
+        default=1,
+        help="Worker processes; 0 means one per GPU, or with --gpu-packing memory as many as fit",
+    )
+    parser.add_argument("--chunk-size", type=int, default=1, help="Instances pulled from the work queue at a time")
     parser.add_argument("--only-calc-mean", action="store_true")
-    parser.add_argument("--delete-calculated", action="store_true")
+    parser.add_argument(
+        "--delete-calculated",
+        action="store_true",
+        help="Invalidate every result by starting a new result generation; older ones are collected in the background",
+    )
+    parser.add_argument(
+        "--keep-generations",
+        type=int,
+        default=DEFAULT_KEEP,
+        help="Older result generations kept for comparison when --delete-calculated collects garbage",
+    )
+    parser.add_argument(
+        "--invalidate-metric",
+        action="append",
+        default=[],
+        help="Recompute this metric (or every metric of this aspect); may be repeated",
+    )
     parser.add_argument("--num-shards", type=int, default=1)
     parser.add_argument("--shard-index", type=int, default=0)
     parser.add_argument("--skip-mean", action="store_true")
-    args = parser.parse_args()
-
-    with open(args.config_json, "r", encoding="utf-8") as f:
-        cfg = json.load(f)
-
-    base_config = OmegaConf.load(os.path.join(cfg["env"]["worldscore_path"], "WorldScore/config/base_config.yaml"))
-    model_name = cfg.get("worldscore", {}).get("model_name", "fantasy_world")
-    model_cfg_path = os.path.join(
-        cfg["env"]["worldscore_path"],
-        "WorldScore/config/model_configs",
-        f"{model_name}.yaml",
+    parser.add_argument(
+        "--partial-dir",
+        default="",
+        help="Write this shard's mergeable partial aggregate (sums/counts/instance keys) here",
     )
-    model_config = OmegaConf.load(model_cfg_path)
-    config = OmegaConf.merge(base_config, model_config)
-
-    config = OmegaConf.to_container(config, resolve=True)
+    parser.add_argument(
+        "--report-resamples",
+        type=int,
+        default=0,
+        help="Also write a group-by report with bootstrap confidence intervals next to each score JSON (0 disables)",
+    )
+    parser.add_argument(
+        "--report-group-by",
+        default="",
+        help="Comma-separated levels to break the report down by (default: every level above instance)",
+    )
+    parser.add_argument("--report-confidence", type=float, default=0.95)
+    parser.add_argument(
+        "--rebuild-store",
+        action="store_true",
+        help="Re-import every evaluation.json into the columnar result store (legacy trees)",
+    )
+    parser.add_argument(
+        "--ignore-manifest",
+        action="store_true",
+        help="Discover instances by walking the output tree even when an instance manifest exists",
+    )
+    parser.add_argument(
+        "--prefetch-depth",
+        type=int,
+        default=2,
+        help="Instances whose inputs are read ahead while the current one computes (0 disables)",
+    )
+    parser.add_argument("--prefetch-mb", type=int, default=4096, help="Cap on media bytes read ahead per worker")
+    parser.add_argument("--prefetch-threads", type=int, default=2)
+    parser.add_argument(
+        "--frame-cache-hook",
+        action="append",
+        default=[],
+        help="module:function of a WorldScore frame loader to serve from the decoded-frame cache; may be repeated",
+    )
+    parser.add_argument("--frame-cache-dir", default=DEFAULT_CACHE_DIR, help="Local-disk directory for decoded frames")
+    parser.add_argument("--frame-cache-gb", type=float, default=50.0, help="Disk budget of the decoded-frame cache")
+    parser.add_argument(
+        "--trace-dir",
+        default="",
+        help="Write per-worker Chrome-trace/Perfetto JSON and a trace summary here",
+    )
+    parser.add_argument(
+        "--trace-granularity",
+        choices=["instance", "metric"],
+        default="instance",
+        help="metric runs process_batch once per metric so each metric gets its own span; slower, for profiling only",
+    )
+    parser.add_argument(
+        "--batch-metric",
+        action="append",
+        default=[],
+        help="module:factory of a batched metric adapter (batch_metrics.BatchedMetric); its cell is computed "
+        "for the whole chunk in cross-instance batches instead of through process_batch; may be repeated",
+    )
+    parser.add_argument(
+        "--metric-batch-size",
+        type=int,
+        default=64,
+        help="Upper bound on rows per batched forward pass; lowered to fit free GPU memory and halved on OOM",
+    )
+    parser.add_argument(
+        "--follow",
+        action="store_true",
+        help="Pipelined mode: evaluate instances as inference publishes them until the stream ends",
+    )
+    parser.add_argument("--follow-interval", type=float, default=30.0, help="Seconds between scans for new instances")
+    parser.add_argument(
+        "--follow-timeout",
+        type=float,
+        default=0.0,
+        help="Stop following after this many seconds even without an end-of-stream signal (0 = wait forever)",
+    )
+    parser.add_argument(
+        "--rendezvous-dir",
+        default=os.environ.get("RDZV_DIR", ""),
+        help="Marker directory used to detect the end of the inference stream",
+    )
+    parser.add_argument(
+        "--barrier-timeout",
+        type=float,
+        default=3600.0,
+        help="Seconds the other shards wait for shard 0 to start a new generation with --delete-calculated",
+    )
+    parser.add_argument(
+        "--device",
+        choices=["cuda", "cpu"],
+        default="cuda",
+        help="cpu runs the worker pool without binding GPUs (lifecycle testing)",
+    )
+    parser.add_argument(
+        "--gpu-packing",
+        choices=["round-robin", "memory"],
+        default="round-robin",
+        help="round-robin cycles jobs over the GPUs; memory (opt-in) packs workers by the estimated footprint of the "
+        "selected metrics, one per GPU when a metric has no estimate",
+    )
+    parser.add_argument("--memory-table", default="", help="{metric: MB} JSON or a trace_summary.json to calibrate from")
+    parser.add_argument(
+        "--gpu-inventory",
+        default=os.environ.get("EVAL_GPU_INVENTORY", ""),
+        help="JSON list (or file) of {id, total_mb, free_mb} replacing the nvidia-smi query",
+    )
+    parser.add_argument("--gpu-memory-fraction", type=float, default=0.9, help="Share of free GPU memory workers may use")
+    parser.add_argument("--oom-retries", type=int, default=2, help="In-place retries of a chunk that ran out of GPU memory")
+    parser.add_argument("--oom-backoff", type=float, default=10.0, help="Seconds before the first OOM retry (doubles)")
+    parser.add_argument(
+        "--work-ledger",
+        default="",
+        help="Shared lease directory; nodes claim instance blocks from it instead of fixed modulo shards",
+    )
+    parser.add_argument(
+        "--lease-timeout",
+        type=float,
+        default=120.0,
+        help="A node's leases are reclaimed after this many seconds without a heartbeat",
+    )
+    parser.add_argument("--ledger-poll", type=float, default=2.0, help="Seconds between ledger claims")
+    parser.add_argument(
+        "--ledger-retries", type=int, default=LEDGER_RETRIES, help="Times a failed ledger block is claimed again"
+    )
+    parser.add_argument(
+        "--early-stop-halfwidth",
+        type=float,
+        default=0.0,
+        help="Screening: evaluate in stratified random order and stop once every aspect's CI half-width "
+        "(score points) is below this; 0 evaluates everything",
+    )
+    parser.add_argument("--early-stop-confidence", type=float, default=DEFAULT_CONFIDENCE)
+    parser.add_argument(
+        "--early-stop-min-instances",
+        type=int,
+        default=DEFAULT_MIN_INSTANCES,
+        help="Instances scored per aspect before its interval is trusted",
+    )
+    parser.add_argument("--early-stop-seed", type=int, default=0, help="Seed of the stratified evaluation order")
+    parser.add_argument(
+        "--telemetry-dir",
+        default="",
+        help="Rewrite this node's progress/throughput/ETA status JSON here (shard 0 also merges run_status.json)",
+    )
+    parser.add_argument("--telemetry-port", type=int, default=0, help="Serve /metrics (Prometheus) and /status on this port")
+    parser.add_argument("--telemetry-interval", type=float, default=15.0, help="Seconds between status file rewrites")
+    parser.add_argument(
+        "--stall-seconds",
+        type=float,
+        default=600.0,
+        help="A node without a finished instance for this long is reported as stalled in run_status.json",
+    )
+    parser.add_argument(
+        "--sweep-json",
+        default="",
+        help="Checkpoint-sweep manifest (tools/sweep.py expand); every checkpoint is evaluated by the same worker pool",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Print how many instances each movement/shard would evaluate and how many already have results",
+    )
+    parser.add_argument(
+        "--startup-log",
+        default=os.environ.get("EVAL_STARTUP_LOG", ""),
+        help="Append this invocation's startup/import timings to a JSONL file",
+    )
+    args = parser.parse_args()
 
-    overrides = cfg.get("worldscore", {}).get("config_overrides", {})
-    config.update(overrides)
+    if args.dry_run and (args.only_calc_mean or args.follow):
+        parser.error("--dry-run cannot be combined with --only-calc-mean or --follow")
+    if args.num_shards > 1 and not 0 <= args.shard_index < args.num_shards:
+        raise ValueError(f"Invalid shard-index {args.shard_index} for num-shards {args.num_shards}")
 
-    runs_root_base = cfg.get("worldscore", {}).get("runs_root_base")
-    if runs_root_base:
-        config["runs_root"] = os.path.join(runs_root_base, model_name)
+    if args.follow and (args.sweep_json or args.work_ledger):
+        parser.error("--follow cannot be combined with --sweep-json or --work-ledger")
+    if args.early_stop_halfwidth > 0 and (args.follow or args.work_ledger or args.num_shards > 1):
+        parser.error("--early-stop-halfwidth runs on a single node; it cannot be combined with --follow or sharding")
 
-    output_dir = cfg.get("worldscore", {}).get("output_dir")
-    if output_dir:
-        config["output_dir"] = output_dir
+    with open(args.config_json, "r", encoding="utf-8") as f:
+        cfg = json.load(f)
+    # 扫描多个 checkpoint 时每个 checkpoint 一份配置（各自的输出目录），进程池和常驻模型共用
+    runs = [("", cfg)]
+    if args.sweep_json:
+        runs = []
+        for entry in load_manifest(args.sweep_json):
+            with open(entry["config_json"], "r", encoding="utf-8") as f:
+                runs.append((entry["label"], json.load(f)))
+    configs = [(label, _build_config(run_cfg)) for label, run_cfg in runs]
 
     visual_movements = cfg.get("worldscore", {}).get("visual_movement", ["static", "dynamic"])
-    filters = cfg.get("filters", {})
-    if not filters.get("enable", False):
-        filters = {}
+    case_filter = CaseFilter(cfg.get("filters", {}))
 
     selected_aspects = cfg.get("metrics", {}).get("aspects", [])
     selected_metrics = cfg.get("metrics", {}).get("metrics", [])
 
+    if (args.only_calc_mean or args.dry_run) and not args.invalidate_metric:
+        # 聚合和 dry-run 只读结果库和目录树，不导入 torch/WorldScore
+        _record_startup(args, started)
+        for label, config in configs:
+            for visual_movement in visual_movements:
+                root_path = _movement_root(config, visual_movement)
+                if args.delete_calculated:
+                    _delete_existing(args, root_path)
+                if args.rebuild_store:
+                    _rebuild_store(root_path)
+                if args.dry_run:
+                    _dry_run(args, root_path, visual_movement, case_filter)
+                else:
+                    _calculate_existing_mean(
+                        args, root_path, visual_movement, case_filter, selected_aspects, selected_metrics
+                    )
+        return
+
+    _load_worldscore()
     if not _DROID_AVAILABLE:
         if "camera_control" in selected_aspects or "camera_error" in selected_metrics:
             raise RuntimeError("droid is missing; remove camera_control/camera_error from metrics to proceed.")
 
     _apply_metric_filter(selected_metrics)
+    _record_startup(args, started)
+
+    num_workers = args.num_jobs
+    gpu_ids = _gpu_ids(args.device)
+    if args.device == "cuda" and args.gpu_packing == "memory":
+        inventory = device_inventory(args.gpu_inventory)
+        if inventory:
+            # 按所选指标的显存占用估计，每张卡放下尽可能多的 worker
+            metrics = [
+                metric_name
+                for aspect, info in aspect_info.items()
+                if not selected_aspects or aspect in selected_aspects
+                for metric_name in info["metrics"]
+            ]
+            table, calibration = load_memory_table(args.memory_table)
+            footprint, source = estimate_footprint(metrics, table, calibration)
+            gpu_ids = plan_workers(inventory, footprint, args.num_jobs, args.gpu_memory_fraction)
+            num_workers = len(gpu_ids)
+            print(f"GPU packing: {describe_plan(gpu_ids, footprint, source)}")
+    if num_workers <= 0:
+        num_workers = len(gpu_ids)
+    if args.trace_dir and not args.only_calc_mean:
+        removed = reset_traces(args.trace_dir, args.shard_index, args.num_shards)
+        if removed:
+            print(f"Removed {removed} trace file(s) of an earlier run from {args.trace_dir}")
+    # 进程池跨 visual_movement 复用，torch/WorldScore 导入和模型加载每个 GPU 只发生一次
+    pool = EvalPool(
+        max(num_workers, 1),
+        setup=_init_worker,
+        runner=_run_chunk,
+        setup_args=(
+            selected_metrics,
+            {"depth": args.prefetch_depth, "max_bytes": args.prefetch_mb << 20, "threads": args.prefetch_threads},
+            {
+                "hooks": args.frame_cache_hook,
+                "dir": args.frame_cache_dir,
+                "max_bytes": int(args.frame_cache_gb * (1 << 30)),
+            },
+            {
+                "dir": args.trace_dir,
+                "shard_index": args.shard_index,
+                "per_metric": args.trace_granularity == "metric",
+            },
+            {
+                "adapters": args.batch_metric,
+                "batch_size": args.metric_batch_size,
+            },
+        ),
+        device=args.device,
+        gpu_ids=gpu_ids,
+        hint=_hint_chunk,
+        lookahead=1 if args.prefetch_depth > 0 else 0,
+        oom_retries=args.oom_retries,
+        oom_backoff=args.oom_backoff,
+    )
+    telemetry = Telemetry(
+        args.shard_index, args.telemetry_dir, args.telemetry_port, args.telemetry_interval, stall_seconds=args.stall_seconds
+    ).start()
+    try:
+        for label, config in configs:
+            run_args = args
+            telemetry.label = label
+            if label:
+                print(f"=== checkpoint {label} ===")
+                run_args = argparse.Namespace(**vars(args))
+                if args.partial_dir:
+                    run_args.partial_dir = os.path.join(args.partial_dir, label)
+                if args.work_ledger:
+                    run_args.work_ledger = os.path.join(args.work_ledger, label)
+            start = time.perf_counter()
+            _evaluate_movements(
+                run_args, config, visual_movements, case_filter, selected_aspects, selected_metrics, pool, telemetry
+            )
+            if label:
+                print(f"=== checkpoint {label} finished in {time.perf_counter() - start:.1f}s ===")
+    finally:
+        pool.close()
+        telemetry.close()
+    if args.trace_dir and not args.only_calc_mean:
+        print_summary(summarize(args.trace_dir))
 
+
+def _gpu_ids(device):
+    visible = [g.strip() for g in os.environ.get("CUDA_VISIBLE_DEVICES", "").split(",") if g.strip()]
+    if device == "cuda" and visible:
+        # 流水线模式下父进程只看到分给评测的那几张卡，worker 要绑定到对应的物理编号
+        return visible
+    if device == "cuda":
+        # WorldScore 已经把 torch 导入进来了，这里不再有额外开销
+        import torch
+
+        if torch.cuda.is_available():
+            return list(range(torch.cuda.device_count()))
+    return [0]
+
+
+def _evaluate_movements(args, config, visual_movements, case_filter, selected_aspects, selected_metrics, pool, telemetry):
+    streams = []
     for visual_movement in visual_movements:
-        config["visual_movement"] = visual_movement
-        evaluator = Evaluator(config)
-        if selected_metrics:
-            available_aspects = list(aspect_info.keys())
-            if selected_aspects:
-                aspect_list = [a for a in selected_aspects if a in available_aspects]
-            else:
-                aspect_list = available_aspects
+        movement = _prepare_movement(args, config, visual_movement, selected_aspects, selected_metrics)
+        if args.only_calc_mean:
+            # --invalidate-metric 需要 aspect_info 才走到这里；只读取列式结果库，不再遍历整棵输出目录
+            _calculate_existing_mean(
+                args, movement["root_path"], visual_movement, case_filter, movement["aspect_list"], []
+            )
+        elif args.follow:
+            streams.append(movement)
         else:
-            aspect_list = selected_aspects or evaluator.build_full_aspect_list()
+            _evaluate_movement(args, movement, case_filter, pool, telemetry)
+    if streams:
+        _follow_movements(args, streams, case_filter, pool, telemetry)
+
+
+def _prepare_movement(args, config, visual_movement, selected_aspects, selected_metrics):
+    config = dict(config, visual_movement=visual_movement)
+    evaluator = Evaluator(config)
+    if selected_metrics:
+        available_aspects = list(aspect_info.keys())
+        if selected_aspects:
+            aspect_list = [a for a in selected_aspects if a in available_aspects]
+        else:
+            aspect_list = available_aspects
+    else:
+        aspect_list = selected_aspects or evaluator.build_full_aspect_list()
+
+    if args.delete_calculated:
+        _delete_existing(args, evaluator.root_path)
+    if args.invalidate_metric:
+        invalidated = set()
+        for name in args.invalidate_metric:
+            invalidated.update(aspect_info[name]["metrics"] if name in aspect_info else [name])
+        bump_metric_epochs(evaluator.root_path, sorted(invalidated))
+    if args.rebuild_store:
+        _rebuild_store(evaluator.root_path)
+
+    return {
+        "visual_movement": visual_movement,
+        "config": config,
+        "evaluator": evaluator,
+        "root_path": evaluator.root_path,
+        "aspect_list": aspect_list,
+        "cells": _selected_cells(aspect_list),
+        "metric_epochs": load_metric_epochs(evaluator.root_path),
+        "generation": load_generation(evaluator.root_path),
+        "output_path": os.path.join(
+            config["runs_root"],
+            config["output_dir"],
+            f"worldscore_filtered_{visual_movement}.json",
+        ),
+    }
+
+
+def _payloads(args, movement, instances):
+    return [
+        {
+            "config": dict(movement["config"]),
+            "visual_movement": movement["visual_movement"],
+            "aspect_list": movement["aspect_list"],
+            "cells": movement["cells"],
+            "metric_epochs": movement["metric_epochs"],
+            "generation": movement["generation"],
+            "instances": chunk,
+        }
+        for chunk in chunk_instances(instances, args.chunk_size)
+    ]
+
 
-        if args.delete_calculated:
-            _delete_existing(evaluator.root_path)
+def _finish_movement(args, movement, evaluations, assigned):
+    if args.partial_dir:
+        partial = build_partial(
+            evaluations,
+            assigned,
+            movement["visual_movement"],
+            args.shard_index,
+            args.num_shards,
+            movement["aspect_list"],
+            movement["output_path"],
+        )
+        write_partial(args.partial_dir, partial)
+    if assigned and not args.skip_mean:
+        # 读本次评测写入的那一代；运行期间被 --delete-calculated 换代时不会混入新一代的空结果库
+        # 与分片合并一样只平均本次分到的实例，结果库里更早、过滤条件不同的运行留下的实例不混进来
+        scores = _restrict_scores(load_scores(movement["root_path"], movement["generation"]), assigned)
+        _write_movement_scores(
+            args, movement["root_path"], movement["visual_movement"], movement["aspect_list"], movement["output_path"], scores
+        )
 
-        instances = _collect_instances(evaluator.root_path, visual_movement, filters, evaluator)
+
+def _on_progress(telemetry):
+    return lambda worker_id, event: telemetry.record(event)
+
+
+def _evaluate_movement(args, movement, case_filter, pool, telemetry):
+    visual_movement = movement["visual_movement"]
+    instances = _collect_instances(
+        movement["root_path"],
+        visual_movement,
+        case_filter,
+        movement["evaluator"],
+        use_manifest=not args.ignore_manifest,
+    )
+    if not instances:
+        print(f"No instances found for {visual_movement}")
+        _finish_movement(args, movement, {}, [])
+        return
+    if args.work_ledger:
+        _evaluate_movement_ledger(args, movement, instances, pool, telemetry)
+        return
+    if args.early_stop_halfwidth > 0:
+        _evaluate_movement_early_stop(args, movement, instances, pool, telemetry)
+        return
+
+    if args.num_shards > 1:
+        instances = [inst for idx, inst in enumerate(instances) if idx % args.num_shards == args.shard_index]
         if not instances:
-            print(f"No instances found for {visual_movement}")
-            continue
+            print(f"No instances for shard {args.shard_index}/{args.num_shards} ({visual_movement})")
+            _finish_movement(args, movement, {}, [])
+            return
 
-        if args.num_shards > 1:
-            if args.shard_index < 0 or args.shard_index >= args.num_shards:
-                raise ValueError(f"Invalid shard-index {args.shard_index} for num-shards {args.num_shards}")
-            instances = [inst for idx, inst in enumerate(instances) if idx % args.num_shards == args.shard_index]
-            if not instances:
-                print(f"No instances for shard {args.shard_index}/{args.num_shards} ({visual_movement})")
-                continue
+    run_stats = _new_run_stats()
+    shard_evaluations = {}
+    store = ResultStore(movement["root_path"], shard_index=args.shard_index, generation=movement["generation"])
+    telemetry.begin(visual_movement, len(instances))
 
-        if args.only_calc_mean:
-            _calculate_existing_mean(evaluator.root_path, aspect_list)
-            continue
+    def _on_result(payload, ok, result):
+        if ok and result:
+            for key in run_stats:
+                run_stats[key] += result[key]
+            store.append(result["evaluations"])
+            shard_evaluations.update(result["evaluations"])
+        elif not ok:
+            telemetry.fail(visual_movement, ["/".join(inst[:-1]) for inst in payload["instances"]])
 
-        batch_size = max(len(instances) // max(args.num_jobs, 1), 1)
-        instance_batches = [
-            instances[start_idx : start_idx + batch_size]
-            for start_idx in range(0, len(instances), batch_size)
-        ]
-
-        if args.num_jobs > 1:
-            try:
-                ctx = mp.get_context("spawn")
-            except RuntimeError:
-                ctx = mp
-            queue = ctx.Queue()
-            processes = []
-
-            num_gpus = torch.cuda.device_count() if torch.cuda.is_available() else 1
-            active_jobs = min(len(instance_batches), args.num_jobs)
-
-            for i in range(active_jobs):
-                batch = instance_batches[i]
-                gpu_id = i % num_gpus
-                p = ctx.Process(
-                    target=_worker_wrapper,
-                    args=(gpu_id, config, batch, aspect_list, visual_movement, queue),
-                )
-                processes.append(p)
-                p.start()
-
-            for _ in range(active_jobs):
-                success = queue.get()
-                if not success:
-                    print("Warning: A worker failed during evaluation.")
-            for p in processes:
-                p.join()
-        else:
-            # 单进程下，直接遍历计算，不需要存到列表里
-            for batch in instance_batches:
-                process_batch(
-                    config=config,
-                    instance_batch=batch,
-                    aspect_list=aspect_list,
-                    visual_movement=visual_movement,
-                )
+    start = time.perf_counter()
+    try:
+        worker_stats = pool.run(
+            _payloads(args, movement, instances), on_result=_on_result, on_progress=_on_progress(telemetry)
+        )
+    finally:
+        store.close()
+    print_worker_stats(worker_stats, time.perf_counter() - start, visual_movement)
+    _print_run_stats(run_stats, visual_movement)
+    _finish_movement(args, movement, shard_evaluations, ["/".join(inst[:-1]) for inst in instances])
 
-        # 删除了 batch_results 列表和 deep_update(evaluator.metrics_results, result) 循环。
-        # 因为下一行的 _collect_metrics 逻辑会从硬盘重新读取结果来算分。
 
-        if not args.skip_mean:
-            metrics_results = defaultdict(lambda: defaultdict(list))
-            _collect_metrics(evaluator.root_path, metrics_results)
-            output_path = os.path.join(
-                config["runs_root"],
-                config["output_dir"],
-                f"worldscore_filtered_{visual_movement}.json",
+def _evaluate_movement_ledger(args, movement, instances, pool, telemetry):
+    # 各节点从共享账本按块领取实例，先做完的节点继续领取剩余的块；节点失联后其租约过期被其它节点收回
+    visual_movement = movement["visual_movement"]
+    by_key = {"/".join(inst[:-1]): inst for inst in instances}
+    ledger = WorkLedger(
+        os.path.join(args.work_ledger, visual_movement),
+        list(by_key),
+        block_size=args.chunk_size,
+        node_rank=args.shard_index,
+        num_nodes=args.num_shards,
+        lease_timeout=args.lease_timeout,
+        retries=args.ledger_retries,
+    ).start()
+    target = pool.num_workers * (pool.lookahead + 1) + 1
+    outstanding = {}
+    evaluations = {}
+    completed = []
+    completed_set = set()
+    run_stats = _new_run_stats()
+    store = ResultStore(movement["root_path"], shard_index=args.shard_index, generation=movement["generation"])
+    # 账本模式下各节点领取量不固定，进度按整个 visual_movement 计，各节点的完成数在 run_status.json 中相加
+    telemetry.begin(visual_movement, len(by_key), scope="run")
+
+    def _feed():
+        payloads = []
+        if len(outstanding) < target:
+            for block, keys in ledger.claim(target - len(outstanding)):
+                payload = _payloads(args, movement, [by_key[key] for key in keys])[0]
+                payload["block"] = block
+                outstanding[block] = keys
+                payloads.append(payload)
+        finished = not outstanding and not payloads and ledger.all_done()
+        return payloads, finished
+
+    def _on_result(payload, ok, result):
+        keys = outstanding.pop(payload["block"])
+        if ok and result:
+            for key in run_stats:
+                run_stats[key] += result[key]
+            store.append(result["evaluations"])
+            evaluations.update(result["evaluations"])
+        elif not ok:
+            telemetry.fail(visual_movement, keys)
+        # 失败的块会被重新领取（可能在本节点），同一实例只计一次
+        completed.extend(key for key in keys if key not in completed_set)
+        completed_set.update(keys)
+        ledger.complete(payload["block"], ok)
+
+    start = time.perf_counter()
+    try:
+        worker_stats = pool.run(
+            [], on_result=_on_result, feed=_feed, poll_interval=args.ledger_poll, on_progress=_on_progress(telemetry)
+        )
+    finally:
+        store.close()
+        ledger.close()
+    print_worker_stats(worker_stats, time.perf_counter() - start, visual_movement)
+    _print_run_stats(run_stats, visual_movement)
+    print(
+        f"[{visual_movement}] ledger: {ledger.stats['claimed']} block(s) claimed, {ledger.stats['stolen']} reclaimed "
+        f"from lost nodes, {ledger.stats['retried']} retried after failures, "
+        f"{len(completed)} of {len(by_key)} instance(s) evaluated here"
+    )
+    # 分片聚合只覆盖本节点做过的实例；所有块完成后结果库里已有全部实例，均分直接从结果库计算
+    partial_args = argparse.Namespace(**vars(args))
+    partial_args.skip_mean = True
+    _finish_movement(partial_args, movement, evaluations, completed)
+    if not args.skip_mean:
+        scores = _restrict_scores(load_scores(movement["root_path"], movement["generation"]), by_key)
+        _write_movement_scores(
+            args, movement["root_path"], visual_movement, movement["aspect_list"], movement["output_path"], scores
+        )
+
+
+def _evaluate_movement_early_stop(args, movement, instances, pool, telemetry):
+    # 按分层随机顺序提交，每完成一块更新各 aspect 的置信区间；全部收窄到阈值以下后不再提交新块，在途的块照常收回
+    visual_movement = movement["visual_movement"]
+    order = stratified_order(instances, args.early_stop_seed)
+    estimate = SequentialEstimate(
+        movement["aspect_list"],
+        len(order),
+        args.early_stop_halfwidth,
+        args.early_stop_confidence,
+        args.early_stop_min_instances,
+    )
+    target = pool.num_workers * (pool.lookahead + 1) + 1
+    cursor = 0
+    outstanding = 0
+    failed = 0
+    run_stats = _new_run_stats()
+    store = ResultStore(movement["root_path"], shard_index=args.shard_index, generation=movement["generation"])
+    telemetry.begin(visual_movement, None)
+
+    def _feed():
+        nonlocal cursor, outstanding
+        payloads = []
+        if not estimate.converged():
+            while outstanding < target and cursor < len(order):
+                chunk = order[cursor : cursor + args.chunk_size]
+                cursor += len(chunk)
+                outstanding += 1
+                payloads.extend(_payloads(args, movement, chunk))
+                telemetry.extend(visual_movement, len(chunk))
+        finished = estimate.converged() or (cursor >= len(order) and not payloads)
+        return payloads, finished
+
+    def _on_result(payload, ok, result):
+        # 进程池放弃的块（worker 反复崩溃、显存不足）也以 ok=False 回到这里，释放提交名额并计为失败
+        nonlocal outstanding, failed
+        outstanding -= 1
+        if ok and result:
+            for key in run_stats:
+                run_stats[key] += result[key]
+            store.append(result["evaluations"])
+            for instance_key, evaluation in result["evaluations"].items():
+                estimate.add(instance_key, evaluation)
+        elif not ok:
+            failed += len(payload["instances"])
+            telemetry.fail(visual_movement, ["/".join(inst[:-1]) for inst in payload["instances"]])
+
+    start = time.perf_counter()
+    try:
+        worker_stats = pool.run(
+            [], on_result=_on_result, feed=_feed, poll_interval=0.5, on_progress=_on_progress(telemetry)
+        )
+    finally:
+        store.close()
+    print_worker_stats(worker_stats, time.perf_counter() - start, visual_movement)
+    _print_run_stats(run_stats, visual_movement)
+
+    summary = estimate.summary(visual_movement, args.early_stop_seed, cursor, failed)
+    summary_file = write_summary(summary, movement["output_path"])
+    print(
+        f"[{visual_movement}] early stop: {summary['instances_used']} of {len(order)} instance(s) used "
+        f"({summary['fraction_used']:.1%}), {'converged' if summary['converged'] else 'not converged'} at "
+        f"±{args.early_stop_halfwidth} ({args.early_stop_confidence:.0%}): {summary_file}"
+    )
+    if failed:
+        print(f"Warning: [{visual_movement}] {failed} submitted instance(s) failed and are not in the estimate")
+    for aspect, row in summary["aspects"].items():
+        mean = "-" if row["mean"] is None else f"{row['mean']:.2f}"
+        halfwidth = "-" if row["halfwidth"] is None else f"±{row['halfwidth']:.2f}"
+        print(f"  {aspect:<28} {mean:>8} {halfwidth:>8}  n={row['n']}")
+    if estimate.instances and not args.skip_mean:
+        # 均分和报告只用这次抽到的实例，结果库里其它（例如更早全量评测留下的）实例不混进来
+        scores = _restrict_scores(load_scores(movement["root_path"], movement["generation"]), estimate.instances)
+        _write_movement_scores(
+            args, movement["root_path"], visual_movement, movement["aspect_list"], movement["output_path"], scores
+        )
+
+
+def _follow_movements(args, movements, case_filter, pool, telemetry):
+    # 推理还在进行：边发现带完成记录的实例边提交，推理端发出结束信号后再做最后一次扫描
+    # 单机流水线不起心跳进程，这里不做失联检测；推理端没有发出结束信号时由 --follow-timeout 兜底
+    stream = Rendezvous(
+        args.shard_index,
+        file_dir=args.rendezvous_dir,
+        connect_timeout=5.0,
+        dead_after=None,
+    )
+    deadline = time.time() + args.follow_timeout if args.follow_timeout > 0 else None
+    by_name = {movement["visual_movement"]: movement for movement in movements}
+    assigned = {name: {} for name in by_name}
+    evaluations = {name: {} for name in by_name}
+    run_stats = _new_run_stats()
+    stores = {
+        name: ResultStore(movement["root_path"], shard_index=args.shard_index, generation=movement["generation"])
+        for name, movement in by_name.items()
+    }
+    for name in by_name:
+        telemetry.begin(name, 0)
+
+    def _feed():
+        finished = stream.released(STREAM_END, 1)
+        if not finished and deadline is not None and time.time() > deadline:
+            print(f"Warning: inference stream did not end within {args.follow_timeout}s; draining what exists.")
+            finished = True
+        payloads = []
+        for name, movement in by_name.items():
+            found = _collect_instances(
+                movement["root_path"],
+                name,
+                case_filter,
+                movement["evaluator"],
+                completed_only=True,
+                known=assigned[name],
+                use_manifest=not args.ignore_manifest,
             )
-            _calculate_mean_scores(metrics_results, aspect_list, output_path)
+            # 发现顺序随推理进度变化，按实例 key 的哈希分片才能保证各节点划分稳定
+            found = [inst for inst in found if _stream_shard(inst, args.num_shards) == args.shard_index]
+            for inst in found:
+                assigned[name]["/".join(inst[:-1])] = inst
+            telemetry.extend(name, len(found))
+            payloads.extend(_payloads(args, movement, found))
+        if payloads:
+            print(f"Submitting {sum(len(p['instances']) for p in payloads)} newly completed instance(s)", flush=True)
+        return payloads, finished
 
+    def _on_result(payload, ok, result):
+        if ok and result:
+            for key in run_stats:
+                run_stats[key] += result[key]
+            stores[payload["visual_movement"]].append(result["evaluations"])
+            evaluations[payload["visual_movement"]].update(result["evaluations"])
+        elif not ok:
+            telemetry.fail(payload["visual_movement"], ["/".join(inst[:-1]) for inst in payload["instances"]])
 
-def _collect_metrics(root_path, metrics_results):
-    if not root_path.exists():
-        return
-    for dirpath, dirnames, filenames in os.walk(root_path):
-        if "evaluation.json" not in filenames:
-            continue
-        eval_path = os.path.join(dirpath, "evaluation.json")
-        try:
-            with open(eval_path, "r", encoding="utf-8") as f:
-                instance_result_dict = json.load(f)
-        except Exception:
-            continue
-        for aspect, aspect_scores in instance_result_dict.items():
-            for metric_name, metric_score in aspect_scores.items():
-                if not metric_score:
-                    continue
-                metrics_results[aspect][metric_name].append(metric_score)
+    start = time.perf_counter()
+    try:
+        worker_stats = pool.run(
+            [], on_result=_on_result, feed=_feed, poll_interval=args.follow_interval, on_progress=_on_progress(telemetry)
+        )
+    finally:
+        for store in stores.values():
+            store.close()
+    label = "+".join(by_name)
+    print_worker_stats(worker_stats, time.perf_counter() - start, label)
+    _print_run_stats(run_stats, label)
+    for name, movement in by_name.items():
+        _finish_movement(args, movement, evaluations[name], list(assigned[name]))
+
+
+def _stream_shard(instance, num_shards):
+    return zlib.crc32("/".join(instance[:-1]).encode("utf-8")) % max(num_shards, 1)
+
+
+def _rebuild_store(root_path):
+    evaluations = {}
+    generation = load_generation(root_path)
+    if root_path.exists():
+        for dirpath, dirnames, filenames in os.walk(root_path):
+            # 旧代的 evaluation.json 等待后台回收，不计入当前代
+            if EVALUATION_FILENAME not in filenames or evaluation_generation(dirpath) != generation:
+                continue
+            instance_key = Path(os.path.relpath(dirpath, root_path)).as_posix()
+            evaluations[instance_key] = read_evaluation(dirpath)
+    remove_store(root_path)
+    with ResultStore(root_path) as store:
+        store.append(evaluations)
+    print(f"Imported {len(evaluations)} evaluation.json files into the result store under {root_path}")
+
+
+def _write_scores(scores, output_path):
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(scores, f, indent=2, ensure_ascii=True)
+    return scores
+
+
+def _write_movement_scores(args, root_path, visual_movement, aspect_list, output_path, scores=None):
+    if scores is None:
+        scores = load_scores(root_path)
+    keys, columns, matrix = scores
+    _write_scores(mean_scores(columns, matrix, aspect_list), str(output_path))
+    if args.report_resamples > 0:
+        # 分组均值和 bootstrap 置信区间与均分使用同一份结果库矩阵
+        group_by = [field.strip() for field in args.report_group_by.split(",") if field.strip()]
+        report = build_report(
+            keys, columns, matrix, visual_movement, aspect_list, group_by, args.report_resamples, args.report_confidence
+        )
+        prefix = write_report(report, report_prefix(output_path))
+        print(f"[{visual_movement}] report with {args.report_resamples} bootstrap resamples: {prefix}.json / .csv")
 
 
-def _calculate_existing_mean(root_path, aspect_list):
-    metrics_results = defaultdict(lambda: defaultdict(list))
-    _collect_metrics(root_path, metrics_results)
+def _restrict_scores(scores, instance_keys):
+    keys, columns, matrix = scores
+    keep = np.isin(np.array(keys, dtype=object), list(instance_keys))
+    return [key for key, kept in zip(keys, keep) if kept], columns, matrix[keep]
+
+
+def _calculate_existing_mean(args, root_path, visual_movement, case_filter, selected_aspects, selected_metrics):
+    if not has_store(root_path):
+        _rebuild_store(root_path)
+    # 只平均本次过滤条件选中、已有输出的实例，与评测运行和分片合并覆盖的集合相同
+    instances = _collect_instances(
+        root_path, visual_movement, case_filter, _OutputProbe(), use_manifest=not args.ignore_manifest
+    )
+    scores = _restrict_scores(load_scores(root_path), ["/".join(inst[:-1]) for inst in instances])
+    aspect_list = _store_aspects(scores[1], selected_aspects, selected_metrics)
     output_path = root_path / "worldscore_filtered_mean.json"
-    _calculate_mean_scores(metrics_results, aspect_list, str(output_path))
+    _write_movement_scores(args, root_path, visual_movement, aspect_list, output_path, scores)
 
 
-def _delete_existing(root_path: Path):
-    for dirpath, dirnames, filenames in os.walk(root_path):
-        if "evaluation.json" in filenames:
-            os.remove(os.path.join(dirpath, "evaluation.json"))
+def _store_aspects(columns, selected_aspects, selected_metrics):
+    # 不加载 aspect_info 时，以结果库里出现过的 aspect/metric 列代替完整的 aspect 列表
+    present = []
+    for column in columns:
+        aspect, _, metric_name = column.partition("/")
+        if selected_metrics and metric_name not in selected_metrics:
+            continue
+        if aspect not in present:
+            present.append(aspect)
+    return [a for a in selected_aspects if a in present] if selected_aspects else present
+
+
+def _dry_run(args, root_path, visual_movement, case_filter):
+    instances = _collect_instances(
+        root_path, visual_movement, case_filter, _OutputProbe(), use_manifest=not args.ignore_manifest
+    )
+    shards = [0] * max(args.num_shards, 1)
+    evaluated = 0
+    generation = load_generation(root_path)
+    for idx, inst in enumerate(instances):
+        shards[idx % len(shards)] += 1
+        if os.path.exists(os.path.join(inst[-1], EVALUATION_FILENAME)) and evaluation_generation(inst[-1]) == generation:
+            evaluated += 1
+    print(
+        f"[dry-run] {visual_movement}: {len(instances)} instance(s) under {root_path}, "
+        f"{evaluated} with {EVALUATION_FILENAME}, {len(instances) - evaluated} without"
+    )
+    if args.num_shards > 1:
+        print(f"[dry-run] {visual_movement}: per-shard instances {shards}; this is shard {args.shard_index}")
+
+
+def _delete_existing(args, root_path: Path):
+    # 只写一个代数文件，不遍历输出目录；仍在写旧代的其它节点不受影响，旧代结果留给对比，由后台进程回收
+    barrier = None
+    if args.num_shards > 1:
+        # 每个分片各加一次会把代数加 N 次，先开始的分片写进随即被跳过的代：只由分片 0 换代，其它分片在屏障之后读取
+        if "client" not in _GENERATION_RENDEZVOUS:
+            _GENERATION_RENDEZVOUS["client"] = Rendezvous(args.shard_index, file_dir=args.rendezvous_dir)
+        barrier = f"generation_{zlib.crc32(str(root_path).encode('utf-8')):08x}"
+        if args.shard_index != 0:
+            _GENERATION_RENDEZVOUS["client"].barrier(barrier, args.num_shards, args.barrier_timeout)
+            print(f"Results under {root_path} continue in generation {load_generation(root_path)} started by shard 0")
+            return
+    generation = bump_generation(root_path)
+    pid = collect_in_background(root_path, args.keep_generations)
+    print(
+        f"Results under {root_path} start over as generation {generation}; "
+        f"collecting generations older than {generation - args.keep_generations} in the background (pid {pid})"
+    )
+    if barrier is not None:
+        _GENERATION_RENDEZVOUS["client"].barrier(barrier, args.num_shards, args.barrier_timeout)
 
 
 if __name__ == "__main__":
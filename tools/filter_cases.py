@@ -1,92 +1,82 @@
 import argparse
 import json
 import os
-from typing import Any, Dict, List
 
-
-def _matches(value, allowed: List[str]) -> bool:
-    if not allowed:
-        return True
-    if value is None:
-        return False
-    return value in allowed
-
-
-def _matches_any(values, allowed: List[str]) -> bool:
-    if not allowed:
-        return True
-    if not values:
-        return False
-    return any(v in allowed for v in values)
-
-
-def _matches_contains(text: str, needles: List[str]) -> bool:
-    if not needles:
-        return True
-    if not text:
-        return False
-    return any(n in text for n in needles)
-
-
-def _filter_item(item: Dict[str, Any], filters: Dict[str, Any]) -> bool:
-    if not filters.get("enable", False):
-        return True
-
-    if not _matches(item.get("visual_movement"), filters.get("visual_movement", [])):
-        return False
-
-    if not _matches(item.get("visual_style"), filters.get("visual_style", [])):
-        return False
-
-    if not _matches(item.get("scene_type"), filters.get("scene_type", [])):
-        return False
-
-    if not _matches(item.get("motion_type"), filters.get("motion_type", [])):
-        return False
-
-    image_path = item.get("image", "")
-    image_name = os.path.basename(image_path)
-
-    if not _matches(image_name, filters.get("image_name", [])):
-        return False
-
-    if not _matches_contains(image_path, filters.get("image_contains", [])):
-        return False
-
-    camera_path = item.get("camera_path", [])
-    if not _matches_any(camera_path, filters.get("camera_path_any", [])):
-        return False
-
-    if not _matches(item.get("category"), filters.get("category", [])):
-        return False
-
-    instance_name = os.path.splitext(image_name)[0]
-    if not _matches(instance_name, filters.get("instance", [])):
-        return False
-
-    return True
+from case_filter import CaseFilter, CaseIndex, CaseWriter, iter_cases
+from completion import resolve_runs_root
+from infer_plan import build_plan, describe_plan, load_history, plan_path, plan_ranks
+from sweep import load_manifest, manifest_path, sweep_checkpoints
+
+
+def _counted(items, counter):
+    for item in items:
+        counter[0] += 1
+        yield item
+
+
+def _write_plans(cfg, cases_json, nnodes):
+    compute = cfg.get("compute", {})
+    history = load_history(compute.get("infer_cost_history", ""))
+    runs = [("", cfg)]
+    if sweep_checkpoints(cfg):
+        # 每个 checkpoint 的输出目录不同，已完成的实例也不同，各自一份计划
+        runs = []
+        for entry in load_manifest(manifest_path(cfg)):
+            with open(entry["config_json"], "r", encoding="utf-8") as f:
+                runs.append((entry["label"], json.load(f)))
+    for label, run_cfg in runs:
+        path = plan_path(cfg, label)
+        plan = build_plan(
+            iter_cases(cases_json),
+            run_cfg,
+            resolve_runs_root(run_cfg),
+            os.path.dirname(path),
+            nnodes,
+            plan_ranks(run_cfg),
+            history,
+        )
+        print(f"{describe_plan(plan)} -> {path}" + (f" [{label}]" if label else ""))
 
 
 def main() -> None:
     parser = argparse.ArgumentParser()
     parser.add_argument("--config-json", required=True, help="Resolved config JSON")
-    parser.add_argument("--input-json", required=True, help="Input sampled json")
-    parser.add_argument("--output-json", required=True, help="Filtered output json")
+    parser.add_argument("--input-json", required=True, help="Input sampled json (JSON array or JSONL)")
+    parser.add_argument("--output-json", required=True, help="Filtered output json (.jsonl for JSON lines)")
+    parser.add_argument(
+        "--index-dir",
+        default="",
+        help="Reusable inverted index over the input; built on first use and rebuilt when the input changes",
+    )
+    parser.add_argument(
+        "--plan",
+        action="store_true",
+        help="Also write the per-rank inference plan (compute.infer_plan) for the cases still missing outputs",
+    )
+    parser.add_argument("--nnodes", type=int, default=1, help="Nodes the plan is split across")
     args = parser.parse_args()
 
     with open(args.config_json, "r", encoding="utf-8") as f:
         cfg = json.load(f)
 
-    filters = cfg.get("filters", {})
-    with open(args.input_json, "r", encoding="utf-8") as f:
-        data = json.load(f)
+    case_filter = CaseFilter(cfg.get("filters", {}))
+    scanned = [0]
+    if args.index_dir and case_filter.enabled:
+        index = CaseIndex.open(args.input_json, args.index_dir)
+        total = index.count
+        items = index.query(case_filter)
+    else:
+        total = None
+        items = (item for item in _counted(iter_cases(args.input_json), scanned) if case_filter(item))
 
-    filtered = [item for item in data if _filter_item(item, filters)]
+    with CaseWriter(args.output_json) as writer:
+        for item in items:
+            writer.write(item)
 
-    with open(args.output_json, "w", encoding="utf-8") as f:
-        json.dump(filtered, f, indent=2, ensure_ascii=True)
+    print(f"Filtered {writer.count} / {total if total is not None else scanned[0]} cases")
 
-    print(f"Filtered {len(filtered)} / {len(data)} cases")
+    if args.plan and cfg.get("compute", {}).get("infer_plan", False):
+        _write_plans(cfg, args.output_json, args.nnodes)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,152 @@
+import functools
+import hashlib
+import importlib
+import json
+import os
+
+import numpy as np
+
+DEFAULT_CACHE_DIR = "/tmp/worldscore_frame_cache"
+
+
+def _file_key(name, args, kwargs):
+    path = os.path.abspath(str(args[0]))
+    st = os.stat(path)
+    payload = json.dumps([name, path, st.st_size, st.st_mtime_ns, args[1:], kwargs], sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def _to_array(frames):
+    # 记录原始返回类型，命中时按同样的类型交还给调用方
+    if isinstance(frames, np.ndarray):
+        return frames, "ndarray"
+    if type(frames).__module__.startswith("torch") and hasattr(frames, "numpy"):
+        return frames.detach().cpu().numpy(), "tensor"
+    if isinstance(frames, (list, tuple)) and frames and all(isinstance(f, np.ndarray) for f in frames):
+        shapes = {f.shape for f in frames}
+        if len(shapes) == 1:
+            return np.stack(frames), "list"
+    return None, None
+
+
+def _from_array(array, kind):
+    if kind == "tensor":
+        import torch
+
+        return torch.from_numpy(array)
+    if kind == "list":
+        return list(array)
+    return array
+
+
+class FrameCache:
+    """Decoded frames kept as ``.npy`` files on local disk and served as memory maps.
+
+    Hits are opened copy-on-write (``mmap_mode="c"``), so every metric in a
+    worker reads the same pages without copying, and in-place edits by a
+    metric never reach the cache. Files are evicted least-recently-used once
+    the directory exceeds ``max_bytes``; all workers on a node share it.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=50 << 30):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+        self.stats = {"hits": 0, "misses": 0, "bypass": 0, "evicted": 0}
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.npy")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            array = np.load(path, mmap_mode="c")
+            with open(f"{path}.kind", "r", encoding="utf-8") as f:
+                kind = f.read().strip()
+        except (OSError, ValueError):
+            return None
+        # 命中时刷新 mtime，淘汰按 mtime 从旧到新进行
+        os.utime(path)
+        return array, kind
+
+    def put(self, key, array, kind):
+        path = self._path(key)
+        tmp_path = f"{path}.tmp.{os.getpid()}"
+        out = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=array.dtype, shape=array.shape)
+        out[...] = array
+        out.flush()
+        del out
+        with open(f"{path}.kind", "w", encoding="utf-8") as f:
+            f.write(kind)
+        os.replace(tmp_path, path)
+        self._evict(keep=path)
+        return np.load(path, mmap_mode="c")
+
+    def _evict(self, keep):
+        entries = []
+        total = 0
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if entry.name.endswith(".npy"):
+                    st = entry.stat()
+                    entries.append((st.st_mtime, entry.path, st.st_size))
+                    total += st.st_size
+        for _, path, size in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            for victim in (path, f"{path}.kind"):
+                try:
+                    os.remove(victim)
+                except OSError:
+                    pass
+            total -= size
+            self.stats["evicted"] += 1
+
+    def wrap(self, loader, name):
+        """Return ``loader`` with results for ``loader(path, ...)`` served from the cache."""
+
+        @functools.wraps(loader)
+        def cached_loader(*args, **kwargs):
+            if not args or not isinstance(args[0], (str, os.PathLike)) or not os.path.isfile(args[0]):
+                self.stats["bypass"] += 1
+                return loader(*args, **kwargs)
+            key = _file_key(name, args, kwargs)
+            hit = self.get(key)
+            if hit is not None:
+                self.stats["hits"] += 1
+                return _from_array(*hit)
+            frames = loader(*args, **kwargs)
+            array, kind = _to_array(frames)
+            if array is None:
+                self.stats["bypass"] += 1
+                return frames
+            self.stats["misses"] += 1
+            return _from_array(self.put(key, array, kind), kind)
+
+        cached_loader._frame_cache = True
+        return cached_loader
+
+    def install(self, hooks):
+        """Patch each ``"module:function"`` in ``hooks``; returns the ones that were found."""
+        installed = []
+        for spec in hooks:
+            module_name, _, attr = spec.partition(":")
+            try:
+                module = importlib.import_module(module_name)
+            except Exception:
+                print(f"Warning: frame cache hook {spec!r}: module not importable")
+                continue
+            loader = getattr(module, attr, None)
+            if loader is None:
+                print(f"Warning: frame cache hook {spec!r}: no such function")
+                continue
+            if not getattr(loader, "_frame_cache", False):
+                setattr(module, attr, self.wrap(loader, spec))
+            installed.append(spec)
+        return installed
+
+    def reset_stats(self):
+        stats, self.stats = self.stats, {key: 0 for key in self.stats}
+        return stats
@@ -0,0 +1,109 @@
+import argparse
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+from result_cache import (
+    EVALUATION_FILENAME,
+    bump_generation,
+    evaluation_generation,
+    load_generation,
+    load_generation_info,
+)
+from result_store import load_scores, mean_scores, remove_store, store_dir, stored_generations
+
+DEFAULT_KEEP = 1
+
+
+def _bumped_at(root_path, generation):
+    for entry in load_generation_info(root_path)["history"]:
+        if entry["generation"] == generation:
+            return entry["time"]
+    return 0.0
+
+
+def collect(root_path, keep=DEFAULT_KEEP, instances=True):
+    """Delete result generations older than the current one minus ``keep``; returns ``(stores, files)`` removed.
+
+    Stale ``evaluation.json`` files are only removed when they were last written
+    before the current generation started, so an instance that another node has
+    already re-evaluated in the new generation is left alone.
+    """
+    root_path = Path(root_path)
+    current = load_generation(root_path)
+    oldest = current - keep
+    stores = 0
+    for generation in stored_generations(root_path):
+        if generation < oldest:
+            remove_store(root_path, generation)
+            stores += 1
+    files = 0
+    if instances and current:
+        bumped = _bumped_at(root_path, current)
+        for dirpath, dirnames, filenames in os.walk(root_path):
+            if EVALUATION_FILENAME not in filenames:
+                continue
+            path = os.path.join(dirpath, EVALUATION_FILENAME)
+            try:
+                if os.stat(path).st_mtime < bumped and evaluation_generation(dirpath) < current:
+                    os.remove(path)
+                    files += 1
+            except FileNotFoundError:
+                continue
+    return stores, files
+
+
+def collect_in_background(root_path, keep=DEFAULT_KEEP):
+    """Run ``collect`` in a detached process that outlives the caller; output goes to the store's ``gc.log``."""
+    log_path = store_dir(root_path, 0) / "gc.log"
+    log_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(log_path, "a", encoding="utf-8") as log:
+        proc = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "gc", str(root_path), "--keep", str(keep)],
+            stdout=log,
+            stderr=subprocess.STDOUT,
+            stdin=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+    return proc.pid
+
+
+def compare(root_path, generations=None):
+    """``{generation: (instances, {aspect: score})}`` for every stored generation, for side-by-side comparison."""
+    result = {}
+    for generation in generations or stored_generations(root_path):
+        keys, columns, matrix = load_scores(root_path, generation)
+        aspect_list = list(dict.fromkeys(column.split("/", 1)[0] for column in columns))
+        result[generation] = (len(keys), mean_scores(columns, matrix, aspect_list))
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Inspect, bump, compare or garbage-collect result generations")
+    parser.add_argument("command", choices=["show", "bump", "compare", "gc"])
+    parser.add_argument("root_path", help="Visual-movement output directory, e.g. <runs_root>/static")
+    parser.add_argument("--keep", type=int, default=DEFAULT_KEEP, help="Older generations kept by gc")
+    parser.add_argument("--no-instances", action="store_true", help="gc: only delete old stores")
+    args = parser.parse_args()
+
+    root_path = Path(args.root_path)
+    if args.command == "bump":
+        print(f"{root_path}: now generation {bump_generation(root_path)}")
+    elif args.command == "gc":
+        stores, files = collect(root_path, args.keep, instances=not args.no_instances)
+        print(f"{root_path}: removed {stores} old store generation(s) and {files} stale {EVALUATION_FILENAME} file(s)")
+    elif args.command == "compare":
+        table = compare(root_path)
+        aspects = list(dict.fromkeys(aspect for _, scores in table.values() for aspect in scores))
+        print(f"{'aspect':<28}" + "".join(f"{'gen ' + str(g):>12}" for g in table))
+        print(f"{'instances':<28}" + "".join(f"{n:>12}" for n, _ in table.values()))
+        for aspect in aspects:
+            print(f"{aspect:<28}" + "".join(f"{scores.get(aspect, float('nan')):>12.2f}" for _, scores in table.values()))
+    else:
+        current = load_generation(root_path)
+        print(f"{root_path}: current generation {current}, stored {stored_generations(root_path)}")
+
+
+if __name__ == "__main__":
+    main()
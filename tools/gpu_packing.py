@@ -0,0 +1,165 @@
+import argparse
+import json
+import math
+import os
+import subprocess
+
+# 每个指标常驻模型加推理峰值的显存估计（MB），偏保守；实测值可用 --memory-table 覆盖或从追踪汇总校准
+DEFAULT_FOOTPRINT_MB = {
+    "camera_error": 14000,
+    "reprojection_error": 14000,
+    "object_detection": 6000,
+    "clip_score": 2500,
+    "clip_iqa+": 2500,
+    "musiq": 1500,
+    "gram_matrix": 1500,
+    "optical_flow_aepe": 4000,
+    "optical_flow": 4000,
+    "motion_accuracy": 6000,
+    "motion_smoothness": 10000,
+}
+WORKER_BASE_MB = 1500
+
+
+def load_memory_table(path):
+    """Read ``{metric: mb}`` overrides, or a ``trace_summary.json`` from a traced run as calibration.
+
+    Returns ``(table, calibration)``: a trace summary yields per-metric peaks
+    and the worker peak (spans record absolute allocated memory, so the
+    largest one is what a worker running those metrics needed).
+    """
+    if not path:
+        return {}, None
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if isinstance(data.get("metrics"), dict) and all(isinstance(v, dict) for v in data["metrics"].values()):
+        peaks = {name: row.get("peak_mem_mb") for name, row in data["metrics"].items() if row.get("peak_mem_mb")}
+        if not peaks:
+            return {}, None
+        return {}, {"metrics": sorted(peaks), "worker_peak_mb": max(peaks.values())}
+    return {name: float(mb) for name, mb in data.items()}, None
+
+
+def estimate_footprint(metrics, table=None, calibration=None, base_mb=WORKER_BASE_MB):
+    """Peak device memory (MB) of one worker that keeps the models of ``metrics`` resident, and its source.
+
+    The footprint is ``None`` when a metric has no table entry or calibration;
+    ``plan_workers`` then places one worker per GPU rather than guess.
+    """
+    metrics = sorted(set(metrics))
+    if calibration and metrics and set(metrics) <= set(calibration["metrics"]):
+        return calibration["worker_peak_mb"] + base_mb, "calibration"
+    table = dict(DEFAULT_FOOTPRINT_MB, **(table or {}))
+    if not metrics:
+        # 未选择指标即全部指标
+        metrics = sorted(table)
+    unknown = [m for m in metrics if m not in table]
+    if unknown:
+        return None, f"no estimate for {', '.join(unknown)}"
+    return base_mb + sum(table[m] for m in metrics), "table"
+
+
+def device_inventory(spec=""):
+    """``[{"id", "total_mb", "free_mb"}]`` for every visible GPU.
+
+    ``spec`` (or ``EVAL_GPU_INVENTORY``) may be a JSON list or a path to one,
+    which replaces the query so placement can be exercised on CPU-only hosts.
+    """
+    spec = spec or os.environ.get("EVAL_GPU_INVENTORY", "")
+    if spec:
+        if os.path.exists(spec):
+            with open(spec, "r", encoding="utf-8") as f:
+                devices = json.load(f)
+        else:
+            devices = json.loads(spec)
+        return [
+            {"id": str(d["id"]), "total_mb": float(d["total_mb"]), "free_mb": float(d.get("free_mb", d["total_mb"]))}
+            for d in devices
+        ]
+    # 用 nvidia-smi 查询，避免在父进程里初始化 CUDA 占用每张卡的上下文显存
+    try:
+        out = subprocess.run(
+            ["nvidia-smi", "--query-gpu=index,memory.total,memory.used", "--format=csv,noheader,nounits"],
+            capture_output=True,
+            text=True,
+            check=True,
+            timeout=30,
+        ).stdout
+    except (OSError, subprocess.SubprocessError):
+        return []
+    devices = []
+    for line in out.strip().splitlines():
+        index, total, used = (field.strip() for field in line.split(","))
+        devices.append({"id": index, "total_mb": float(total), "free_mb": float(total) - float(used)})
+    visible = [g.strip() for g in os.environ.get("CUDA_VISIBLE_DEVICES", "").split(",") if g.strip()]
+    if visible:
+        devices = [d for d in devices if d["id"] in visible]
+    return devices
+
+
+def plan_workers(inventory, footprint_mb, max_workers=0, memory_fraction=0.9):
+    """Place workers on GPUs so each GPU's resident footprint stays within ``memory_fraction`` of its free memory.
+
+    Returns one GPU id per worker. Workers go to the GPU with the most room
+    left, so fewer workers than capacity are spread evenly. ``max_workers <= 0``
+    fills every GPU. A GPU too small for even one worker still gets one, since
+    metrics may fit after all; a warning is printed. Without a footprint
+    (``None``) every GPU holds one worker.
+    """
+    capacity = {}
+    for device in inventory:
+        if footprint_mb is None:
+            capacity[device["id"]] = 1
+            continue
+        budget = device["free_mb"] * memory_fraction
+        capacity[device["id"]] = int(budget // footprint_mb) if footprint_mb > 0 else 0
+        if capacity[device["id"]] == 0:
+            print(
+                f"Warning: GPU {device['id']} has {device['free_mb']:.0f} MB free, below the estimated "
+                f"{footprint_mb:.0f} MB per worker; placing a single worker there."
+            )
+            capacity[device["id"]] = 1
+    total = sum(capacity.values())
+    wanted = total if max_workers <= 0 else min(max_workers, total)
+    if max_workers > total:
+        print(f"Warning: {max_workers} workers requested but only {total} fit in GPU memory; using {total}.")
+    placed = {gpu: 0 for gpu in capacity}
+    plan = []
+    for _ in range(wanted):
+        gpu = max(capacity, key=lambda g: (capacity[g] - placed[g], -placed[g]))
+        placed[gpu] += 1
+        plan.append(gpu)
+    return plan
+
+
+def describe_plan(plan, footprint_mb, source):
+    counts = {}
+    for gpu in plan:
+        counts[gpu] = counts.get(gpu, 0) + 1
+    per_gpu = ", ".join(f"GPU {gpu}: {n}" for gpu, n in counts.items())
+    size = f"~{math.ceil(footprint_mb)} MB each" if footprint_mb is not None else "one per GPU"
+    return f"{len(plan)} worker(s), {size} ({source}); {per_gpu}"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Show how evaluation workers would be packed onto GPUs")
+    parser.add_argument("--metrics", default="", help="Comma-separated metric names (empty = all)")
+    parser.add_argument("--memory-table", default="", help="{metric: MB} JSON or a trace_summary.json")
+    parser.add_argument("--inventory", default="", help="JSON list (or file) of {id, total_mb, free_mb}; default queries nvidia-smi")
+    parser.add_argument("--max-workers", type=int, default=0)
+    parser.add_argument("--memory-fraction", type=float, default=0.9)
+    args = parser.parse_args()
+
+    table, calibration = load_memory_table(args.memory_table)
+    metrics = [m.strip() for m in args.metrics.split(",") if m.strip()]
+    footprint, source = estimate_footprint(metrics, table, calibration)
+    inventory = device_inventory(args.inventory)
+    if not inventory:
+        raise SystemExit("No GPUs found; pass --inventory to plan for a given device list")
+    plan = plan_workers(inventory, footprint, args.max_workers, args.memory_fraction)
+    print(describe_plan(plan, footprint, source))
+    print(json.dumps(plan))
+
+
+if __name__ == "__main__":
+    main()
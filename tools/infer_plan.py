@@ -0,0 +1,150 @@
+import argparse
+import heapq
+import json
+import os
+
+from case_filter import CaseWriter
+from completion import expected_instance_dir, is_complete
+
+PLAN_FILENAME = "plan.json"
+PLAN_DIRNAME = "infer_plan"
+
+
+def plan_path(cfg, label=""):
+    return os.path.join(cfg.get("paths", {}).get("run_dir", "."), PLAN_DIRNAME, label, PLAN_FILENAME)
+
+
+def load_history(path):
+    """``{instance_key: seconds}`` from a JSONL of ``{"instance": "<movement>/<...>/<instance>", "seconds": s}``."""
+    history = {}
+    if not path or not os.path.exists(path):
+        return history
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                history[record["instance"]] = float(record["seconds"])
+    return history
+
+
+def case_cost(item, cfg):
+    """Relative generation cost: frames x pixels x segments, weighted by visual movement.
+
+    Static cases render one clip per ``camera_path`` segment; per-case
+    ``frames``/``resolution`` override the run's defaults.
+    """
+    compute = cfg.get("compute", {})
+    defaults = dict(cfg.get("wan", {}), **cfg.get("worldscore", {}).get("config_overrides", {}))
+    frames = float(item.get("frames", defaults.get("frames", 81)))
+    height, width = item.get("resolution", defaults.get("resolution", [720, 720]))
+    segments = 1
+    if item.get("visual_movement") == "static":
+        segments = max(len(item.get("camera_path") or []), 1)
+        weight = float(compute.get("infer_plan_static_weight", 1.0))
+    else:
+        weight = float(compute.get("infer_plan_dynamic_weight", 1.0))
+    return frames * height * width * segments * weight
+
+
+def assign_lpt(costs, num_ranks):
+    """Longest-processing-time-first: each case, largest first, goes to the least-loaded rank."""
+    loads = [(0.0, rank) for rank in range(num_ranks)]
+    assignment = [[] for _ in range(num_ranks)]
+    totals = [0.0] * num_ranks
+    for index in sorted(range(len(costs)), key=lambda i: -costs[i]):
+        load, rank = heapq.heappop(loads)
+        assignment[rank].append(index)
+        totals[rank] = load + costs[index]
+        heapq.heappush(loads, (totals[rank], rank))
+    return assignment, totals
+
+
+def build_plan(items, cfg, runs_root, plan_dir, nnodes, ranks_per_node, history=None):
+    """Split the cases still missing outputs across ``nnodes * ranks_per_node`` ranks; writes one case file per rank.
+
+    A case is skipped only when its instance carries a completion record;
+    outputs without one may be truncated by a crash and are generated again.
+    Historical timings, when given, replace the modelled cost; the model is
+    scaled to seconds by the median ratio over the cases that have both so
+    the two mix on one scale.
+    """
+    history = history or {}
+    pending, keys, skipped = [], [], 0
+    for item in items:
+        instance_dir = expected_instance_dir(runs_root, item)
+        if instance_dir and is_complete(instance_dir):
+            skipped += 1
+            continue
+        pending.append(item)
+        keys.append(os.path.relpath(instance_dir, runs_root) if instance_dir else "")
+
+    modelled = [case_cost(item, cfg) for item in pending]
+    ratios = sorted(history[key] / cost for key, cost in zip(keys, modelled) if key in history and cost > 0)
+    scale = ratios[len(ratios) // 2] if ratios else 1.0
+    costs = [history.get(key, cost * scale) for key, cost in zip(keys, modelled)]
+
+    num_ranks = max(nnodes, 1) * max(ranks_per_node, 1)
+    assignment, totals = assign_lpt(costs, num_ranks)
+    os.makedirs(plan_dir, exist_ok=True)
+    ranks = []
+    for rank, indices in enumerate(assignment):
+        cases_json = os.path.join(plan_dir, f"rank_{rank:05d}.json")
+        with CaseWriter(cases_json) as writer:
+            # 同一 rank 内按原顺序生成，便于对照日志
+            for index in sorted(indices):
+                writer.write(pending[index])
+        ranks.append(
+            {
+                "rank": rank,
+                "node": rank // max(ranks_per_node, 1),
+                "local_rank": rank % max(ranks_per_node, 1),
+                "cases": len(indices),
+                "cost": round(totals[rank], 3),
+                "cases_json": cases_json,
+            }
+        )
+    busiest = max(totals) if totals else 0.0
+    plan = {
+        "nnodes": nnodes,
+        "ranks_per_node": ranks_per_node,
+        "cases_total": len(pending) + skipped,
+        "skipped_complete": skipped,
+        "planned": len(pending),
+        "cost_unit": "seconds" if ratios else "frames*pixels",
+        "history_matches": len(ratios),
+        "spread": round(busiest / min(totals) - 1, 4) if totals and min(totals) > 0 else None,
+        "ranks": ranks,
+    }
+    with open(os.path.join(plan_dir, PLAN_FILENAME), "w", encoding="utf-8") as f:
+        json.dump(plan, f, indent=2, ensure_ascii=True)
+    return plan
+
+
+def plan_ranks(cfg):
+    """Ranks per node as ``run_infer.sh`` launches them: one per GPU under data parallelism, else one."""
+    compute = cfg.get("compute", {})
+    num_gpus = int(compute.get("num_gpus", 1))
+    return num_gpus if compute.get("infer_use_dp", False) and num_gpus > 1 else 1
+
+
+def describe_plan(plan):
+    spread = f"{plan['spread']:.1%}" if plan["spread"] is not None else "-"
+    return (
+        f"Inference plan: {plan['planned']} case(s) over {len(plan['ranks'])} rank(s) "
+        f"({plan['skipped_complete']} already complete), cost spread {spread}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Show an inference plan's per-rank load")
+    parser.add_argument("plan_json")
+    args = parser.parse_args()
+    with open(args.plan_json, "r", encoding="utf-8") as f:
+        plan = json.load(f)
+    print(describe_plan(plan))
+    for rank in plan["ranks"]:
+        print(f"  rank {rank['rank']:>4} (node {rank['node']}, local {rank['local_rank']}): {rank['cases']:>6} case(s), cost {rank['cost']:.4g}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+import argparse
+import json
+import os
+import socket
+import time
+from pathlib import Path
+
+from result_cache import CONTENT_EXTENSIONS, _content_signature
+
+MANIFEST_DIRNAME = "manifest"
+INDEX_FILENAME = "index.jsonl"
+UNSEALED_FILENAME = "unsealed"
+SEGMENT_DIRNAME = "segments"
+# 与 WorldScore 输出目录层级一致
+LEVELS = {
+    "static": ("visual_style", "scene_type", "category", "instance"),
+    "dynamic": ("visual_style", "motion_type", "instance"),
+}
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mov", ".webm")
+
+
+def manifest_dir(movement_root):
+    # <output_dir>/manifest/<visual_movement>/，与结果库 <output_dir>/results/ 并列，不混进实例目录树
+    movement_root = Path(movement_root)
+    return movement_root.parent / MANIFEST_DIRNAME / movement_root.name
+
+
+def locate(instance_dir):
+    """``(movement_root, visual_movement, names)`` of an instance directory, or ``None`` outside a WorldScore tree."""
+    instance_dir = Path(instance_dir).absolute()
+    for visual_movement, levels in LEVELS.items():
+        parents = instance_dir.parents
+        if len(parents) > len(levels) - 1 and parents[len(levels) - 1].name == visual_movement:
+            movement_root = parents[len(levels) - 1]
+            return movement_root, visual_movement, instance_dir.relative_to(movement_root).parts
+    return None
+
+
+def instance_record(movement_root, instance_dir, status=None, signature=None):
+    if signature is None:
+        signature = _content_signature(Path(instance_dir))
+    media = [relpath.lower() for relpath, _, _ in signature if relpath.lower().endswith(CONTENT_EXTENSIONS)]
+    videos = sum(1 for relpath in media if relpath.endswith(VIDEO_EXTENSIONS))
+    return {
+        "key": Path(instance_dir).absolute().relative_to(Path(movement_root).absolute()).as_posix(),
+        "frames": len(media) - videos,
+        "videos": videos,
+        "bytes": sum(size for _, size, _ in signature),
+        "status": status or ("complete" if media else "missing"),
+        "time": time.time(),
+    }
+
+
+def append_record(movement_root, record):
+    """Append one record to this process's segment; a single ``O_APPEND`` write per line."""
+    segment_dir = manifest_dir(movement_root) / SEGMENT_DIRNAME
+    segment_dir.mkdir(parents=True, exist_ok=True)
+    line = (json.dumps(record, ensure_ascii=True) + "\n").encode("utf-8")
+    fd = os.open(segment_dir / f"{socket.gethostname()}-{os.getpid()}.jsonl", os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+    try:
+        os.write(fd, line)
+    finally:
+        os.close(fd)
+
+
+def write_index(movement_root, records, sealed=True):
+    """Write the index; ``sealed=False`` marks it as possibly missing instances until the next sealed write."""
+    directory = manifest_dir(movement_root)
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / INDEX_FILENAME
+    if not sealed:
+        # 先打标记再写索引，中途退出时也不会留下一个看起来完整的旧索引
+        (directory / UNSEALED_FILENAME).write_text(f"{time.time()}\n", encoding="utf-8")
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for record in sorted(records, key=lambda r: r["key"].split("/")):
+            f.write(json.dumps(record, ensure_ascii=True) + "\n")
+    os.replace(tmp_path, path)
+    if sealed:
+        try:
+            os.remove(directory / UNSEALED_FILENAME)
+        except FileNotFoundError:
+            pass
+    return path
+
+
+def is_sealed(movement_root):
+    directory = manifest_dir(movement_root)
+    return (directory / INDEX_FILENAME).exists() and not (directory / UNSEALED_FILENAME).exists()
+
+
+def _read_records(path, records):
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # 追加写到一半的最后一行
+                continue
+            previous = records.get(record["key"])
+            if previous is None or record["time"] >= previous["time"]:
+                records[record["key"]] = record
+
+
+def load_records(movement_root, unsealed=False):
+    """``{key: record}`` from the sealed index plus later segments, or ``None`` while there is no sealed index.
+
+    Only a sealed index is trusted as the full work set: segments alone hold
+    just the instances that happened to be published through ``mark_complete``,
+    and an index ``drop_records`` rewrote before a new inference run misses
+    whatever that run generates until it is sealed again (a multi-node
+    infer-only run never seals). ``unsealed=True`` returns such an index anyway.
+    """
+    directory = manifest_dir(movement_root)
+    if not unsealed and (directory / UNSEALED_FILENAME).exists():
+        return None
+    records = {}
+    try:
+        _read_records(directory / INDEX_FILENAME, records)
+    except FileNotFoundError:
+        return None
+    segment_dir = directory / SEGMENT_DIRNAME
+    if segment_dir.is_dir():
+        for segment in sorted(segment_dir.iterdir()):
+            if segment.suffix == ".jsonl":
+                _read_records(segment, records)
+    return records
+
+
+def drop_records(movement_root, keys):
+    """Rewrite the index without ``keys``, folding in and removing the segments; returns how many were dropped.
+
+    Called before inference regenerates the instances, so the index is left
+    unsealed: evaluation walks the tree until ``seal_manifest`` runs again.
+    """
+    records = load_records(movement_root, unsealed=True)
+    if records is None:
+        return 0
+    keys = set(keys)
+    kept = [record for key, record in records.items() if key not in keys]
+    write_index(movement_root, kept, sealed=False)
+    segment_dir = manifest_dir(movement_root) / SEGMENT_DIRNAME
+    if segment_dir.is_dir():
+        for segment in segment_dir.iterdir():
+            if segment.suffix == ".jsonl":
+                segment.unlink()
+    return len(records) - len(kept)
+
+
+def walk_instances(movement_root, visual_movement, field_matches=None):
+    """Yield ``(names, instance_dir)`` by listing the tree level by level, in sorted order."""
+    levels = LEVELS[visual_movement]
+    movement_root = Path(movement_root)
+    if not movement_root.exists():
+        return
+
+    def _walk(directory, depth, names):
+        for name in sorted([x.name for x in directory.iterdir() if x.is_dir()]):
+            if field_matches is not None and not field_matches(levels[depth], name):
+                continue
+            if depth == len(levels) - 1:
+                yield (*names, name), directory / name
+            else:
+                yield from _walk(directory / name, depth + 1, (*names, name))
+
+    yield from _walk(movement_root, 0, ())
+
+
+def rebuild(movement_root, visual_movement):
+    """Index every instance of an existing tree (legacy runs written before manifests existed)."""
+    records = [instance_record(movement_root, instance_dir) for _, instance_dir in walk_instances(movement_root, visual_movement)]
+    write_index(movement_root, records)
+    return records
+
+
+def verify(movement_root, visual_movement):
+    """Compare the manifest against the tree; returns ``{"unlisted", "stale", "status"}`` key lists."""
+    records = load_records(movement_root, unsealed=True) or {}
+    on_disk = {}
+    for names, instance_dir in walk_instances(movement_root, visual_movement):
+        on_disk["/".join(names)] = instance_record(movement_root, instance_dir)
+    return {
+        "unlisted": sorted(key for key in on_disk if key not in records),
+        "stale": sorted(key for key in records if key not in on_disk),
+        "status": sorted(
+            key for key, record in on_disk.items() if key in records and records[key]["status"] != record["status"]
+        ),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Inspect, verify or rebuild the instance manifest of a run")
+    parser.add_argument("command", choices=["show", "verify", "rebuild"])
+    parser.add_argument("runs_root", help="Directory holding the static/ and dynamic/ instance trees")
+    parser.add_argument("--visual-movement", action="append", default=[], help="Default: static and dynamic")
+    args = parser.parse_args()
+
+    failed = False
+    for visual_movement in args.visual_movement or list(LEVELS):
+        movement_root = Path(args.runs_root) / visual_movement
+        if args.command == "rebuild":
+            records = rebuild(movement_root, visual_movement)
+            complete = sum(1 for r in records if r["status"] == "complete")
+            print(f"[{visual_movement}] indexed {len(records)} instance(s), {complete} with outputs -> {manifest_dir(movement_root)}")
+        elif args.command == "verify":
+            report = verify(movement_root, visual_movement)
+            for kind, keys in report.items():
+                if keys:
+                    failed = True
+                    print(f"[{visual_movement}] {len(keys)} {kind}: {', '.join(keys[:5])}{' ...' if len(keys) > 5 else ''}")
+            if not any(report.values()):
+                print(f"[{visual_movement}] manifest matches the tree")
+        else:
+            records = load_records(movement_root, unsealed=True)
+            if records is None:
+                print(f"[{visual_movement}] no manifest")
+                continue
+            complete = sum(1 for r in records.values() if r["status"] == "complete")
+            sealed = "" if is_sealed(movement_root) else " (unsealed: evaluation walks the tree until it is sealed again)"
+            print(f"[{visual_movement}] {len(records)} instance(s), {complete} complete{sealed}")
+    if failed:
+        raise SystemExit("Manifest is out of date; run `rebuild` to re-index the tree")
+
+
+if __name__ == "__main__":
+    main()
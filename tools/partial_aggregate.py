@@ -0,0 +1,126 @@
+import json
+import math
+import os
+from collections import Counter
+
+
+def partial_path(partial_dir, visual_movement, shard_index):
+    return os.path.join(partial_dir, f"partial_{visual_movement}_shard_{shard_index}.json")
+
+
+def _score_value(metric_score):
+    value = metric_score.get("score_normalized") if isinstance(metric_score, dict) else None
+    if value is None:
+        return None
+    if isinstance(value, (list, tuple)):
+        return math.fsum(value) / len(value) if value else None
+    return float(value)
+
+
+def build_partial(evaluations, assigned, visual_movement, shard_index, num_shards, aspect_list, output_path):
+    """Summarise one shard's ``{instance_key: evaluation}`` as mergeable sums."""
+    metrics = {}
+    for evaluation in evaluations.values():
+        for aspect, aspect_scores in evaluation.items():
+            for metric_name, metric_score in aspect_scores.items():
+                if not metric_score:
+                    continue
+                value = _score_value(metric_score)
+                if value is None:
+                    continue
+                entry = metrics.setdefault(f"{aspect}/{metric_name}", {"sum": 0.0, "sumsq": 0.0, "count": 0})
+                entry["sum"] += value
+                entry["sumsq"] += value * value
+                entry["count"] += 1
+    return {
+        "visual_movement": visual_movement,
+        "shard_index": shard_index,
+        "num_shards": num_shards,
+        "aspect_list": list(aspect_list),
+        "output_path": output_path,
+        "assigned": sorted(assigned),
+        "covered": sorted(evaluations),
+        "metrics": metrics,
+    }
+
+
+def write_partial(partial_dir, partial):
+    os.makedirs(partial_dir, exist_ok=True)
+    path = partial_path(partial_dir, partial["visual_movement"], partial["shard_index"])
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(partial, f, ensure_ascii=True)
+    os.replace(tmp_path, path)
+    return path
+
+
+def _mean(total):
+    return math.fsum(total["sum"]) / total["count"] if total["count"] else None
+
+
+def _std(total):
+    if not total["count"]:
+        return None
+    mean = _mean(total)
+    return math.sqrt(max(math.fsum(total["sumsq"]) / total["count"] - mean * mean, 0.0))
+
+
+def merge_partials(partial_dir, visual_movement, num_shards):
+    """Merge every shard's partial for ``visual_movement`` into final aspect scores.
+
+    Returns ``(scores, report)``. Raises ``FileNotFoundError`` when a shard's
+    partial is absent and ``ValueError`` when an instance was scored by more
+    than one shard; instances assigned but never scored are listed in
+    ``report["missing"]``.
+    """
+    partials = []
+    for shard_index in range(num_shards):
+        path = partial_path(partial_dir, visual_movement, shard_index)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Missing partial aggregate for shard {shard_index}: {path}")
+        with open(path, "r", encoding="utf-8") as f:
+            partials.append(json.load(f))
+
+    covered = Counter(key for partial in partials for key in partial["covered"])
+    duplicates = sorted(key for key, count in covered.items() if count > 1)
+    if duplicates:
+        raise ValueError(f"{len(duplicates)} instance(s) scored by more than one shard, e.g. {duplicates[:5]}")
+    assigned = {key for partial in partials for key in partial["assigned"]}
+    missing = sorted(assigned - set(covered))
+
+    totals = {}
+    for partial in partials:
+        for column, entry in partial["metrics"].items():
+            total = totals.setdefault(column, {"sum": [], "sumsq": [], "count": 0})
+            total["sum"].append(entry["sum"])
+            total["sumsq"].append(entry["sumsq"])
+            total["count"] += entry["count"]
+
+    aspect_list = partials[0]["aspect_list"] if partials else []
+    metric_means = {}
+    for column, total in totals.items():
+        if total["count"]:
+            aspect = column.split("/", 1)[0]
+            metric_means.setdefault(aspect, []).append(_mean(total))
+    scores = {
+        aspect: round(math.fsum(values) / len(values) * 100, 2)
+        for aspect, values in metric_means.items()
+        if aspect in aspect_list
+    }
+    report = {
+        "visual_movement": visual_movement,
+        "num_shards": num_shards,
+        "instances": len(covered),
+        "assigned": len(assigned),
+        "missing": missing,
+        "metrics": {
+            column: {
+                "count": total["count"],
+                "mean": _mean(total),
+                "std": _std(total),
+            }
+            for column, total in totals.items()
+        },
+        "output_path": partials[0]["output_path"] if partials else None,
+    }
+    return scores, report
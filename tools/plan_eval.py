@@ -0,0 +1,375 @@
+import argparse
+import json
+import math
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+
+from case_filter import CaseFilter
+from completion import resolve_runs_root
+from gpu_packing import device_inventory, estimate_footprint, load_memory_table
+from instance_manifest import walk_instances
+from result_cache import CACHE_FILENAME, EVALUATION_FILENAME, evaluation_generation, load_generation
+from telemetry import load_nodes
+from tracer import SUMMARY_FILENAME, load_events, summarize
+
+PLAN_FILENAME = "plan.json"
+RECOMMENDED_FILENAME = "recommended_compute.yaml"
+HISTORY_WINDOW = 20
+# 墙钟时间在最优的这个比例以内时，选 GPU·小时更少的配置
+WALL_TOLERANCE = 1.05
+
+
+def plan_dir(cfg):
+    return os.path.join(cfg.get("paths", {}).get("run_dir", "."), "eval_plan")
+
+
+def history_path(cfg):
+    compute = cfg.get("compute", {})
+    default = os.path.join(cfg.get("run", {}).get("output_root", "."), "eval_plan_history.jsonl")
+    return compute.get("eval_plan_history") or default
+
+
+def load_correction(path, window=HISTORY_WINDOW):
+    """Median ``actual / predicted`` wall-time ratio over the last ``window`` checked runs (1.0 without history)."""
+    if not path or not os.path.exists(path):
+        return 1.0, 0
+    with open(path, "r", encoding="utf-8") as f:
+        ratios = [json.loads(line)["ratio"] for line in f if line.strip()][-window:]
+    return (statistics.median(ratios), len(ratios)) if ratios else (1.0, 0)
+
+
+def _pending(movement_root, visual_movement, case_filter):
+    # 当前代还没有 evaluation.json 的实例才需要计算；已有结果的实例只需复用缓存
+    generation = load_generation(movement_root)
+    instances, pending = [], 0
+    for _, instance_dir in walk_instances(movement_root, visual_movement, case_filter.field_matches):
+        instances.append(instance_dir)
+        if not (instance_dir / EVALUATION_FILENAME).exists() or evaluation_generation(instance_dir) != generation:
+            pending += 1
+    return instances, pending
+
+
+def _link_instance(source, target):
+    # 目录是真实的（评测会在其中写结果和缓存），文件用符号链接指向原始输出，不复制视频
+    for dirpath, dirnames, filenames in os.walk(source):
+        relative = os.path.relpath(dirpath, source)
+        os.makedirs(os.path.join(target, relative), exist_ok=True)
+        for filename in filenames:
+            if filename in (EVALUATION_FILENAME, CACHE_FILENAME):
+                continue
+            os.symlink(os.path.abspath(os.path.join(dirpath, filename)), os.path.join(target, relative, filename))
+
+
+def calibrate(cfg, work_dir, script_dir, instances_per_movement=4, device="cuda"):
+    """Evaluate a few instances per movement in a scratch tree with per-metric tracing; returns the measured profile.
+
+    The scratch tree links the chosen instances' outputs, so nothing is written
+    into the real run and cached results cannot hide the cost.
+    """
+    worldscore = cfg.get("worldscore", {})
+    runs_root = resolve_runs_root(cfg)
+    scratch_base = os.path.join(work_dir, "runs")
+    shutil.rmtree(work_dir, ignore_errors=True)
+    scratch_cfg = json.loads(json.dumps(cfg))
+    scratch_cfg["worldscore"]["runs_root_base"] = scratch_base
+    scratch_root = resolve_runs_root(scratch_cfg)
+    case_filter = CaseFilter(cfg.get("filters", {}))
+
+    movements = {}
+    for visual_movement in worldscore.get("visual_movement", ["static", "dynamic"]):
+        movement_root = os.path.join(runs_root, visual_movement)
+        instances, pending = _pending(movement_root, visual_movement, case_filter)
+        # 按排序后的等间隔抽样，覆盖各 visual_style / 场景类型
+        step = max(len(instances) / max(instances_per_movement, 1), 1)
+        chosen = [instances[int(i * step)] for i in range(min(instances_per_movement, len(instances)))]
+        for instance_dir in chosen:
+            relative = os.path.relpath(instance_dir, movement_root)
+            _link_instance(instance_dir, os.path.join(scratch_root, visual_movement, relative))
+        movements[visual_movement] = {"instances": len(instances), "pending": pending, "calibrated": len(chosen)}
+
+    config_path = os.path.join(work_dir, "config.json")
+    with open(config_path, "w", encoding="utf-8") as f:
+        json.dump(scratch_cfg, f, indent=2, ensure_ascii=True)
+    trace_dir = os.path.join(work_dir, "trace")
+    startup_log = os.path.join(work_dir, "startup.jsonl")
+    cmd = [
+        sys.executable,
+        os.path.join(script_dir, "evaluate_filtered.py"),
+        "--config-json", config_path,
+        "--num-jobs", "1",
+        "--gpu-packing", "round-robin",
+        "--device", device,
+        "--prefetch-depth", "0",
+        "--trace-dir", trace_dir,
+        "--trace-granularity", "metric",
+        "--startup-log", startup_log,
+        "--skip-mean",
+        "--ignore-manifest",
+    ]
+    env = os.environ.copy()
+    if worldscore.get("runs_root_base"):
+        env["MODEL_PATH"] = worldscore["runs_root_base"]
+    print("Calibrating:", " ".join(cmd))
+    start = time.perf_counter()
+    subprocess.check_call(cmd, env=env, cwd=os.path.join(cfg.get("env", {}).get("worldscore_path", ""), "WorldScore"))
+    wall = time.perf_counter() - start
+    return profile(trace_dir, startup_log, wall, movements)
+
+
+def profile(trace_dir, startup_log, wall, movements):
+    """Per-movement seconds per instance (wall and GPU) and the fixed startup cost, from a calibration trace."""
+    summary = summarize(trace_dir)
+    events = load_events(trace_dir)
+    cuda_by_instance = {}
+    for event in events:
+        if event["cat"] == "metric" and "cuda_ms" in event["args"]:
+            key = event["args"].get("instance")
+            cuda_by_instance[key] = cuda_by_instance.get(key, 0.0) + event["args"]["cuda_ms"] / 1e3
+    per_movement = {}
+    busy = 0.0
+    for event in events:
+        if event["cat"] != "instance":
+            continue
+        seconds = event["dur"] / 1e6
+        busy += seconds
+        row = per_movement.setdefault(
+            event["args"].get("visual_movement"), {"count": 0, "wall_s": 0.0, "gpu_s": 0.0, "max_s": 0.0}
+        )
+        row["count"] += 1
+        row["wall_s"] += seconds
+        row["max_s"] = max(row["max_s"], seconds)
+        # 没有 CUDA 计时（CPU 上校准）时按整段都占用设备算，多 worker 共卡不会被高估
+        row["gpu_s"] += min(cuda_by_instance.get(event["name"], seconds), seconds)
+    ready = 0.0
+    if os.path.exists(startup_log):
+        with open(startup_log, "r", encoding="utf-8") as f:
+            ready = max((json.loads(line)["ready_s"] for line in f if line.strip()), default=0.0)
+    for visual_movement, row in per_movement.items():
+        movements.setdefault(visual_movement, {}).update(
+            {
+                "wall_s": round(row["wall_s"] / row["count"], 3),
+                "gpu_s": round(row["gpu_s"] / row["count"], 3),
+                "max_s": round(row["max_s"], 3),
+            }
+        )
+    return {
+        "movements": movements,
+        # 导入、模型加载与退出：校准进程总时长中不属于任何实例的部分
+        "startup_s": round(max(wall - busy, ready), 2),
+        "metrics": summary["metrics"],
+        "memory_table": os.path.join(trace_dir, SUMMARY_FILENAME),
+        "calibration_wall_s": round(wall, 2),
+    }
+
+
+def predict(profile_data, nodes, gpus_per_node, jobs_per_gpu, correction=1.0, instances=None):
+    """Modelled wall time: fixed startup plus the work split over every worker, never faster than the GPUs allow.
+
+    ``k`` workers on one GPU overlap their CPU/IO time but not their kernels,
+    so one GPU finishes work ``W`` in ``max(W_wall / k, W_gpu)``.
+    """
+    work_wall = work_gpu = tail = 0.0
+    for visual_movement, row in profile_data["movements"].items():
+        if "wall_s" not in row:
+            continue
+        count = row["pending"] if instances is None else instances.get(visual_movement, 0)
+        work_wall += count * row["wall_s"]
+        work_gpu += count * row["gpu_s"]
+        if count:
+            tail = max(tail, row["max_s"])
+    devices = max(nodes * gpus_per_node, 1)
+    compute = max(work_wall / (devices * max(jobs_per_gpu, 1)), work_gpu / devices)
+    return (profile_data["startup_s"] + compute + tail) * correction
+
+
+def candidates(profile_data, max_nodes, gpus_per_node, max_jobs_per_gpu, correction=1.0, instances=None):
+    rows = []
+    for nodes in range(1, max(max_nodes, 1) + 1):
+        for jobs_per_gpu in range(1, max(max_jobs_per_gpu, 1) + 1):
+            wall = predict(profile_data, nodes, gpus_per_node, jobs_per_gpu, correction, instances)
+            rows.append(
+                {
+                    "nodes": nodes,
+                    "gpus_per_node": gpus_per_node,
+                    "jobs_per_gpu": jobs_per_gpu,
+                    "wall_s": round(wall, 1),
+                    "gpu_hours": round(wall * nodes * gpus_per_node / 3600, 3),
+                }
+            )
+    return rows
+
+
+def recommend(rows):
+    fastest = min(row["wall_s"] for row in rows)
+    near = [row for row in rows if row["wall_s"] <= fastest * WALL_TOLERANCE]
+    return min(near, key=lambda row: (row["gpu_hours"], row["nodes"], row["jobs_per_gpu"]))
+
+
+def _max_jobs_per_gpu(profile_data, metrics, inventory, memory_fraction, gpu_memory_mb):
+    table, calibration = load_memory_table(profile_data["memory_table"])
+    footprint, source = estimate_footprint(metrics, table, calibration)
+    if footprint is None:
+        return 1, footprint, source
+    free = min((d["free_mb"] for d in inventory), default=gpu_memory_mb)
+    return max(int(free * memory_fraction // footprint), 1), footprint, source
+
+
+def build_plan(cfg, profile_data, max_nodes, inventory, memory_fraction=0.9, gpu_memory_mb=80000, history="", full=False):
+    compute = cfg.get("compute", {})
+    gpus_per_node = len(inventory) or int(compute.get("num_gpus", 1))
+    # 批量模式的 span 名是 "batched"，不是 aspect/metric
+    metrics = [name.split("/", 1)[1] for name in profile_data["metrics"] if "/" in name]
+    max_jobs, footprint, source = _max_jobs_per_gpu(profile_data, metrics, inventory, memory_fraction, gpu_memory_mb)
+    correction, checked = load_correction(history)
+    # full：按全部实例规划（例如随后要 --delete-calculated），否则只算当前代还没有结果的实例
+    instances = {vm: row["instances"] for vm, row in profile_data["movements"].items()} if full else None
+    rows = candidates(profile_data, max_nodes, gpus_per_node, max_jobs, correction, instances)
+    best = recommend(rows)
+    recommended = {
+        "eval_num_jobs": best["gpus_per_node"] * best["jobs_per_gpu"],
+        "eval_num_shards": best["nodes"],
+        "eval_gpu_packing": "memory" if footprint is not None else "round-robin",
+        "eval_memory_table": profile_data["memory_table"],
+    }
+    return {
+        "time": time.time(),
+        "profile": profile_data,
+        "footprint_mb": round(footprint) if footprint is not None else None,
+        "footprint_source": source,
+        "max_jobs_per_gpu": max_jobs,
+        "correction": round(correction, 4),
+        "checked_runs": checked,
+        "full": full,
+        "candidates": rows,
+        "best": best,
+        "recommended": recommended,
+    }
+
+
+def write_plan(plan, directory):
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, PLAN_FILENAME), "w", encoding="utf-8") as f:
+        json.dump(plan, f, indent=2, ensure_ascii=True)
+    with open(os.path.join(directory, RECOMMENDED_FILENAME), "w", encoding="utf-8") as f:
+        f.write(f"# predicted wall {plan['best']['wall_s']:.0f}s, {plan['best']['gpu_hours']:.2f} GPU-hours\n")
+        f.write("compute:\n")
+        for key, value in plan["recommended"].items():
+            f.write(f"  {key}: {json.dumps(value)}\n")
+    return os.path.join(directory, RECOMMENDED_FILENAME)
+
+
+def check(plan, nodes_status, num_jobs, num_shards, history=""):
+    """Compare the plan's model with a finished run's telemetry; appends the ratio to ``history``."""
+    started = min(node["started"] for node in nodes_status)
+    finished = max(node["last_progress"] or node["updated"] for node in nodes_status)
+    done = {}
+    for node in nodes_status:
+        for name, section in node["sections"].items():
+            visual_movement = name.rsplit(":", 1)[-1]
+            done[visual_movement] = done.get(visual_movement, 0) + section["done"]
+    gpus_per_node = plan["best"]["gpus_per_node"]
+    jobs_per_gpu = max(num_jobs // max(gpus_per_node, 1), 1)
+    # 用模型本身（不乘历史修正）预测这次实际的配置和实例数，比值才能作为修正系数累积
+    predicted = predict(plan["profile"], num_shards, gpus_per_node, jobs_per_gpu, 1.0, done)
+    actual = finished - started
+    record = {
+        "time": time.time(),
+        "num_jobs": num_jobs,
+        "num_shards": num_shards,
+        "instances": done,
+        "predicted_s": round(predicted, 1),
+        "actual_s": round(actual, 1),
+        "ratio": round(actual / predicted, 4) if predicted > 0 else 1.0,
+    }
+    if history:
+        os.makedirs(os.path.dirname(os.path.abspath(history)), exist_ok=True)
+        with open(history, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=True) + "\n")
+    return record
+
+
+def print_plan(plan):
+    for visual_movement, row in plan["profile"]["movements"].items():
+        if "wall_s" in row:
+            print(
+                f"[{visual_movement}] {row['pending']} of {row['instances']} instance(s) to evaluate; "
+                f"{row['wall_s']:.2f}s/instance ({row['gpu_s']:.2f}s on the GPU) over {row['calibrated']} calibrated"
+            )
+    if plan["full"]:
+        print("Planning a full re-evaluation of every instance")
+    print(
+        f"startup {plan['profile']['startup_s']:.1f}s; "
+        + (f"~{plan['footprint_mb']} MB per worker " if plan["footprint_mb"] is not None else "no footprint estimate ")
+        + f"({plan['footprint_source']}), "
+        f"up to {plan['max_jobs_per_gpu']} per GPU; "
+        f"correction x{plan['correction']:.2f} from {plan['checked_runs']} checked run(s)"
+    )
+    print(f"{'nodes':>5} {'gpus':>5} {'jobs/gpu':>8} {'wall_s':>10} {'gpu_h':>8}")
+    for row in plan["candidates"]:
+        marker = "  <- recommended" if row == plan["best"] else ""
+        print(
+            f"{row['nodes']:>5} {row['gpus_per_node']:>5} {row['jobs_per_gpu']:>8} "
+            f"{row['wall_s']:>10.0f} {row['gpu_hours']:>8.2f}{marker}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Calibrate evaluation cost and recommend eval_num_jobs / eval_num_shards")
+    sub = parser.add_subparsers(dest="command", required=True)
+    plan_parser = sub.add_parser("plan", help="Calibrate on a few instances and model candidate configurations")
+    plan_parser.add_argument("--config-json", required=True, help="Resolved config JSON")
+    plan_parser.add_argument("--instances", type=int, default=4, help="Calibration instances per visual movement")
+    plan_parser.add_argument("--max-nodes", type=int, default=int(os.environ.get("NNODES", 1)))
+    plan_parser.add_argument("--device", default="cuda")
+    plan_parser.add_argument("--inventory", default="", help="GPU inventory JSON (default: nvidia-smi)")
+    plan_parser.add_argument("--memory-fraction", type=float, default=0.9)
+    plan_parser.add_argument("--gpu-memory-mb", type=float, default=80000, help="Per-GPU memory when no GPU is visible")
+    plan_parser.add_argument("--full", action="store_true", help="Model a full re-evaluation, not only missing instances")
+    plan_parser.add_argument("--reuse", action="store_true", help="Re-model from the last calibration, do not run one")
+    plan_parser.add_argument("--output-dir", default="", help="Default: <run_dir>/eval_plan")
+    check_parser = sub.add_parser("check", help="Compare a plan's prediction with a finished run and record the error")
+    check_parser.add_argument("--config-json", required=True, help="Resolved config JSON of the run that finished")
+    check_parser.add_argument("--plan-json", default="", help="Default: <run_dir>/eval_plan/plan.json")
+    check_parser.add_argument("--telemetry-dir", required=True, help="<run.output_root>/telemetry/<run id>")
+    args = parser.parse_args()
+
+    with open(args.config_json, "r", encoding="utf-8") as f:
+        cfg = json.load(f)
+    compute = cfg.get("compute", {})
+
+    if args.command == "check":
+        with open(args.plan_json or os.path.join(plan_dir(cfg), PLAN_FILENAME), "r", encoding="utf-8") as f:
+            plan = json.load(f)
+        num_jobs = compute.get("eval_num_jobs", compute.get("num_gpus", 1))
+        num_jobs = plan["recommended"]["eval_num_jobs"] if num_jobs == "auto" else int(num_jobs)
+        num_shards = int(compute.get("eval_num_shards", os.environ.get("NNODES", 1)))
+        record = check(plan, load_nodes(args.telemetry_dir), num_jobs, num_shards, history_path(cfg))
+        print(
+            f"Plan check: predicted {record['predicted_s']:.0f}s, actual {record['actual_s']:.0f}s "
+            f"(x{record['ratio']:.2f}) -> {history_path(cfg)}"
+        )
+        return
+
+    output_dir = args.output_dir or plan_dir(cfg)
+    calibration_dir = os.path.join(output_dir, "calibration")
+    if args.reuse:
+        with open(os.path.join(output_dir, PLAN_FILENAME), "r", encoding="utf-8") as f:
+            profile_data = json.load(f)["profile"]
+    else:
+        script_dir = os.path.dirname(os.path.abspath(__file__))
+        profile_data = calibrate(cfg, calibration_dir, script_dir, args.instances, args.device)
+    inventory = device_inventory(args.inventory) if args.device == "cuda" else []
+    plan = build_plan(
+        cfg, profile_data, args.max_nodes, inventory, args.memory_fraction, args.gpu_memory_mb, history_path(cfg), args.full
+    )
+    path = write_plan(plan, output_dir)
+    print_plan(plan)
+    print(f"Recommended compute block written to {path}")
+
+
+if __name__ == "__main__":
+    main()
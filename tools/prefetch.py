@@ -0,0 +1,138 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from result_cache import CONTENT_EXTENSIONS, CONTENT_FILES
+
+_READ_BLOCK = 8 << 20
+
+
+def media_files(instance_dir):
+    files = []
+    for dirpath, dirnames, filenames in os.walk(instance_dir):
+        for filename in filenames:
+            if filename.lower().endswith(CONTENT_EXTENSIONS) or filename in CONTENT_FILES:
+                path = os.path.join(dirpath, filename)
+                files.append((path, os.path.getsize(path)))
+    return files
+
+
+def warm_files(files):
+    """Read ``files`` once so the following decode is served from the page cache."""
+    total = 0
+    for path, _ in files:
+        with open(path, "rb", buffering=0) as f:
+            while True:
+                block = f.read(_READ_BLOCK)
+                if not block:
+                    break
+                total += len(block)
+    return total
+
+
+class _ByteBudget:
+    # 按领取顺序发放额度，保证队首样本总能拿到额度，不会因后面的样本占满预算而死锁
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.in_use = 0
+        self.next_ticket = 0
+        self.closed = False
+        self.cond = threading.Condition()
+
+    def acquire(self, ticket, nbytes):
+        with self.cond:
+            while not self.closed and (
+                ticket != self.next_ticket or (self.in_use and self.in_use + nbytes > self.max_bytes)
+            ):
+                self.cond.wait()
+            self.in_use += nbytes
+            self.next_ticket += 1
+            self.cond.notify_all()
+
+    def release(self, nbytes):
+        with self.cond:
+            self.in_use -= nbytes
+            self.cond.notify_all()
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+
+class Prefetcher:
+    """Prepare upcoming instances on background threads while the current one computes.
+
+    ``prepare(item, files)`` runs on a worker thread after ``item``'s media
+    files have been sized and admitted; at most ``depth`` items are prepared
+    ahead of the consumer and at most ``max_bytes`` of media is held in
+    flight. ``take`` must be called in ``schedule`` order.
+    """
+
+    def __init__(self, prepare, depth=2, max_bytes=4 << 30, threads=2):
+        self.prepare = prepare
+        self.depth = max(int(depth), 0)
+        self.budget = _ByteBudget(max_bytes)
+        self.executor = ThreadPoolExecutor(max_workers=max(threads, 1), thread_name_prefix="prefetch")
+        self.backlog = []
+        self.futures = {}
+        self.tickets = 0
+        self.stats = {"ready": 0, "waited": 0}
+
+    def schedule(self, key, item, instance_dir):
+        self.backlog.append((key, item, instance_dir))
+        self._fill()
+
+    def _fill(self):
+        while self.backlog and len(self.futures) < self.depth:
+            key, item, instance_dir = self.backlog.pop(0)
+            ticket = self.tickets
+            self.tickets += 1
+            self.futures[key] = self.executor.submit(self._run, ticket, item, instance_dir)
+
+    def _run(self, ticket, item, instance_dir):
+        try:
+            files = media_files(instance_dir)
+        except OSError:
+            files = []
+        nbytes = sum(size for _, size in files)
+        self.budget.acquire(ticket, nbytes)
+        try:
+            return self.prepare(item, files), nbytes
+        except BaseException:
+            self.budget.release(nbytes)
+            raise
+
+    def take(self, key, item, instance_dir):
+        """Return ``prepare``'s result for ``key``, preparing it inline if it was never scheduled."""
+        future = self.futures.pop(key, None)
+        if future is None:
+            self.backlog = [entry for entry in self.backlog if entry[0] != key]
+            self.stats["waited"] += 1
+            result = self.prepare(item, media_files(instance_dir))
+        else:
+            self.stats["ready" if future.done() else "waited"] += 1
+            result, nbytes = future.result()
+            self.budget.release(nbytes)
+        self._fill()
+        return result
+
+    def drop(self, key):
+        """Forget ``key`` (e.g. its chunk failed); its budget is returned once it finishes."""
+        self.backlog = [entry for entry in self.backlog if entry[0] != key]
+        future = self.futures.pop(key, None)
+        if future is not None:
+            future.add_done_callback(self._release_dropped)
+        self._fill()
+
+    def _release_dropped(self, future):
+        if future.exception() is None:
+            self.budget.release(future.result()[1])
+
+    def reset_stats(self):
+        stats, self.stats = self.stats, {"ready": 0, "waited": 0}
+        return stats
+
+    def close(self):
+        self.budget.close()
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,468 @@
+import argparse
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+import time
+import uuid
+
+DEFAULT_PORT_OFFSET = 1
+HEARTBEAT_INTERVAL = 2.0
+DEAD_AFTER = 60.0
+# 从未发过心跳的节点（例如启动即崩溃），在屏障建立这么久之后仍无心跳即视为失联
+START_GRACE = 300.0
+FILE_HEARTBEAT_INTERVAL = 10.0
+WAIT_SLICE = 2.0
+RUN_ID_FILENAME = "run_id.json"
+# 文件方式领取运行 ID 时，只认本进程启动前这么久以内由节点 0 写下的 ID
+RUN_ID_MAX_SKEW = 600.0
+
+
+class RendezvousError(RuntimeError):
+    pass
+
+
+def scheduler_run_id():
+    """An explicit ``RDZV_RUN_ID`` or a scheduler-provided job id, or ``None``."""
+    for name in ("RDZV_RUN_ID", "MLP_TASK_INSTANCE_ID", "MLP_TASK_ID", "SLURM_JOB_ID", "TORCHELASTIC_RUN_ID"):
+        value = os.environ.get(name)
+        if value and value.strip():
+            return value.strip()
+    return None
+
+
+def new_run_id():
+    return f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+
+
+def publish_run_id(file_dir, run_id):
+    os.makedirs(file_dir, exist_ok=True)
+    path = os.path.join(file_dir, RUN_ID_FILENAME)
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"run_id": run_id, "time": time.time()}, f)
+    os.replace(tmp_path, path)
+
+
+def _read_run_id_file(file_dir, not_before):
+    try:
+        with open(os.path.join(file_dir, RUN_ID_FILENAME), "r", encoding="utf-8") as f:
+            record = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return record["run_id"] if record.get("time", 0) >= not_before else None
+
+
+def resolve_run_id(rank, addr=None, port=None, file_dir="", timeout=600.0):
+    """Identifier shared by every node of one job, used to ignore state from earlier runs.
+
+    Scheduler job ids are used as is. Otherwise node 0 draws a random id and
+    publishes it to ``file_dir``; it also serves it from the rendezvous server
+    (``serve --run-id``). Other ranks ask the server and, while it is
+    unreachable, accept only an id file written shortly before they started,
+    so an id left by an earlier run on the same master is never reused.
+    """
+    run_id = scheduler_run_id()
+    if run_id:
+        return run_id
+    if int(rank) == 0:
+        run_id = new_run_id()
+        if file_dir:
+            publish_run_id(file_dir, run_id)
+        return run_id
+    default_addr, default_port = default_endpoint()
+    addr, port = addr or default_addr, int(port or default_port)
+    not_before = time.time() - RUN_ID_MAX_SKEW
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            run_id = _request(addr, port, {"op": "run_id"}, timeout=2.0).get("value")
+            if run_id:
+                return run_id
+        except (OSError, ValueError, RendezvousError):
+            pass
+        if file_dir:
+            run_id = _read_run_id_file(file_dir, not_before)
+            if run_id:
+                return run_id
+        time.sleep(1.0)
+    raise RendezvousError(f"No run id published by node 0 within {timeout:.0f}s (server {addr}:{port}, dir {file_dir!r})")
+
+
+def default_endpoint():
+    addr = os.environ.get("RDZV_ADDR") or os.environ.get("MASTER_ADDR") or "127.0.0.1"
+    port = os.environ.get("RDZV_PORT")
+    if not port:
+        port = int(os.environ.get("MASTER_PORT") or 29500) + DEFAULT_PORT_OFFSET
+    return addr, int(port)
+
+
+class _Store:
+    def __init__(self, dead_after, run_id=None, start_grace=START_GRACE):
+        self.cond = threading.Condition()
+        self.dead_after = dead_after
+        self.start_grace = start_grace
+        self.run_id = run_id
+        self.runs = {}
+
+    def _run(self, run_id):
+        return self.runs.setdefault(run_id, {"kv": {}, "arrived": {}, "created": {}, "heartbeats": {}, "aborted": None})
+
+    def _dead_ranks(self, run, name, pending):
+        now = time.time()
+        created = run["created"].get(name, now)
+        return sorted(
+            r
+            for r in pending
+            if (now - run["heartbeats"][r] > self.dead_after if r in run["heartbeats"] else now - created > self.start_grace)
+        )
+
+    def dispatch(self, request):
+        op = request.get("op")
+        if op == "run_id":
+            return {"ok": True, "value": self.run_id}
+        with self.cond:
+            run = self._run(request.get("run_id", ""))
+            if op == "ping":
+                return {"ok": True}
+            if op == "set":
+                run["kv"][request["key"]] = request["value"]
+                self.cond.notify_all()
+                return {"ok": True}
+            if op == "get":
+                return {"ok": True, "value": run["kv"].get(request["key"])}
+            if op == "heartbeat":
+                run["heartbeats"][request["rank"]] = time.time()
+                return {"ok": True, "aborted": run["aborted"]}
+            if op == "abort":
+                if run["aborted"] is None:
+                    run["aborted"] = {"rank": request.get("rank"), "reason": request.get("reason", "")}
+                self.cond.notify_all()
+                return {"ok": True}
+            if op == "arrive":
+                run["created"].setdefault(request["name"], time.time())
+                run["arrived"].setdefault(request["name"], set()).add(request["rank"])
+                run["heartbeats"][request["rank"]] = time.time()
+                self.cond.notify_all()
+                return {"ok": True}
+            if op == "wait":
+                deadline = time.time() + min(float(request.get("timeout", WAIT_SLICE)), 30.0)
+                world_size = request["world_size"]
+                run["created"].setdefault(request["name"], time.time())
+                while True:
+                    arrived = run["arrived"].get(request["name"], set())
+                    if run["aborted"] is not None:
+                        return {"ok": True, "status": "aborted", "detail": run["aborted"]}
+                    if len(arrived) >= world_size:
+                        return {"ok": True, "status": "released"}
+                    pending = [r for r in range(world_size) if r not in arrived]
+                    dead = self._dead_ranks(run, request["name"], pending)
+                    if dead:
+                        return {"ok": True, "status": "dead", "detail": dead}
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        return {"ok": True, "status": "pending", "arrived": sorted(arrived)}
+                    self.cond.wait(remaining)
+        return {"ok": False, "error": f"unknown op {op!r}"}
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+        try:
+            response = self.server.store.dispatch(json.loads(line))
+        except Exception as e:
+            response = {"ok": False, "error": repr(e)}
+        self.wfile.write((json.dumps(response) + "\n").encode("utf-8"))
+
+
+class RendezvousServer(socketserver.ThreadingTCPServer):
+    """In-memory key-value/barrier service, one per job, hosted by node 0."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host, port, dead_after=DEAD_AFTER, run_id=None, start_grace=START_GRACE):
+        super().__init__((host, port), _Handler)
+        self.store = _Store(dead_after, run_id, start_grace)
+
+
+def _request(addr, port, payload, timeout):
+    with socket.create_connection((addr, port), timeout=timeout) as sock:
+        sock.sendall((json.dumps(payload) + "\n").encode("utf-8"))
+        data = b""
+        while not data.endswith(b"\n"):
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            data += chunk
+    response = json.loads(data)
+    if not response.get("ok"):
+        raise RendezvousError(response.get("error", "rendezvous request failed"))
+    return response
+
+
+class Rendezvous:
+    """Barrier client: TCP store on ``MASTER_ADDR`` with a marker-file fallback.
+
+    Arrivals are always mirrored to ``file_dir`` (when given) so that a node
+    that cannot reach the server still releases through the files. Every
+    marker carries ``run_id``, so leftovers from a previous run are ignored.
+    ``dead_after=None`` turns off dead-rank detection in the marker-file path,
+    for waits on ranks that run no heartbeat loop.
+    """
+
+    def __init__(
+        self,
+        rank,
+        run_id=None,
+        addr=None,
+        port=None,
+        file_dir="",
+        connect_timeout=60.0,
+        dead_after=DEAD_AFTER,
+        start_grace=START_GRACE,
+    ):
+        default_addr, default_port = default_endpoint()
+        self.rank = int(rank)
+        self.run_id = run_id or resolve_run_id(rank, addr, port, file_dir, connect_timeout)
+        self.addr = addr or default_addr
+        self.port = int(port or default_port)
+        self.file_dir = file_dir
+        self.dead_after = dead_after
+        self.start_grace = start_grace
+        self._waiting_since = {}
+        self._last_file_beat = 0.0
+        self.tcp = self._probe(connect_timeout)
+        if not self.tcp:
+            print(f"Rendezvous server {self.addr}:{self.port} unreachable; using marker files in {file_dir}")
+            if not file_dir:
+                raise RendezvousError("rendezvous server unreachable and no file fallback directory given")
+
+    def _probe(self, connect_timeout):
+        deadline = time.time() + connect_timeout
+        while True:
+            try:
+                self._call({"op": "ping"}, timeout=2.0)
+                return True
+            except (OSError, ValueError):
+                if time.time() >= deadline:
+                    return False
+                time.sleep(0.5)
+
+    def _call(self, payload, timeout=10.0):
+        payload = dict(payload, run_id=self.run_id)
+        return _request(self.addr, self.port, payload, timeout)
+
+    def _marker(self, name, rank):
+        return os.path.join(self.file_dir, f"{name}_{rank}.{self.run_id}.done")
+
+    def _abort_marker(self):
+        return os.path.join(self.file_dir, f"abort.{self.run_id}")
+
+    def _heartbeat_file(self, rank):
+        return os.path.join(self.file_dir, "heartbeat", f"rank_{rank}.{self.run_id}")
+
+    def arrive(self, name):
+        if self.file_dir:
+            os.makedirs(self.file_dir, exist_ok=True)
+            with open(self._marker(name, self.rank), "w", encoding="utf-8") as f:
+                f.write(f"{time.time()}\n")
+        if self.tcp:
+            try:
+                self._call({"op": "arrive", "name": name, "rank": self.rank})
+            except OSError:
+                self.tcp = False
+
+    def heartbeat(self):
+        # 连着服务端时也定期写心跳文件：其它节点退回文件方式后，靠它区分“还活着”和“从未启动”
+        if self.file_dir and (not self.tcp or time.time() - self._last_file_beat >= FILE_HEARTBEAT_INTERVAL):
+            path = self._heartbeat_file(self.rank)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(f"{time.time()}\n")
+            self._last_file_beat = time.time()
+        if self.tcp:
+            try:
+                return self._call({"op": "heartbeat", "rank": self.rank}).get("aborted")
+            except OSError:
+                self.tcp = False
+        return None
+
+    def abort(self, reason=""):
+        if self.file_dir:
+            os.makedirs(self.file_dir, exist_ok=True)
+            with open(self._abort_marker(), "w", encoding="utf-8") as f:
+                json.dump({"rank": self.rank, "reason": reason}, f)
+        if self.tcp:
+            try:
+                self._call({"op": "abort", "rank": self.rank, "reason": reason})
+            except OSError:
+                pass
+
+    def _check_files(self, name, world_size):
+        if not self.file_dir:
+            return None
+        if os.path.exists(self._abort_marker()):
+            with open(self._abort_marker(), "r", encoding="utf-8") as f:
+                return "aborted", json.load(f)
+        pending = [r for r in range(world_size) if not os.path.exists(self._marker(name, r))]
+        if not pending:
+            return "released", None
+        if self.dead_after is None:
+            return None
+        now = time.time()
+        waiting_since = self._waiting_since.setdefault(name, now)
+        dead = []
+        for r in pending:
+            try:
+                silent = now - os.path.getmtime(self._heartbeat_file(r)) > self.dead_after
+            except OSError:
+                silent = now - waiting_since > self.start_grace
+            if silent:
+                dead.append(r)
+        if dead:
+            return "dead", dead
+        return None
+
+    def _poll(self, name, world_size, wait_slice):
+        if self.tcp:
+            try:
+                response = self._call(
+                    {"op": "wait", "name": name, "world_size": world_size, "timeout": wait_slice},
+                    timeout=wait_slice + 10.0,
+                )
+                # 服务端说还有节点没到就以它为准，旧运行残留的标记文件不能放行
+                if response["status"] == "pending":
+                    return None
+                return response["status"], response.get("detail")
+            except OSError:
+                print("Lost connection to rendezvous server; falling back to marker files")
+                self.tcp = False
+        return self._check_files(name, world_size)
+
+    def _resolve(self, name, status):
+        kind, detail = status
+        if kind == "released":
+            return True
+        if kind == "aborted":
+            raise RendezvousError(f"Run aborted while waiting for {name!r}: {detail}")
+        raise RendezvousError(f"Rank(s) {detail} stopped heart-beating before reaching {name!r}")
+
+    def released(self, name, world_size):
+        """Non-blocking ``wait``: True once every rank has arrived at ``name``."""
+        status = self._poll(name, world_size, 0.0)
+        return status is not None and self._resolve(name, status)
+
+    def wait(self, name, world_size, timeout):
+        deadline = time.time() + timeout
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise TimeoutError(f"Timed out waiting for barrier {name!r} ({world_size} ranks)")
+            status = self._poll(name, world_size, min(WAIT_SLICE, remaining))
+            if status is None:
+                if not self.tcp:
+                    time.sleep(1.0)
+                continue
+            self._resolve(name, status)
+            return
+
+    def barrier(self, name, world_size, timeout):
+        self.arrive(name)
+        self.wait(name, world_size, timeout)
+
+
+def _serve(args):
+    server = RendezvousServer(
+        args.host, args.port, dead_after=args.dead_after, run_id=args.run_id, start_grace=args.start_grace
+    )
+    print(f"Rendezvous server listening on {args.host}:{args.port}", flush=True)
+    server.serve_forever()
+
+
+def _heartbeat_loop(rdzv, interval):
+    while True:
+        aborted = rdzv.heartbeat()
+        if aborted:
+            print(f"Run aborted by rank {aborted.get('rank')}: {aborted.get('reason')}", flush=True)
+        time.sleep(interval if rdzv.tcp else max(interval, 10.0))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Multi-node rendezvous (TCP store with marker-file fallback)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    serve = sub.add_parser("serve")
+    serve.add_argument("--host", default="0.0.0.0")
+    serve.add_argument("--port", type=int, default=default_endpoint()[1])
+    serve.add_argument("--dead-after", type=float, default=DEAD_AFTER)
+    serve.add_argument(
+        "--start-grace", type=float, default=START_GRACE, help="A rank that never heartbeats is dead this long into a barrier"
+    )
+    serve.add_argument("--run-id", default=None, help="Run id handed out to ranks that ask for it")
+    run_id_parser = sub.add_parser("run-id", help="Print this job's run id (node 0 draws and publishes it)")
+    run_id_parser.add_argument("--rank", type=int, default=int(os.environ.get("NODE_RANK", 0)))
+    run_id_parser.add_argument("--file-dir", default="")
+    run_id_parser.add_argument("--timeout", type=float, default=600.0)
+
+    for name in ("barrier", "arrive", "wait", "heartbeat", "abort"):
+        p = sub.add_parser(name)
+        p.add_argument("--rank", type=int, required=True)
+        p.add_argument("--run-id", default=None)
+        p.add_argument("--addr", default=None)
+        p.add_argument("--port", type=int, default=None)
+        p.add_argument("--file-dir", default="")
+        p.add_argument("--connect-timeout", type=float, default=60.0)
+        if name in ("barrier", "arrive", "wait"):
+            p.add_argument("--name", required=True)
+        if name in ("barrier", "wait"):
+            p.add_argument("--world-size", type=int, required=True)
+            p.add_argument("--timeout", type=float, default=36000)
+        if name == "heartbeat":
+            p.add_argument("--interval", type=float, default=HEARTBEAT_INTERVAL)
+        if name == "abort":
+            p.add_argument("--reason", default="")
+
+    args = parser.parse_args()
+    if args.command == "serve":
+        _serve(args)
+        return
+    if args.command == "run-id":
+        try:
+            print(resolve_run_id(args.rank, file_dir=args.file_dir, timeout=args.timeout))
+        except RendezvousError as e:
+            print(e, file=sys.stderr)
+            sys.exit(1)
+        return
+
+    rdzv = Rendezvous(
+        args.rank,
+        run_id=args.run_id,
+        addr=args.addr,
+        port=args.port,
+        file_dir=args.file_dir,
+        connect_timeout=args.connect_timeout,
+    )
+    try:
+        if args.command == "barrier":
+            rdzv.barrier(args.name, args.world_size, args.timeout)
+        elif args.command == "arrive":
+            rdzv.arrive(args.name)
+        elif args.command == "wait":
+            rdzv.wait(args.name, args.world_size, args.timeout)
+        elif args.command == "heartbeat":
+            _heartbeat_loop(rdzv, args.interval)
+        elif args.command == "abort":
+            rdzv.abort(args.reason)
+    except (RendezvousError, TimeoutError) as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+import argparse
+import csv
+import json
+import math
+import os
+import time
+from pathlib import Path
+
+import numpy as np
+
+from completion import resolve_runs_root
+from instance_manifest import LEVELS
+from result_store import load_scores
+
+DEFAULT_RESAMPLES = 2000
+# 目标每块权重矩阵约 2^25 个元素（float32 约 128 MB）
+_CHUNK_ELEMENTS = 1 << 25
+
+
+def _poisson_table():
+    # 16 位均匀整数按 Poisson(1) 分位数查表，比 rng.poisson 快一个数量级，概率误差 < 2e-5
+    cdf = np.cumsum([math.exp(-1) / math.factorial(k) for k in range(20)])
+    u = (np.arange(1 << 16) + 0.5) / (1 << 16)
+    return np.searchsorted(cdf, u).astype(np.float32)
+
+
+_POISSON_TABLE = _poisson_table()
+
+
+def poisson_weights(rng, resamples, n):
+    return _POISSON_TABLE[rng.integers(0, 1 << 16, size=(resamples, n), dtype=np.uint16)]
+
+
+def _aspect_scores(weighted_sums, weighted_counts, metric_aspect, num_aspects):
+    """``(..., metrics)`` weighted sums/counts -> ``(..., aspects + 1)`` scores x100, last column the overall mean."""
+    with np.errstate(invalid="ignore", divide="ignore"):
+        metric_means = weighted_sums / weighted_counts
+    present = ~np.isnan(metric_means)
+    shape = metric_means.shape[:-1] + (num_aspects,)
+    totals = np.zeros(shape)
+    counts = np.zeros(shape)
+    # 每个 aspect = 其下各指标均值的平均，与 result_store.mean_scores 一致
+    for index in range(num_aspects):
+        columns = metric_aspect == index
+        totals[..., index] = np.where(present[..., columns], metric_means[..., columns], 0).sum(axis=-1)
+        counts[..., index] = present[..., columns].sum(axis=-1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        aspects = totals / counts * 100
+        present = counts > 0
+        overall = np.where(present, aspects, 0).sum(axis=-1, keepdims=True) / present.sum(axis=-1, keepdims=True)
+    return np.concatenate([aspects, overall], axis=-1)
+
+
+def build_report(
+    keys, columns, matrix, visual_movement, aspect_list, group_by=None, resamples=DEFAULT_RESAMPLES, confidence=0.95, seed=0
+):
+    """Group-by means with Poisson-bootstrap confidence intervals for every aspect.
+
+    Instances are sorted so every finest group (all ``group_by`` levels) is a
+    contiguous block; each bootstrap chunk draws one ``(resamples, n)`` weight
+    matrix and needs a single matrix product per block. Coarser groups are sums
+    of their blocks, so every group-by shares the same resamples.
+    """
+    levels = LEVELS[visual_movement]
+    group_by = [field for field in (group_by or levels[:-1]) if field in levels and field != "instance"]
+    keep = [i for i, column in enumerate(columns) if column.split("/", 1)[0] in aspect_list]
+    columns = [columns[i] for i in keep]
+    matrix = matrix[:, keep] if len(keys) else np.zeros((0, len(keep)))
+    aspects = [aspect for aspect in aspect_list if any(c.split("/", 1)[0] == aspect for c in columns)]
+    metric_aspect = np.array([aspects.index(c.split("/", 1)[0]) for c in columns], dtype=np.int64)
+
+    parts = [str(key).split("/") for key in keys]
+    valid = [i for i, p in enumerate(parts) if len(p) == len(levels)]
+    positions = [levels.index(field) for field in group_by]
+    order = sorted(valid, key=lambda i: [parts[i][p] for p in positions])
+    labels = np.array([[parts[i][p] for p in positions] for i in order], dtype=object).reshape(len(order), len(group_by))
+    values = matrix[order]
+    mask = ~np.isnan(values)
+    data = np.concatenate([np.where(mask, values, 0), mask], axis=1)
+    num_metrics = len(columns)
+
+    # 最细分组的连续块
+    boundaries = [0] + [i for i in range(1, len(order)) if list(labels[i]) != list(labels[i - 1])] + [len(order)]
+    blocks = list(zip(boundaries[:-1], boundaries[1:])) if order else []
+    block_labels = [tuple(labels[start]) for start, _ in blocks]
+
+    groups = [("all", "all", list(range(len(blocks))))]
+    for f, field in enumerate(group_by):
+        members = {}
+        for b, label in enumerate(block_labels):
+            members.setdefault(label[f], []).append(b)
+        groups.extend((field, value, members[value]) for value in sorted(members))
+    membership = np.zeros((len(groups), len(blocks)), dtype=np.float32)
+    for g, (_, _, member_blocks) in enumerate(groups):
+        membership[g, member_blocks] = 1
+
+    def _group_scores(weights, data):
+        # weights: (r, n) -> (groups, r, aspects + 1)；每个块一次矩阵乘，粗分组由块求和得到
+        block_sums = np.zeros((len(blocks), len(weights), 2 * num_metrics), dtype=np.float64)
+        for b, (start, stop) in enumerate(blocks):
+            block_sums[b] = weights[:, start:stop] @ data[start:stop]
+        group_sums = np.tensordot(membership, block_sums, axes=(1, 0))
+        return _aspect_scores(group_sums[..., :num_metrics], group_sums[..., num_metrics:], metric_aspect, len(aspects))
+
+    # 点估计用 float64，与 worldscore_filtered_*.json 的均分逐位一致；重采样用 float32 矩阵乘
+    point = _group_scores(np.ones((1, len(order))), data)[:, 0]
+    data32 = data.astype(np.float32)
+
+    start_time = time.perf_counter()
+    rng = np.random.default_rng(seed)
+    samples = np.empty((len(groups), resamples, len(aspects) + 1))
+    chunk = max(1, min(resamples, _CHUNK_ELEMENTS // max(len(order), 1)))
+    for offset in range(0, resamples, chunk):
+        size = min(chunk, resamples - offset)
+        samples[:, offset : offset + size] = _group_scores(poisson_weights(rng, size, len(order)), data32)
+    low, high = point, point
+    if resamples:
+        alpha = (1 - confidence) / 2
+        with np.errstate(invalid="ignore"):
+            low, high = np.nanpercentile(samples, [alpha * 100, (1 - alpha) * 100], axis=1)
+
+    counts = membership @ np.array([stop - start for start, stop in blocks], dtype=np.float32).reshape(len(blocks))
+    names = aspects + ["overall"]
+    rows = []
+    for g, (field, value, _) in enumerate(groups):
+        for a, aspect in enumerate(names):
+            if np.isnan(point[g, a]):
+                continue
+            rows.append(
+                {
+                    "group_by": field,
+                    "group": value,
+                    "aspect": aspect,
+                    "instances": int(counts[g]),
+                    "mean": round(float(point[g, a]), 2),
+                    "ci_low": round(float(low[g, a]), 2),
+                    "ci_high": round(float(high[g, a]), 2),
+                }
+            )
+    return {
+        "visual_movement": visual_movement,
+        "instances": len(order),
+        "group_by": group_by,
+        "resamples": resamples,
+        "confidence": confidence,
+        "seed": seed,
+        "bootstrap_seconds": round(time.perf_counter() - start_time, 3),
+        "rows": rows,
+    }
+
+
+def write_report(report, output_prefix):
+    with open(f"{output_prefix}.json", "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=True)
+    with open(f"{output_prefix}.csv", "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=["group_by", "group", "aspect", "instances", "mean", "ci_low", "ci_high"])
+        writer.writeheader()
+        writer.writerows(report["rows"])
+    return output_prefix
+
+
+def report_prefix(output_path):
+    # worldscore_filtered_static.json -> worldscore_filtered_static_report.{json,csv}
+    return f"{os.path.splitext(str(output_path))[0]}_report"
+
+
+def print_report(report, group_by="all"):
+    print(
+        f"[{report['visual_movement']}] {report['instances']} instance(s), {report['resamples']} bootstrap resamples, "
+        f"{report['confidence']:.0%} CI ({report['bootstrap_seconds']:.1f}s)"
+    )
+    for row in report["rows"]:
+        if row["group_by"] == group_by:
+            print(
+                f"  {row['group']:<24} {row['aspect']:<28} {row['mean']:>7.2f}  "
+                f"[{row['ci_low']:.2f}, {row['ci_high']:.2f}]  n={row['instances']}"
+            )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Group-by score report with bootstrap confidence intervals from the result store")
+    parser.add_argument("--config-json", required=True, help="Resolved config JSON")
+    parser.add_argument("--visual-movement", action="append", default=[], help="Default: worldscore.visual_movement")
+    parser.add_argument("--group-by", default="", help="Comma-separated levels (default: every level above instance)")
+    parser.add_argument("--resamples", type=int, default=DEFAULT_RESAMPLES)
+    parser.add_argument("--confidence", type=float, default=0.95)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--generation", type=int, default=None, help="Result generation to report (default: current)")
+    args = parser.parse_args()
+
+    with open(args.config_json, "r", encoding="utf-8") as f:
+        cfg = json.load(f)
+    runs_root = resolve_runs_root(cfg)
+    selected_aspects = cfg.get("metrics", {}).get("aspects", [])
+    group_by = [field.strip() for field in args.group_by.split(",") if field.strip()]
+    for visual_movement in args.visual_movement or cfg.get("worldscore", {}).get("visual_movement", ["static", "dynamic"]):
+        keys, columns, matrix = load_scores(Path(runs_root) / visual_movement, args.generation)
+        aspect_list = selected_aspects or list(dict.fromkeys(column.split("/", 1)[0] for column in columns))
+        report = build_report(keys, columns, matrix, visual_movement, aspect_list, group_by, args.resamples, args.confidence, args.seed)
+        output_path = os.path.join(runs_root, f"worldscore_filtered_{visual_movement}.json")
+        if args.generation is not None:
+            output_path = os.path.join(runs_root, f"worldscore_filtered_{visual_movement}_gen{args.generation}.json")
+        prefix = write_report(report, report_prefix(output_path))
+        print_report(report)
+        print(f"Report written to {prefix}.json / {prefix}.csv")
+
+
+if __name__ == "__main__":
+    main()
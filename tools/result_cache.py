@@ -0,0 +1,190 @@
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+
+CACHE_FILENAME = "metric_cache.json"
+EVALUATION_FILENAME = "evaluation.json"
+EPOCHS_FILENAME = "metric_epochs.json"
+GENERATION_FILENAME = "generation.json"
+
+# 只有这些配置会影响指标数值，其它字段（路径、并行度等）变化不应让缓存失效
+CONFIG_KEYS = ("resolution", "frames", "fps", "focal_length")
+
+# 内容哈希只覆盖推理产物（视频/帧/相机与图像元数据），评测过程写出的文件不会让缓存失效
+CONTENT_EXTENSIONS = (".mp4", ".avi", ".mov", ".webm", ".png", ".jpg", ".jpeg")
+CONTENT_FILES = ("camera_data.json", "image_data.json")
+
+
+def _write_json_atomic(path, data):
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, ensure_ascii=True)
+    os.replace(tmp_path, path)
+
+
+def _content_signature(instance_dir: Path):
+    signature = []
+    for dirpath, dirnames, filenames in os.walk(instance_dir):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if not (filename.lower().endswith(CONTENT_EXTENSIONS) or filename in CONTENT_FILES):
+                continue
+            path = os.path.join(dirpath, filename)
+            st = os.stat(path)
+            signature.append([os.path.relpath(path, instance_dir), st.st_size, st.st_mtime_ns])
+    return signature
+
+
+def _hash_files(instance_dir: Path, signature):
+    digest = hashlib.sha256()
+    for relpath, _, _ in signature:
+        digest.update(relpath.encode("utf-8"))
+        with open(os.path.join(instance_dir, relpath), "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def load_metric_epochs(root_path: Path):
+    path = Path(root_path) / EPOCHS_FILENAME
+    if not path.exists():
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def bump_metric_epochs(root_path: Path, metric_names):
+    """Invalidate every cached cell of ``metric_names`` under ``root_path`` in O(1)."""
+    epochs = load_metric_epochs(root_path)
+    for metric_name in metric_names:
+        epochs[metric_name] = epochs.get(metric_name, 0) + 1
+    Path(root_path).mkdir(parents=True, exist_ok=True)
+    _write_json_atomic(Path(root_path) / EPOCHS_FILENAME, epochs)
+    return epochs
+
+
+def load_generation_info(root_path: Path):
+    path = Path(root_path) / GENERATION_FILENAME
+    if not path.exists():
+        return {"generation": 0, "history": []}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def load_generation(root_path: Path):
+    return int(load_generation_info(root_path)["generation"])
+
+
+def bump_generation(root_path: Path):
+    """Invalidate every result under ``root_path`` in O(1) by starting a new generation."""
+    info = load_generation_info(root_path)
+    info["generation"] = int(info["generation"]) + 1
+    info["history"].append({"generation": info["generation"], "time": time.time()})
+    Path(root_path).mkdir(parents=True, exist_ok=True)
+    _write_json_atomic(Path(root_path) / GENERATION_FILENAME, info)
+    return info["generation"]
+
+
+def cell_key(content_hash, aspect, metric_name, config, epoch=0, generation=0):
+    relevant = {k: config.get(k) for k in CONFIG_KEYS}
+    # 代数总是参与哈希：第 0 代的键与引入结果代数之前写的旧键不同，旧缓存会重算一次
+    fields = [content_hash, aspect, metric_name, relevant, epoch, generation]
+    payload = json.dumps(fields, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class InstanceCache:
+    """Per-instance store of metric results keyed by content hash and config.
+
+    Cells live in ``metric_cache.json`` next to ``evaluation.json`` so they move
+    with the instance directory. The file also records the result generation
+    its ``evaluation.json`` was written in.
+    """
+
+    def __init__(self, instance_dir, generation=0):
+        self.instance_dir = Path(instance_dir)
+        self.generation = generation
+        self.path = self.instance_dir / CACHE_FILENAME
+        self.data = {"content": {}, "cells": {}}
+        if self.path.exists():
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self.data = json.load(f)
+            except Exception:
+                pass
+        self._content_hash = None
+        self.dirty = False
+
+    def content_hash(self):
+        if self._content_hash is not None:
+            return self._content_hash
+        signature = _content_signature(self.instance_dir)
+        content = self.data.get("content", {})
+        # 文件大小和 mtime 未变时复用上次的哈希，避免每次都重读整段视频
+        if content.get("signature") == signature and content.get("sha256"):
+            self._content_hash = content["sha256"]
+        else:
+            self._content_hash = _hash_files(self.instance_dir, signature)
+            self.data["content"] = {"signature": signature, "sha256": self._content_hash}
+            self.dirty = True
+        return self._content_hash
+
+    def key(self, aspect, metric_name, config, epochs):
+        return cell_key(self.content_hash(), aspect, metric_name, config, epochs.get(metric_name, 0), self.generation)
+
+    def get(self, aspect, metric_name, key):
+        cell = self.data["cells"].get(f"{aspect}/{metric_name}")
+        if cell is None or cell.get("key") != key:
+            return None
+        return cell["score"]
+
+    def put(self, aspect, metric_name, key, score):
+        self.data["cells"][f"{aspect}/{metric_name}"] = {"key": key, "score": score}
+        self.dirty = True
+
+    def missing(self, cells, config, epochs):
+        return [
+            (aspect, metric_name)
+            for aspect, metric_name in cells
+            if self.get(aspect, metric_name, self.key(aspect, metric_name, config, epochs)) is None
+        ]
+
+    def evaluation(self, cells, config, epochs):
+        result = {}
+        for aspect, metric_name in cells:
+            score = self.get(aspect, metric_name, self.key(aspect, metric_name, config, epochs))
+            if score:
+                result.setdefault(aspect, {})[metric_name] = score
+        return result
+
+    def save(self):
+        if self.dirty:
+            self.data["generation"] = self.generation
+            _write_json_atomic(self.path, self.data)
+            self.dirty = False
+
+
+def evaluation_generation(instance_dir):
+    """Generation of the ``evaluation.json`` in ``instance_dir`` (``0`` when it predates generations)."""
+    try:
+        with open(Path(instance_dir) / CACHE_FILENAME, "r", encoding="utf-8") as f:
+            return int(json.load(f).get("generation", 0))
+    except Exception:
+        return 0
+
+
+def read_evaluation(instance_dir):
+    path = Path(instance_dir) / EVALUATION_FILENAME
+    if not path.exists():
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+
+def write_evaluation(instance_dir, evaluation):
+    _write_json_atomic(Path(instance_dir) / EVALUATION_FILENAME, evaluation)
@@ -0,0 +1,178 @@
+import os
+import shutil
+import sqlite3
+from pathlib import Path
+
+import numpy as np
+
+from result_cache import load_generation
+
+STORE_DIRNAME = "results"
+GENERATION_PREFIX = "gen_"
+
+
+def _column(aspect, metric_name):
+    return f"{aspect}/{metric_name}"
+
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _score_value(metric_score):
+    value = metric_score.get("score_normalized") if isinstance(metric_score, dict) else None
+    if value is None:
+        return None
+    return float(np.mean(value))
+
+
+def store_dir(root_path, generation=None):
+    """Store directory of ``generation`` (default: the current one); generation 0 is the pre-generation layout."""
+    # 放在 visual_movement 目录之外，避免被实例发现逻辑当成 visual_style 目录遍历
+    root_path = Path(root_path)
+    directory = root_path.parent / STORE_DIRNAME / root_path.name
+    if generation is None:
+        generation = load_generation(root_path)
+    return directory / f"{GENERATION_PREFIX}{generation}" if generation else directory
+
+
+def stored_generations(root_path):
+    """Generations that still have shard files under ``root_path``'s store, ascending."""
+    directory = store_dir(root_path, 0)
+    if not directory.exists():
+        return []
+    generations = [0] if any(directory.glob("shard_*.sqlite")) else []
+    for path in directory.iterdir():
+        if path.is_dir() and path.name.startswith(GENERATION_PREFIX) and path.name[len(GENERATION_PREFIX) :].isdigit():
+            generations.append(int(path.name[len(GENERATION_PREFIX) :]))
+    return sorted(generations)
+
+
+class ResultStore:
+    """Wide SQLite table of instance scores: one row per instance, one column per metric.
+
+    Each shard writes its own file from the parent process only, so there is a
+    single writer per file even on shared storage.
+    """
+
+    def __init__(self, root_path, shard_index=0, generation=None):
+        self.path = store_dir(root_path, generation) / f"shard_{shard_index}.sqlite"
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.path))
+        self.conn.execute("CREATE TABLE IF NOT EXISTS scores (instance TEXT PRIMARY KEY)")
+        self.columns = {row[1] for row in self.conn.execute("PRAGMA table_info(scores)")} - {"instance"}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _ensure_columns(self, columns):
+        for column in columns:
+            if column not in self.columns:
+                self.conn.execute(f"ALTER TABLE scores ADD COLUMN {_quote(column)} REAL")
+                self.columns.add(column)
+
+    def append(self, evaluations):
+        """Upsert ``{instance_key: evaluation_dict}`` in one transaction."""
+        rows = []
+        for instance_key, evaluation in evaluations.items():
+            row = {}
+            for aspect, aspect_scores in evaluation.items():
+                for metric_name, metric_score in aspect_scores.items():
+                    if not metric_score:
+                        continue
+                    row[_column(aspect, metric_name)] = _score_value(metric_score)
+            rows.append((instance_key, row))
+        with self.conn:
+            self._ensure_columns({column for _, row in rows for column in row})
+            # 整行覆盖，与重写后的 evaluation.json 保持一致
+            for instance_key, row in rows:
+                columns = ["instance"] + list(row)
+                placeholders = ", ".join("?" for _ in columns)
+                self.conn.execute(
+                    f"INSERT OR REPLACE INTO scores ({', '.join(_quote(c) for c in columns)}) VALUES ({placeholders})",
+                    [instance_key] + list(row.values()),
+                )
+
+    def close(self):
+        self.conn.close()
+
+
+def has_store(root_path, generation=None):
+    directory = store_dir(root_path, generation)
+    return directory.exists() and any(directory.glob("shard_*.sqlite"))
+
+
+def load_scores(root_path, generation=None):
+    """Read every shard file once and return ``(instance_keys, columns, matrix)``.
+
+    Missing cells are NaN. When the same instance appears in several shard
+    files (e.g. the shard count changed between runs), the newest file wins.
+    """
+    paths = sorted(store_dir(root_path, generation).glob("shard_*.sqlite"), key=lambda p: p.stat().st_mtime)
+    keys, columns, blocks = [], [], []
+    column_index = {}
+    for path in paths:
+        conn = sqlite3.connect(str(path))
+        try:
+            cursor = conn.execute("SELECT * FROM scores")
+            names = [d[0] for d in cursor.description]
+            rows = cursor.fetchall()
+        finally:
+            conn.close()
+        if not rows:
+            continue
+        for name in names[1:]:
+            if name not in column_index:
+                column_index[name] = len(columns)
+                columns.append(name)
+        block = np.array([row[1:] for row in rows], dtype=np.float64).reshape(len(rows), len(names) - 1)
+        keys.extend(row[0] for row in rows)
+        blocks.append((block, [column_index[name] for name in names[1:]]))
+
+    matrix = np.full((len(keys), len(columns)), np.nan)
+    offset = 0
+    for block, positions in blocks:
+        matrix[offset : offset + len(block), positions] = block
+        offset += len(block)
+
+    keys = np.array(keys, dtype=object)
+    if len(keys):
+        # 保留每个 instance 最后一次出现（最新的分片文件）
+        _, last = np.unique(keys[::-1], return_index=True)
+        keep = np.sort(len(keys) - 1 - last)
+        keys, matrix = keys[keep], matrix[keep]
+    return list(keys), columns, matrix
+
+
+def mean_scores(columns, matrix, aspect_list):
+    """Aspect score = mean over metrics of the per-metric mean over instances, x100."""
+    if not columns:
+        return {}
+    counts = np.sum(~np.isnan(matrix), axis=0)
+    sums = np.nansum(matrix, axis=0)
+    metric_means = np.divide(sums, counts, out=np.full(len(columns), np.nan), where=counts > 0)
+    aspects = np.array([column.split("/", 1)[0] for column in columns])
+    scores = {}
+    for aspect in dict.fromkeys(aspects):
+        if aspect not in aspect_list:
+            continue
+        values = metric_means[(aspects == aspect) & (counts > 0)]
+        if len(values):
+            scores[str(aspect)] = round(float(np.mean(values)) * 100, 2)
+    return scores
+
+
+def remove_store(root_path, generation=None):
+    if generation is None:
+        generation = load_generation(root_path)
+    directory = store_dir(root_path, generation)
+    if not directory.exists():
+        return
+    if generation:
+        shutil.rmtree(directory, ignore_errors=True)
+        return
+    for path in directory.glob("shard_*.sqlite*"):
+        os.remove(path)
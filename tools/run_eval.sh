@@ -9,7 +9,6 @@ import json
 import os
 import subprocess
 import sys
-import time
 
 cfg_path = sys.argv[1]
 script_dir = sys.argv[2]
@@ -17,10 +16,20 @@ with open(cfg_path, "r", encoding="utf-8") as f:
     cfg = json.load(f)
 
 compute = cfg.get("compute", {})
-num_jobs = int(compute.get("eval_num_jobs", compute.get("num_gpus", 1)))
+num_jobs = compute.get("eval_num_jobs", compute.get("num_gpus", 1))
+# auto：按所选指标的显存占用把每张卡尽量装满
+num_jobs = 0 if num_jobs == "auto" else int(num_jobs)
+follow = os.environ.get("EVAL_FOLLOW") == "1"
+if follow:
+    # 流水线模式下只拿到部分 GPU，每张卡一个常驻 worker
+    visible = [g for g in os.environ.get("CUDA_VISIBLE_DEVICES", "").split(",") if g.strip()]
+    num_jobs = int(compute.get("pipeline_eval_num_jobs", len(visible) or num_jobs))
+chunk_size = int(compute.get("eval_chunk_size", 1))
 num_shards = int(compute.get("eval_num_shards", os.environ.get("NNODES", os.environ.get("MLP_WORKER_NUM", 1))))
 shard_index = int(compute.get("eval_shard_index", os.environ.get("NODE_RANK", os.environ.get("MLP_ROLE_INDEX", 0))))
-skip_mean = bool(compute.get("eval_skip_mean", num_shards > 1))
+# 工作账本模式下各节点动态领取实例，全部完成后由节点 0 直接从结果库计算均分，不再等待和合并分片
+work_stealing = bool(compute.get("eval_work_stealing", False)) and num_shards > 1 and os.environ.get("EVAL_FOLLOW") != "1"
+skip_mean = bool(compute.get("eval_skip_mean", num_shards > 1 and not (work_stealing and shard_index == 0)))
 auto_mean = bool(compute.get("eval_auto_mean", True))
 
 worldscore = cfg.get("worldscore", {})
@@ -45,15 +54,36 @@ cmd = [
     os.path.join(script_dir, "evaluate_filtered.py"),
     "--config-json", cfg_path,
     "--num-jobs", str(num_jobs),
+    "--chunk-size", str(chunk_size),
+    "--prefetch-depth", str(compute.get("eval_prefetch_depth", 2)),
+    "--prefetch-mb", str(compute.get("eval_prefetch_mb", 4096)),
     "--num-shards", str(num_shards),
     "--shard-index", str(shard_index),
+    "--gpu-packing", compute.get("eval_gpu_packing", "round-robin"),
+    "--gpu-memory-fraction", str(compute.get("eval_gpu_memory_fraction", 0.9)),
+    "--oom-retries", str(compute.get("eval_oom_retries", 2)),
 ]
+if compute.get("eval_memory_table"):
+    cmd.extend(["--memory-table", compute["eval_memory_table"]])
+# 分组均值 + bootstrap 置信区间报告，写在 worldscore_filtered_*.json 旁边
+report_args = []
+if int(compute.get("eval_report_resamples", 0)) > 0:
+    report_args = ["--report-resamples", str(compute["eval_report_resamples"])]
+    if compute.get("eval_report_group_by"):
+        report_args.extend(["--report-group-by", ",".join(compute["eval_report_group_by"])])
+cmd.extend(report_args)
 
-if skip_mean:
-    cmd.append("--skip-mean")
+sys.path.insert(0, script_dir)
+from sweep import leaderboard, load_manifest, manifest_path, print_leaderboard, sweep_checkpoints
 
-print("Running:", " ".join(cmd))
-subprocess.check_call(cmd, env=env, cwd=worldscore_root)
+sweep_labels = [""]
+label_configs = [cfg_path]
+if sweep_checkpoints(cfg):
+    # 所有 checkpoint 在同一个评测进程里依次评测，指标模型只加载一次
+    sweep_manifest = manifest_path(cfg)
+    sweep_labels = [entry["label"] for entry in load_manifest(sweep_manifest)]
+    label_configs = [entry["config_json"] for entry in load_manifest(sweep_manifest)]
+    cmd.extend(["--sweep-json", sweep_manifest])
 
 if num_shards > 1:
     run_cfg = cfg.get("run", {})
@@ -62,33 +92,169 @@ if num_shards > 1:
         raise RuntimeError("run.output_root is required for sharded evaluation")
     done_dir = os.path.join(output_root, "eval_shards")
     os.makedirs(done_dir, exist_ok=True)
-    done_file = os.path.join(done_dir, f"shard_{shard_index}.done")
-    with open(done_file, "w", encoding="utf-8") as f:
-        f.write("done\n")
+    cmd.extend(["--partial-dir", done_dir])
+    # 各节点共用一个运行 ID：没有 infra.sh 导出的 RDZV_RUN_ID 时由节点 0 随机生成并下发，
+    # 评测进程里的换代屏障、分片结束屏障和工作账本都用它，重跑不会复用旧的标记和账本
+    from rendezvous import resolve_run_id
+
+    rdzv_dir = os.environ.get("RDZV_DIR") or os.path.join(output_root, "rendezvous")
+    run_id = os.environ.get("RDZV_RUN_ID") or resolve_run_id(shard_index, file_dir=rdzv_dir)
+    os.environ["RDZV_RUN_ID"] = run_id
+    env["RDZV_RUN_ID"] = run_id
+    cmd.extend(["--rendezvous-dir", rdzv_dir])
+    if work_stealing:
+        cmd.extend([
+            "--work-ledger", os.path.join(output_root, "work_ledger", run_id),
+            "--lease-timeout", str(compute.get("eval_lease_timeout", 120)),
+            "--ledger-retries", str(compute.get("eval_ledger_retries", 2)),
+        ])
+
+# 筛选 checkpoint：按分层随机顺序评测，各 aspect 置信区间都收窄到阈值以下即停止
+if float(compute.get("eval_early_stop_halfwidth", 0)) > 0:
+    if num_shards > 1 or follow:
+        raise RuntimeError("compute.eval_early_stop_halfwidth needs a single evaluation shard outside pipeline mode")
+    cmd.extend([
+        "--early-stop-halfwidth", str(compute["eval_early_stop_halfwidth"]),
+        "--early-stop-confidence", str(compute.get("eval_early_stop_confidence", 0.95)),
+        "--early-stop-min-instances", str(compute.get("eval_early_stop_min_instances", 30)),
+        "--early-stop-seed", str(compute.get("eval_early_stop_seed", 0)),
+    ])
+
+for hook in compute.get("eval_frame_cache_hooks", []):
+    cmd.extend(["--frame-cache-hook", hook])
+if compute.get("eval_frame_cache_dir"):
+    cmd.extend(["--frame-cache-dir", compute["eval_frame_cache_dir"]])
+if compute.get("eval_frame_cache_gb"):
+    cmd.extend(["--frame-cache-gb", str(compute["eval_frame_cache_gb"])])
+
+# 批量指标：整块实例的帧拼批计算，块越大单次前向的批越满
+for adapter in compute.get("eval_batch_metrics", []):
+    cmd.extend(["--batch-metric", adapter])
+if compute.get("eval_metric_batch_size"):
+    cmd.extend(["--metric-batch-size", str(compute["eval_metric_batch_size"])])
+
+# 实时进度：每个节点定期重写 <run.output_root>/telemetry/<运行 ID>/node_<i>.json，节点 0 汇总 run_status.json
+output_root = cfg.get("run", {}).get("output_root", "")
+telemetry_dir = ""
+if compute.get("eval_telemetry", True) and output_root:
+    run_id = os.environ.get("RDZV_RUN_ID") or cfg.get("run", {}).get("name", "run")
+    telemetry_dir = os.path.join(output_root, "telemetry", run_id)
+    cmd.extend([
+        "--telemetry-dir", telemetry_dir,
+        "--telemetry-interval", str(compute.get("eval_telemetry_interval", 15)),
+        "--stall-seconds", str(compute.get("eval_stall_seconds", 600)),
+    ])
+if compute.get("eval_telemetry_port"):
+    cmd.extend(["--telemetry-port", str(compute["eval_telemetry_port"])])
+
+if compute.get("eval_trace", False):
+    trace_dir = os.path.join(cfg.get("paths", {}).get("run_dir", "."), "eval_trace")
+    cmd.extend(["--trace-dir", trace_dir, "--trace-granularity", compute.get("eval_trace_granularity", "instance")])
+
+run_dir = cfg.get("paths", {}).get("run_dir")
+startup_log = os.path.join(run_dir, "eval_startup.jsonl") if run_dir else ""
+if startup_log:
+    cmd.extend(["--startup-log", startup_log])
+
+if skip_mean:
+    cmd.append("--skip-mean")
+
+if follow:
+    cmd.extend(["--follow", "--follow-interval", str(compute.get("pipeline_poll_interval", 30))])
+
+print("Running:", " ".join(cmd))
+subprocess.check_call(cmd, env=env, cwd=worldscore_root)
+
+if num_shards > 1 and not work_stealing:
+    from rendezvous import Rendezvous
+
+    rdzv = Rendezvous(shard_index, file_dir=rdzv_dir)
+    rdzv.arrive("eval_shard")
 
     if shard_index == 0 and auto_mean:
         timeout_sec = int(os.environ.get("EVAL_WAIT_TIMEOUT", "36000"))
-        waited = 0
-        missing = True
-        while missing and waited < timeout_sec:
-            missing = False
-            for i in range(num_shards):
-                if not os.path.exists(os.path.join(done_dir, f"shard_{i}.done")):
-                    missing = True
+        rdzv.wait("eval_shard", num_shards, timeout_sec)
+
+        # 合并各分片写出的部分聚合结果，无需重新读取任何样本文件
+        from partial_aggregate import merge_partials
+
+        rescan = False
+        for label in sweep_labels:
+            for visual_movement in worldscore.get("visual_movement", ["static", "dynamic"]):
+                try:
+                    scores, report = merge_partials(os.path.join(done_dir, label), visual_movement, num_shards)
+                except (FileNotFoundError, ValueError) as e:
+                    # 缺分片或同一实例被多个分片算过时分片结果不可信，改为按本次的过滤条件从结果库重新计算
+                    print(f"Warning: {e}; falling back to a full rescan.")
+                    rescan = True
                     break
-            if missing:
-                time.sleep(10)
-                waited += 10
-
-        if missing:
-            raise RuntimeError("Timed out waiting for all eval shards to finish")
-
-        mean_cmd = [
-            "python",
-            os.path.join(script_dir, "evaluate_filtered.py"),
-            "--config-json", cfg_path,
-            "--only-calc-mean",
-        ]
-        print("Running:", " ".join(mean_cmd))
-        subprocess.check_call(mean_cmd, env=env, cwd=worldscore_root)
+                if report["missing"]:
+                    print(
+                        f"Warning: {len(report['missing'])} assigned {visual_movement} instance(s) have no scores, "
+                        f"e.g. {report['missing'][:5]}"
+                    )
+                if not report["output_path"]:
+                    continue
+                with open(report["output_path"], "w", encoding="utf-8") as f:
+                    json.dump(scores, f, indent=2, ensure_ascii=True)
+                report_path = os.path.splitext(report["output_path"])[0] + "_shards.json"
+                with open(report_path, "w", encoding="utf-8") as f:
+                    json.dump(report, f, indent=2, ensure_ascii=True)
+                print(f"Merged {report['instances']} {visual_movement} instances from {num_shards} shards: {scores}")
+            if rescan:
+                break
+
+        if report_args and not rescan:
+            # 合并分片只得到均分；报告需要逐实例分数，从各分片共享的结果库计算
+            for label_config in label_configs:
+                report_cmd = [
+                    "python",
+                    os.path.join(script_dir, "report.py"),
+                    "--config-json", label_config,
+                    "--resamples", str(compute["eval_report_resamples"]),
+                ]
+                if compute.get("eval_report_group_by"):
+                    report_cmd.extend(["--group-by", ",".join(compute["eval_report_group_by"])])
+                print("Running:", " ".join(report_cmd))
+                subprocess.check_call(report_cmd, env=env)
+
+        if rescan:
+            mean_cmd = [
+                "python",
+                os.path.join(script_dir, "evaluate_filtered.py"),
+                "--config-json", cfg_path,
+                "--only-calc-mean",
+            ]
+            if sweep_labels != [""]:
+                mean_cmd.extend(["--sweep-json", sweep_manifest])
+            if startup_log:
+                mean_cmd.extend(["--startup-log", startup_log])
+            mean_cmd.extend(report_args)
+            print("Running:", " ".join(mean_cmd))
+            subprocess.check_call(mean_cmd, env=env, cwd=worldscore_root)
+
+# plan_eval.py plan 给出过预测时，用这次运行的遥测记录实际耗时，校正后续规划的代价模型
+eval_plan = os.path.join(run_dir, "eval_plan", "plan.json") if run_dir else ""
+if (
+    telemetry_dir
+    and not follow
+    and shard_index == 0
+    and (num_shards == 1 or work_stealing or auto_mean)
+    and os.path.exists(eval_plan)
+):
+    check_cmd = [
+        "python",
+        os.path.join(script_dir, "plan_eval.py"),
+        "check",
+        "--config-json", cfg_path,
+        "--plan-json", eval_plan,
+        "--telemetry-dir", telemetry_dir,
+    ]
+    print("Running:", " ".join(check_cmd))
+    if subprocess.call(check_cmd, env=env) != 0:
+        print("Warning: eval plan check failed; the cost model history was not updated.")
+
+if sweep_labels != [""] and (shard_index == 0 and auto_mean if num_shards > 1 and not work_stealing else not skip_mean):
+    rows = leaderboard(sweep_manifest, os.path.join(os.path.dirname(sweep_manifest), "sweep_leaderboard"))
+    print_leaderboard(rows)
 PY
@@ -2,8 +2,9 @@
 set -euo pipefail
 
 CONFIG_JSON="$1"
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
 
-python - <<'PY' "$CONFIG_JSON"
+python - <<'PY' "$CONFIG_JSON" "$SCRIPT_DIR"
 import json
 import os
 import subprocess
@@ -19,11 +20,15 @@ def get_env_var(var_names, default_val):
     return default_val
 
 cfg_path = sys.argv[1]
+sys.path.insert(0, sys.argv[2])
+from infer_plan import plan_path
+from sweep import load_manifest, manifest_path, sweep_checkpoints
+
 with open(cfg_path, "r", encoding="utf-8") as f:
     cfg = json.load(f)
 
 compute = cfg.get("compute", {})
-num_gpus = int(compute.get("num_gpus", 1))
+num_gpus = int(os.environ.get("INFER_NUM_GPUS") or compute.get("num_gpus", 1))
 use_dp = bool(compute.get("infer_use_dp", False))
 
 # 修复优先级：火山引擎环境变量 > 普通环境变量 > 配置文件 > 默认值
@@ -51,35 +56,67 @@ sampled_json = worldscore.get("sampled_json_path")
 if cfg.get("filters", {}).get("enable", False):
     sampled_json = paths.get("filtered_json", sampled_json)
 
-cmd = [
-    "python",
-    "/ML-vePFS/research_gen/tja/WorldScore/run_wan_cam_worldscore_dp_sampled_custom_ckpt.py",
-    "--infra_config", cfg_path,
-    "--worldscore_model_name", worldscore.get("model_name", "fantasy_world"),
-    "--checkpoint_path", wan.get("checkpoint_path", ""),
-    "--model_path", wan.get("base_model_root", ""),
-    "--sampled_json_path", sampled_json,
-]
-
-if use_dp and num_gpus > 1:
-    cmd = [
-        "torchrun",
-        f"--nnodes={nnodes}",
-        f"--nproc_per_node={num_gpus}",
-        f"--node_rank={node_rank}",
-        f"--master_addr={master_addr}",
-        f"--master_port={master_port}",
-        "/ML-vePFS/research_gen/tja/WorldScore/run_wan_cam_worldscore_dp_sampled_custom_ckpt.py",
-        "--infra_config", cfg_path,
+INFER_SCRIPT = "/ML-vePFS/research_gen/tja/WorldScore/run_wan_cam_worldscore_dp_sampled_custom_ckpt.py"
+
+
+def infer_cmd(config_path, checkpoint_path, extra=()):
+    args = [
+        INFER_SCRIPT,
+        "--infra_config", config_path,
         "--worldscore_model_name", worldscore.get("model_name", "fantasy_world"),
-        "--checkpoint_path", wan.get("checkpoint_path", ""),
+        "--checkpoint_path", checkpoint_path,
         "--model_path", wan.get("base_model_root", ""),
         "--sampled_json_path", sampled_json,
-        "--use_dp",
+        *extra,
     ]
+    if use_dp and num_gpus > 1:
+        return [
+            "torchrun",
+            f"--nnodes={nnodes}",
+            f"--nproc_per_node={num_gpus}",
+            f"--node_rank={node_rank}",
+            f"--master_addr={master_addr}",
+            f"--master_port={master_port}",
+            *args,
+            "--use_dp",
+        ]
+    return ["python", *args]
+
+
+def plan_args(label=""):
+    # filter_cases.py 在节点 0 写出的按 rank 分配计划；推理脚本据 --plan_json 只生成本 rank 的样本
+    if not compute.get("infer_plan", False):
+        return ()
+    path = plan_path(cfg, label)
+    if not os.path.exists(path):
+        print(f"Warning: compute.infer_plan is set but {path} does not exist; running without a plan.")
+        return ()
+    with open(path, "r", encoding="utf-8") as f:
+        plan = json.load(f)
+    ranks_per_node = num_gpus if use_dp and num_gpus > 1 else 1
+    if (plan["nnodes"], plan["ranks_per_node"]) != (nnodes, ranks_per_node):
+        # 例如流水线模式只分到部分 GPU
+        print(
+            f"Warning: plan {path} is for {plan['nnodes']}x{plan['ranks_per_node']} ranks, "
+            f"this launch has {nnodes}x{ranks_per_node}; running without a plan."
+        )
+        return ()
+    return ("--plan_json", path)
+
+
+runs = [(cfg_path, wan.get("checkpoint_path", ""), plan_args())]
+if sweep_checkpoints(cfg):
+    entries = load_manifest(manifest_path(cfg))
+    if compute.get("sweep_infer_mode", "per_checkpoint") == "script":
+        # 推理脚本支持 --sweep_json 时：基础模型只加载一次，逐个 checkpoint 替换 transformer 权重
+        runs = [(entries[0]["config_json"], entries[0]["checkpoint_path"], ("--sweep_json", manifest_path(cfg)))]
+    else:
+        runs = [(entry["config_json"], entry["checkpoint_path"], plan_args(entry["label"])) for entry in entries]
 
 print("Running Distributed Setup:")
 print(f"NNODES: {nnodes}, NODE_RANK: {node_rank}, MASTER_ADDR: {master_addr}, MASTER_PORT: {master_port}")
-print("Running Command:", " ".join(cmd))
-subprocess.check_call(cmd, env=env)
-PY
\ No newline at end of file
+for config_path, checkpoint_path, extra in runs:
+    cmd = infer_cmd(config_path, checkpoint_path, extra)
+    print("Running Command:", " ".join(cmd))
+    subprocess.check_call(cmd, env=env)
+PY
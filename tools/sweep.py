@@ -0,0 +1,159 @@
+import argparse
+import copy
+import csv
+import json
+import os
+import re
+
+from completion import resolve_runs_root
+
+MANIFEST_FILENAME = "sweep.json"
+LEADERBOARD_FILENAME = "sweep_leaderboard"
+_STEP_PATTERN = re.compile(r"^(checkpoint|ckpt|step|iter|epoch)[-_]?\d+$", re.IGNORECASE)
+
+
+def sweep_checkpoints(cfg):
+    entries = []
+    for item in cfg.get("sweep", {}).get("checkpoints", []) or []:
+        if isinstance(item, str):
+            item = {"path": item}
+        entries.append({"path": item["path"], "label": item.get("label") or checkpoint_label(item["path"])})
+    labels = [entry["label"] for entry in entries]
+    duplicates = sorted({label for label in labels if labels.count(label) > 1})
+    if duplicates:
+        raise ValueError(f"sweep.checkpoints has duplicate labels {duplicates}; set an explicit label for each")
+    return entries
+
+
+def checkpoint_label(path):
+    # .../checkpoint-3080/transformer/diffusion_pytorch_model.safetensors -> checkpoint-3080
+    parts = [p for p in os.path.normpath(path).split(os.sep) if p]
+    for part in reversed(parts):
+        if _STEP_PATTERN.match(part):
+            return part
+    stem = os.path.splitext(parts[-1])[0] if parts else "checkpoint"
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", stem)
+
+
+def manifest_path(cfg):
+    return os.path.join(cfg.get("paths", {}).get("run_dir", "."), MANIFEST_FILENAME)
+
+
+def expand(cfg):
+    """Write one resolved config per swept checkpoint plus the sweep manifest; returns the manifest path.
+
+    Each checkpoint gets its own ``worldscore.output_dir`` (``<output_dir>/<label>``),
+    so inference outputs, result stores and score JSONs never mix. Everything
+    else (filters, metrics, compute) is shared.
+    """
+    checkpoints = sweep_checkpoints(cfg)
+    if not checkpoints:
+        return ""
+    if cfg.get("run", {}).get("mode") == "pipeline":
+        raise ValueError("sweep.checkpoints is not supported with run.mode: pipeline")
+    run_dir = cfg.get("paths", {}).get("run_dir", ".")
+    base_output_dir = cfg.get("worldscore", {}).get("output_dir") or "."
+    entries = []
+    for checkpoint in checkpoints:
+        label = checkpoint["label"]
+        entry_cfg = copy.deepcopy(cfg)
+        entry_cfg.pop("sweep", None)
+        entry_cfg.setdefault("wan", {})["checkpoint_path"] = checkpoint["path"]
+        entry_cfg.setdefault("worldscore", {})["output_dir"] = os.path.normpath(os.path.join(base_output_dir, label))
+        config_json = os.path.join(run_dir, "sweep", label, "resolved_config.json")
+        _write_json(config_json, entry_cfg)
+        entries.append(
+            {
+                "label": label,
+                "checkpoint_path": checkpoint["path"],
+                "config_json": config_json,
+                "output_dir": entry_cfg["worldscore"]["output_dir"],
+            }
+        )
+    path = manifest_path(cfg)
+    _write_json(path, {"checkpoints": entries})
+    return path
+
+
+def _write_json(path, data):
+    # 每个节点都会展开一次，写临时文件再替换，避免其它节点读到写了一半的文件
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, ensure_ascii=True)
+    os.replace(tmp_path, path)
+
+
+def load_manifest(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)["checkpoints"]
+
+
+def _score_path(cfg, visual_movement):
+    # 与 evaluate_filtered.py 写均分的位置一致：<runs_root>/<output_dir>/
+    return os.path.join(resolve_runs_root(cfg), f"worldscore_filtered_{visual_movement}.json")
+
+
+def leaderboard(manifest, output_prefix):
+    """Collect every checkpoint's score JSONs into ``<output_prefix>.json``/``.csv``, best overall first."""
+    rows = []
+    for entry in load_manifest(manifest):
+        with open(entry["config_json"], "r", encoding="utf-8") as f:
+            cfg = json.load(f)
+        row = {"label": entry["label"], "checkpoint_path": entry["checkpoint_path"], "scores": {}, "missing": []}
+        for visual_movement in cfg.get("worldscore", {}).get("visual_movement", ["static", "dynamic"]):
+            path = _score_path(cfg, visual_movement)
+            if not os.path.exists(path):
+                row["missing"].append(visual_movement)
+                continue
+            with open(path, "r", encoding="utf-8") as f:
+                scores = json.load(f)
+            for aspect, value in scores.items():
+                row["scores"][f"{visual_movement}/{aspect}"] = value
+        values = list(row["scores"].values())
+        row["overall"] = round(sum(values) / len(values), 2) if values else None
+        rows.append(row)
+    rows.sort(key=lambda r: (r["overall"] is None, -(r["overall"] or 0)))
+
+    with open(f"{output_prefix}.json", "w", encoding="utf-8") as f:
+        json.dump(rows, f, indent=2, ensure_ascii=True)
+    columns = sorted({column for row in rows for column in row["scores"]})
+    with open(f"{output_prefix}.csv", "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["rank", "label", "overall", *columns, "checkpoint_path"])
+        for rank, row in enumerate(rows, 1):
+            writer.writerow([rank, row["label"], row["overall"], *(row["scores"].get(c, "") for c in columns), row["checkpoint_path"]])
+    return rows
+
+
+def print_leaderboard(rows):
+    print(f"{'rank':>4} {'label':<32} {'overall':>8}  missing")
+    for rank, row in enumerate(rows, 1):
+        overall = f"{row['overall']:.2f}" if row["overall"] is not None else "-"
+        print(f"{rank:>4} {row['label']:<32} {overall:>8}  {','.join(row['missing']) or '-'}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Checkpoint sweep: per-checkpoint configs and the combined leaderboard")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("expand", help="Write per-checkpoint configs and the manifest; prints the manifest path")
+    p.add_argument("--config-json", required=True, help="Resolved config JSON with sweep.checkpoints")
+
+    p = sub.add_parser("leaderboard", help="Combine every checkpoint's score JSONs")
+    p.add_argument("--manifest", required=True)
+    p.add_argument("--output-prefix", default="", help="Defaults to sweep_leaderboard next to the manifest")
+    args = parser.parse_args()
+
+    if args.command == "expand":
+        with open(args.config_json, "r", encoding="utf-8") as f:
+            cfg = json.load(f)
+        print(expand(cfg))
+    else:
+        prefix = args.output_prefix or os.path.join(os.path.dirname(os.path.abspath(args.manifest)), LEADERBOARD_FILENAME)
+        print_leaderboard(leaderboard(args.manifest, prefix))
+        print(f"Leaderboard written to {prefix}.json / {prefix}.csv")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,339 @@
+import argparse
+import json
+import os
+import socket
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+RUN_STATUS_FILENAME = "run_status.json"
+DEFAULT_WINDOW = 300.0
+DEFAULT_STALL_SECONDS = 600.0
+
+
+def _write_json_atomic(path, data):
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, ensure_ascii=True)
+    os.replace(tmp_path, path)
+
+
+def _eta(remaining, rate):
+    if remaining is None:
+        return None
+    if remaining <= 0:
+        return 0.0
+    return round(remaining / rate, 1) if rate > 0 else None
+
+
+class _Section:
+    def __init__(self, total, scope):
+        self.total = total
+        self.scope = scope
+        self.done = set()
+        self.failed = set()
+        self.window = deque()
+        self.started = time.time()
+        self.last_progress = None
+        self.computed = 0
+        self.cached = 0
+        self.seconds = 0.0
+
+    def rate(self, now, window):
+        while self.window and self.window[0] < now - window:
+            self.window.popleft()
+        span = min(window, now - self.started)
+        return len(self.window) / span if span > 0 else 0.0
+
+    def status(self, now, window):
+        rate = self.rate(now, window)
+        remaining = None
+        if self.total is not None and self.scope == "shard":
+            # 共享账本时剩余量由所有节点一起消化，单节点的 ETA 没有意义，看 run_status.json
+            remaining = max(self.total - len(self.done) - len(self.failed - self.done), 0)
+        return {
+            "scope": self.scope,
+            "total": self.total,
+            "done": len(self.done),
+            "failed": len(self.failed - self.done),
+            "computed_cells": self.computed,
+            "cached_cells": self.cached,
+            "seconds_per_instance": round(self.seconds / len(self.done), 3) if self.done else None,
+            "throughput": round(rate, 4),
+            "eta_seconds": _eta(remaining, rate),
+            "last_progress": self.last_progress,
+        }
+
+
+class Telemetry:
+    """Per-node aggregator of worker progress events.
+
+    Every evaluation stage (a visual movement, per checkpoint in a sweep) is a
+    section with a known ``total``: the node's own shard, or the whole
+    movement (``scope="run"``) when nodes share a work ledger. Instances are
+    counted once however often a retried chunk reports them. Throughput is
+    taken over the last ``window`` seconds. With ``status_dir`` set, a thread
+    rewrites ``node_<rank>.json`` every ``interval`` seconds and node 0 merges
+    all nodes into ``run_status.json``; with ``port`` set, ``/metrics``
+    (Prometheus text) and ``/status`` (JSON) are served over HTTP.
+    """
+
+    def __init__(
+        self, node_rank=0, status_dir="", port=0, interval=15.0, window=DEFAULT_WINDOW, stall_seconds=DEFAULT_STALL_SECONDS
+    ):
+        self.node_rank = node_rank
+        self.status_dir = status_dir
+        self.port = port
+        self.interval = interval
+        self.window = window
+        self.stall_seconds = stall_seconds
+        self.label = ""
+        self.sections = {}
+        self.metric_seconds = {}
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+        self._server = None
+
+    def start(self):
+        if self.status_dir:
+            os.makedirs(self.status_dir, exist_ok=True)
+            thread = threading.Thread(target=self._write_loop, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        if self.port:
+            self._server = ThreadingHTTPServer(("0.0.0.0", self.port), _handler(self))
+            thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+            print(f"Telemetry: http://{socket.gethostname()}:{self.port}/metrics and /status")
+        return self
+
+    def close(self):
+        self._stop.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+        if self.status_dir:
+            self.write()
+
+    def _section_name(self, visual_movement):
+        return f"{self.label}:{visual_movement}" if self.label else visual_movement
+
+    def begin(self, visual_movement, total, scope="shard"):
+        with self._lock:
+            self.sections[self._section_name(visual_movement)] = _Section(total, scope)
+
+    def extend(self, visual_movement, count):
+        # follow 模式下工作集随推理进度增长
+        with self._lock:
+            section = self.sections.get(self._section_name(visual_movement))
+            if section is not None:
+                section.total = (section.total or 0) + count
+
+    def record(self, event):
+        """Fold one worker event: ``{"visual_movement", "instance", "seconds", "computed", "cached", "metrics"}``."""
+        now = time.time()
+        with self._lock:
+            section = self.sections.get(self._section_name(event["visual_movement"]))
+            if section is None or event["instance"] in section.done:
+                return
+            section.done.add(event["instance"])
+            section.window.append(now)
+            section.last_progress = now
+            section.computed += event.get("computed", 0)
+            section.cached += event.get("cached", 0)
+            section.seconds += event.get("seconds", 0.0)
+            for metric, seconds in event.get("metrics", {}).items():
+                total, count = self.metric_seconds.get(metric, (0.0, 0))
+                self.metric_seconds[metric] = (total + seconds, count + 1)
+
+    def fail(self, visual_movement, instance_keys):
+        with self._lock:
+            section = self.sections.get(self._section_name(visual_movement))
+            if section is not None:
+                section.failed.update(instance_keys)
+
+    def status(self):
+        now = time.time()
+        with self._lock:
+            sections = {name: section.status(now, self.window) for name, section in self.sections.items()}
+            metrics = {
+                metric: {"seconds": round(total, 3), "count": count, "mean": round(total / count, 3)}
+                for metric, (total, count) in self.metric_seconds.items()
+            }
+        progress = [s["last_progress"] for s in sections.values() if s["last_progress"]]
+        return {
+            "node": self.node_rank,
+            "host": socket.gethostname(),
+            "pid": os.getpid(),
+            "started": self.started,
+            "updated": now,
+            "last_progress": max(progress) if progress else None,
+            "finished": self._stop.is_set(),
+            "sections": sections,
+            "metric_seconds": metrics,
+        }
+
+    def write(self):
+        _write_json_atomic(os.path.join(self.status_dir, f"node_{self.node_rank}.json"), self.status())
+        if self.node_rank == 0:
+            _write_json_atomic(
+                os.path.join(self.status_dir, RUN_STATUS_FILENAME),
+                merge_status(load_nodes(self.status_dir), self.stall_seconds),
+            )
+
+    def _write_loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.write()
+            except OSError as e:
+                print(f"Warning: telemetry status not written: {e}")
+
+    def prometheus(self):
+        status = self.status()
+        node = status["node"]
+        lines = []
+
+        def _metric(name, kind, help_text, samples):
+            lines.append(f"# HELP worldscore_eval_{name} {help_text}")
+            lines.append(f"# TYPE worldscore_eval_{name} {kind}")
+            for labels, value in samples:
+                if value is None:
+                    continue
+                label_text = ",".join(f'{k}="{v}"' for k, v in dict(node=node, **labels).items())
+                lines.append(f"worldscore_eval_{name}{{{label_text}}} {value}")
+
+        sections = status["sections"].items()
+        _metric("instances_total", "gauge", "Instances assigned to this section", [({"section": n}, s["total"]) for n, s in sections])
+        _metric("instances_done", "counter", "Instances evaluated", [({"section": n}, s["done"]) for n, s in sections])
+        _metric("instances_failed", "counter", "Instances in failed chunks", [({"section": n}, s["failed"]) for n, s in sections])
+        _metric("throughput", "gauge", "Instances per second over the rolling window", [({"section": n}, s["throughput"]) for n, s in sections])
+        _metric("eta_seconds", "gauge", "Estimated seconds until the section finishes", [({"section": n}, s["eta_seconds"]) for n, s in sections])
+        _metric(
+            "metric_seconds_sum",
+            "counter",
+            "Seconds spent in each metric",
+            [({"metric": m}, v["seconds"]) for m, v in status["metric_seconds"].items()],
+        )
+        _metric(
+            "metric_seconds_count",
+            "counter",
+            "Instances timed for each metric",
+            [({"metric": m}, v["count"]) for m, v in status["metric_seconds"].items()],
+        )
+        _metric("last_progress_timestamp_seconds", "gauge", "Time of the last finished instance", [({}, status["last_progress"])])
+        return "\n".join(lines) + "\n"
+
+
+def _handler(telemetry):
+    class _Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.startswith("/metrics"):
+                body, content_type = telemetry.prometheus(), "text/plain; version=0.0.4"
+            elif self.path.startswith("/status"):
+                body, content_type = json.dumps(telemetry.status(), indent=2), "application/json"
+            else:
+                self.send_error(404)
+                return
+            data = body.encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    return _Handler
+
+
+def load_nodes(status_dir):
+    nodes = []
+    for name in sorted(os.listdir(status_dir)):
+        if name.startswith("node_") and name.endswith(".json"):
+            try:
+                with open(os.path.join(status_dir, name), "r", encoding="utf-8") as f:
+                    nodes.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+    return nodes
+
+
+def merge_status(nodes, stall_seconds=DEFAULT_STALL_SECONDS, now=None):
+    """Whole-run view: per-section totals, summed throughput, an ETA, and the nodes that look stalled."""
+    now = now or time.time()
+    sections = {}
+    for node in nodes:
+        for name, section in node["sections"].items():
+            merged = sections.setdefault(name, {"total": 0, "done": 0, "failed": 0, "throughput": 0.0, "run_total": None})
+            merged["done"] += section["done"]
+            merged["failed"] += section["failed"]
+            merged["throughput"] += section["throughput"]
+            if section["total"] is not None:
+                if section["scope"] == "run":
+                    # 工作账本模式下各节点报告的是同一个全量
+                    merged["run_total"] = max(merged["run_total"] or 0, section["total"])
+                else:
+                    merged["total"] += section["total"]
+    remaining_total, throughput_total = 0, 0.0
+    for merged in sections.values():
+        run_total = merged.pop("run_total")
+        if run_total is not None:
+            merged["total"] = run_total
+        merged["throughput"] = round(merged["throughput"], 4)
+        remaining = max(merged["total"] - merged["done"] - merged["failed"], 0)
+        merged["eta_seconds"] = _eta(remaining, merged["throughput"])
+        remaining_total += remaining
+        throughput_total += merged["throughput"] if remaining else 0.0
+
+    stalled = []
+    for node in nodes:
+        sections_left = [s for s in node["sections"].values() if s["total"] is None or s["done"] + s["failed"] < s["total"]]
+        busy = bool(sections_left) and not node["finished"]
+        last = node["last_progress"] or node["started"]
+        if busy and now - last > stall_seconds:
+            stalled.append({"node": node["node"], "host": node["host"], "idle_seconds": round(now - last, 1)})
+    return {
+        "updated": now,
+        "nodes": len(nodes),
+        "sections": sections,
+        "remaining": remaining_total,
+        "eta_seconds": _eta(remaining_total, throughput_total),
+        "stalled": stalled,
+    }
+
+
+def _format_eta(seconds):
+    if seconds is None:
+        return "-"
+    return time.strftime("%H:%M:%S", time.gmtime(seconds)) if seconds < 86400 else f"{seconds / 86400:.1f}d"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Show the live progress of a running evaluation from its status files")
+    parser.add_argument("status_dir", help="<run.output_root>/telemetry/<run id>")
+    parser.add_argument("--stall-seconds", type=float, default=DEFAULT_STALL_SECONDS)
+    args = parser.parse_args()
+
+    nodes = load_nodes(args.status_dir)
+    now = time.time()
+    print(f"{'node':>4} {'host':<20} {'section':<24} {'done':>8} {'total':>8} {'fail':>5} {'inst/s':>8} {'eta':>10} {'age_s':>7}")
+    for node in nodes:
+        for name, section in node["sections"].items():
+            print(
+                f"{node['node']:>4} {node['host'][:20]:<20} {name[:24]:<24} {section['done']:>8} "
+                f"{section['total'] if section['total'] is not None else '-':>8} {section['failed']:>5} "
+                f"{section['throughput']:>8.3f} {_format_eta(section['eta_seconds']):>10} {now - node['updated']:>7.0f}"
+            )
+    run = merge_status(nodes, args.stall_seconds, now)
+    print(f"run: {run['remaining']} instance(s) remaining, ETA {_format_eta(run['eta_seconds'])}")
+    for node in run["stalled"]:
+        print(f"Warning: node {node['node']} ({node['host']}) has made no progress for {node['idle_seconds']:.0f}s")
+
+
+if __name__ == "__main__":
+    main()
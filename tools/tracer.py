@@ -0,0 +1,229 @@
+import argparse
+import contextlib
+import glob
+import json
+import os
+import time
+
+import numpy as np
+
+TRACE_PREFIX = "trace_worker_"
+SUMMARY_FILENAME = "trace_summary.json"
+
+
+def _proc_io():
+    # /proc/self/io 只在 Linux 上存在；read_bytes 是块设备层读取量，rchar 还包括网络文件系统和页缓存命中
+    try:
+        with open("/proc/self/io", "r", encoding="ascii") as f:
+            fields = dict(line.split(": ") for line in f.read().splitlines())
+        return int(fields["rchar"]), int(fields["read_bytes"])
+    except (OSError, KeyError, ValueError):
+        return 0, 0
+
+
+def _cuda():
+    try:
+        import torch
+    except ImportError:
+        return None
+    if not torch.cuda.is_available():
+        return None
+    return torch.cuda
+
+
+class Tracer:
+    """Span recorder writing Chrome-trace/Perfetto JSON, one file per worker.
+
+    Each span records wall time and I/O bytes; on CUDA it also records
+    device time (CUDA events, resolved at ``flush`` so spans never
+    synchronise) and peak allocated memory. Events are appended as they are
+    flushed using the array format without a closing bracket, which both
+    viewers accept, so a killed worker still leaves a readable trace.
+    """
+
+    def __init__(self, trace_dir, worker_id, gpu_label="", shard_index=0):
+        os.makedirs(trace_dir, exist_ok=True)
+        self.worker_id = worker_id
+        # 多机时各节点写同一目录，用分片号区分进程号和文件名
+        self.pid = shard_index * 1000 + (int(gpu_label) if str(gpu_label).isdigit() else 0)
+        self.cuda = _cuda()
+        self.path = os.path.join(trace_dir, f"{TRACE_PREFIX}{shard_index}_{worker_id}.json")
+        self.pending = []
+        self.peaks = []
+        self._f = open(self.path, "a", encoding="utf-8")
+        if self._f.tell() == 0:
+            self._f.write("[\n")
+        self._write(
+            {"name": "process_name", "ph": "M", "pid": self.pid, "args": {"name": f"shard {shard_index} GPU {gpu_label or '-'}"}},
+            {"name": "thread_name", "ph": "M", "pid": self.pid, "tid": worker_id, "args": {"name": f"worker {worker_id}"}},
+        )
+
+    def _write(self, *events):
+        for event in events:
+            self._f.write(json.dumps(event, ensure_ascii=True) + ",\n")
+        self._f.flush()
+
+    @contextlib.contextmanager
+    def span(self, name, cat, **args):
+        cuda_events = None
+        if self.cuda is not None:
+            # 嵌套 span 会重置峰值统计，先把目前的峰值记到外层 span 上
+            if self.peaks:
+                self.peaks[-1] = max(self.peaks[-1], self.cuda.max_memory_allocated())
+            self.cuda.reset_peak_memory_stats()
+            self.peaks.append(0)
+            cuda_events = (self.cuda.Event(enable_timing=True), self.cuda.Event(enable_timing=True))
+            cuda_events[0].record()
+        rchar, read_bytes = _proc_io()
+        ts = time.time_ns() // 1000
+        start = time.perf_counter()
+        try:
+            yield args
+        finally:
+            dur = (time.perf_counter() - start) * 1e6
+            rchar_end, read_bytes_end = _proc_io()
+            args["rchar"] = rchar_end - rchar
+            args["read_bytes"] = read_bytes_end - read_bytes
+            if cuda_events is not None:
+                cuda_events[1].record()
+                peak = max(self.peaks.pop(), self.cuda.max_memory_allocated())
+                if self.peaks:
+                    self.peaks[-1] = max(self.peaks[-1], peak)
+                args["peak_mem_mb"] = round(peak / (1 << 20), 1)
+            event = {"name": name, "cat": cat, "ph": "X", "ts": ts, "dur": round(dur, 1), "pid": self.pid, "tid": self.worker_id, "args": args}
+            self.pending.append((event, cuda_events))
+
+    def flush(self):
+        events = []
+        for event, cuda_events in self.pending:
+            if cuda_events is not None:
+                cuda_events[1].synchronize()
+                event["args"]["cuda_ms"] = round(cuda_events[0].elapsed_time(cuda_events[1]), 3)
+            events.append(event)
+        self.pending = []
+        self._write(*events)
+
+
+def reset_traces(trace_dir, shard_index=0, num_shards=1):
+    """Remove the trace files an earlier run left for this shard; returns how many were removed.
+
+    Workers append to their file (a restarted worker keeps its earlier spans),
+    so a rerun into the same directory would otherwise mix in stale events.
+    Shard 0 also removes the summary and files of shards beyond ``num_shards``.
+    """
+    stale = glob.glob(os.path.join(trace_dir, f"{TRACE_PREFIX}{shard_index}_*.json"))
+    if shard_index == 0:
+        for path in glob.glob(os.path.join(trace_dir, f"{TRACE_PREFIX}*.json")):
+            shard = os.path.basename(path)[len(TRACE_PREFIX) :].split("_", 1)[0]
+            if shard.isdigit() and int(shard) >= max(num_shards, 1):
+                stale.append(path)
+        stale.append(os.path.join(trace_dir, SUMMARY_FILENAME))
+    removed = 0
+    for path in stale:
+        try:
+            os.remove(path)
+            removed += 1
+        except FileNotFoundError:
+            continue
+    return removed
+
+
+def load_events(trace_dir):
+    events = []
+    for path in sorted(glob.glob(os.path.join(trace_dir, f"{TRACE_PREFIX}*.json"))):
+        with open(path, "r", encoding="utf-8") as f:
+            text = f.read().rstrip().rstrip(",")
+        if not text.endswith("]"):
+            text += "]"
+        events.extend(e for e in json.loads(text) if e.get("ph") == "X")
+    return events
+
+
+def _gaps(spans):
+    spans = sorted(spans)
+    gaps = []
+    end = spans[0][1]
+    for span_start, span_end in spans[1:]:
+        if span_start > end:
+            gaps.append(span_start - end)
+        end = max(end, span_end)
+    return spans[0][0], end, gaps
+
+
+def summarize(trace_dir, top=10):
+    """Aggregate every worker trace under ``trace_dir`` into per-metric and per-GPU tables."""
+    events = load_events(trace_dir)
+    per_metric = {}
+    for event in events:
+        if event["cat"] == "metric":
+            per_metric.setdefault(event["name"], []).append(event)
+    metrics = {}
+    for name, spans in per_metric.items():
+        wall = np.array([e["dur"] for e in spans]) / 1e6
+        cuda = [e["args"]["cuda_ms"] / 1e3 for e in spans if "cuda_ms" in e["args"]]
+        metrics[name] = {
+            "count": len(spans),
+            "total_s": round(float(wall.sum()), 2),
+            "p50_s": round(float(np.percentile(wall, 50)), 3),
+            "p95_s": round(float(np.percentile(wall, 95)), 3),
+            "max_s": round(float(wall.max()), 3),
+            "cuda_s": round(sum(cuda), 2) if cuda else None,
+            "peak_mem_mb": max((e["args"].get("peak_mem_mb", 0) for e in spans), default=0) or None,
+            "read_mb": round(sum(e["args"].get("rchar", 0) for e in spans) / (1 << 20), 1),
+        }
+
+    slowest = sorted((e for e in events if e["cat"] == "metric"), key=lambda e: e["dur"], reverse=True)[:top]
+    gpus = {}
+    by_gpu = {}
+    for event in events:
+        if event["cat"] == "instance":
+            by_gpu.setdefault(event["pid"], []).append((event["ts"], event["ts"] + event["dur"]))
+    for pid, spans in by_gpu.items():
+        first, last, gaps = _gaps(spans)
+        span_total = max(last - first, 1)
+        gpus[str(pid)] = {
+            "instances": len(spans),
+            "utilisation": round(1 - sum(gaps) / span_total, 4),
+            "idle_s": round(sum(gaps) / 1e6, 2),
+            "largest_gap_s": round(max(gaps, default=0) / 1e6, 2),
+        }
+    summary = {
+        "metrics": dict(sorted(metrics.items(), key=lambda kv: kv[1]["total_s"], reverse=True)),
+        "slowest": [
+            {"metric": e["name"], "instance": e["args"].get("instance"), "seconds": round(e["dur"] / 1e6, 2)}
+            for e in slowest
+        ],
+        "gpus": gpus,
+    }
+    with open(os.path.join(trace_dir, SUMMARY_FILENAME), "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2, ensure_ascii=True)
+    return summary
+
+
+def print_summary(summary):
+    print(f"{'metric':<40} {'count':>6} {'total_s':>9} {'p50_s':>8} {'p95_s':>8} {'max_s':>8} {'cuda_s':>8} {'peak_mb':>8}")
+    for name, row in summary["metrics"].items():
+        print(
+            f"{name:<40} {row['count']:>6} {row['total_s']:>9.1f} {row['p50_s']:>8.2f} {row['p95_s']:>8.2f} "
+            f"{row['max_s']:>8.2f} {row['cuda_s'] if row['cuda_s'] is not None else '-':>8} "
+            f"{row['peak_mem_mb'] if row['peak_mem_mb'] is not None else '-':>8}"
+        )
+    for row in summary["slowest"]:
+        print(f"slow: {row['seconds']:>8.1f}s  {row['metric']}  {row['instance']}")
+    for gpu, row in sorted(summary["gpus"].items()):
+        print(
+            f"gpu {gpu}: {row['instances']} instances, utilisation {row['utilisation']:.1%}, "
+            f"idle {row['idle_s']:.1f}s, largest gap {row['largest_gap_s']:.1f}s"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Summarise evaluation traces")
+    parser.add_argument("trace_dir")
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+    print_summary(summarize(args.trace_dir, args.top))
+
+
+if __name__ == "__main__":
+    main()
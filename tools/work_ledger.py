@@ -0,0 +1,274 @@
+import argparse
+import hashlib
+import json
+import os
+import socket
+import threading
+import time
+
+MANIFEST_FILENAME = "manifest.json"
+DEFAULT_RETRIES = 2
+
+
+def _create_exclusive(path, data):
+    # O_EXCL 在本地盘和 NFSv3+ 上都是原子的，创建成功即持有该文件
+    try:
+        fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+    except FileExistsError:
+        return False
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=True)
+    return True
+
+
+def _read_json(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+class WorkLedger:
+    """Lease-directory work queue shared by every node through the run's output filesystem.
+
+    The sorted key list is cut into blocks of ``block_size``; a node owns a
+    block while ``leases/<block>`` (created with ``O_EXCL``) names it, and
+    ``done/<block>`` records completion. Each node heartbeats
+    ``nodes/<holder>``; a lease whose holder has not heartbeat for
+    ``lease_timeout`` seconds is stolen by atomically renaming it away.
+    Nodes take their own stripe of blocks first, then steal the remaining
+    blocks of other stripes from the far end. A failed block leaves a marker
+    in ``failed/`` and is claimable again until it has failed ``retries + 1``
+    times, after which it is recorded as done with ``ok: false``.
+    """
+
+    def __init__(
+        self, ledger_dir, keys, block_size=1, node_rank=0, num_nodes=1, lease_timeout=120.0, retries=DEFAULT_RETRIES
+    ):
+        self.ledger_dir = ledger_dir
+        self.block_size = max(int(block_size), 1)
+        self.blocks = [list(keys[i : i + self.block_size]) for i in range(0, len(keys), self.block_size)]
+        self.lease_timeout = lease_timeout
+        self.retries = max(int(retries), 0)
+        self.holder = f"node{node_rank}-{socket.gethostname()}-{os.getpid()}"
+        for sub in ("leases", "done", "failed", "nodes"):
+            os.makedirs(os.path.join(ledger_dir, sub), exist_ok=True)
+        self._check_manifest(keys)
+
+        num_nodes = max(int(num_nodes), 1)
+        home = [b for b in range(len(self.blocks)) if b % num_nodes == node_rank % num_nodes]
+        others = [b for b in reversed(range(len(self.blocks))) if b % num_nodes != node_rank % num_nodes]
+        self._order = home + others
+        self._cursor = 0
+        self._last_steal_scan = 0.0
+        self.held = set()
+        self.stats = {"claimed": 0, "stolen": 0, "retried": 0, "completed": 0, "failed": 0}
+        self._stop = threading.Event()
+        self._heartbeat_thread = None
+
+    def _check_manifest(self, keys):
+        digest = hashlib.sha1("\n".join(keys).encode("utf-8")).hexdigest()
+        manifest = {"blocks": len(self.blocks), "block_size": self.block_size, "keys": len(keys), "digest": digest}
+        path = os.path.join(self.ledger_dir, MANIFEST_FILENAME)
+        if _create_exclusive(path, manifest):
+            return
+        existing = None
+        for _ in range(50):
+            existing = _read_json(path)
+            if existing is not None:
+                break
+            time.sleep(0.1)
+        if existing != manifest:
+            # 各节点发现的实例列表必须一致，否则块编号对不上
+            raise RuntimeError(f"Work ledger {self.ledger_dir} was created for a different instance list: {existing} != {manifest}")
+
+    def _path(self, sub, block):
+        return os.path.join(self.ledger_dir, sub, f"{block:07d}")
+
+    def start(self):
+        self._beat()
+        self._heartbeat_thread = threading.Thread(target=self._heartbeat_loop, name="ledger-heartbeat", daemon=True)
+        self._heartbeat_thread.start()
+        return self
+
+    def _beat(self):
+        with open(os.path.join(self.ledger_dir, "nodes", self.holder), "w", encoding="utf-8") as f:
+            f.write(str(time.time()))
+
+    def _heartbeat_loop(self):
+        while not self._stop.wait(max(self.lease_timeout / 4, 0.5)):
+            try:
+                self._beat()
+            except OSError as e:
+                print(f"Warning: ledger heartbeat failed: {e}")
+
+    def _holder_alive(self, holder, lease_path):
+        if holder == self.holder:
+            return True
+        try:
+            last = os.path.getmtime(os.path.join(self.ledger_dir, "nodes", holder))
+        except OSError:
+            # 持有者还没写过心跳：以租约文件本身的时间为准
+            try:
+                last = os.path.getmtime(lease_path)
+            except OSError:
+                return True
+        return time.time() - last < self.lease_timeout
+
+    def _lease(self, block):
+        if _create_exclusive(self._path("leases", block), {"holder": self.holder, "time": time.time()}):
+            if os.path.exists(self._path("done", block)):
+                # 完成记录和租约删除之间的窗口里抢到了已完成的块
+                os.remove(self._path("leases", block))
+                return False
+            self.held.add(block)
+            return True
+        return False
+
+    def claim(self, max_blocks):
+        """Lease up to ``max_blocks`` unfinished blocks; returns ``[(block, keys)]``."""
+        got = []
+        while self._cursor < len(self._order) and len(got) < max_blocks:
+            block = self._order[self._cursor]
+            self._cursor += 1
+            if os.path.exists(self._path("done", block)) or os.path.exists(self._path("leases", block)):
+                continue
+            if self._lease(block):
+                self.stats["claimed"] += 1
+                got.append(block)
+        if len(got) < max_blocks and self._cursor >= len(self._order):
+            got.extend(self._retry(max_blocks - len(got)))
+        if len(got) < max_blocks and self._cursor >= len(self._order):
+            got.extend(self._steal(max_blocks - len(got)))
+        return [(block, self.blocks[block]) for block in got]
+
+    def _failures(self):
+        counts = {}
+        for name in os.listdir(os.path.join(self.ledger_dir, "failed")):
+            block = name.split(".", 1)[0]
+            if block.isdigit():
+                counts[int(block)] = counts.get(int(block), 0) + 1
+        return counts
+
+    def _retry(self, max_blocks):
+        # 失败的块没有完成记录、租约也已释放，重新领取即可；达到重试上限时由 complete 记为完成（失败）
+        retried = []
+        for block, count in sorted(self._failures().items()):
+            if len(retried) >= max_blocks:
+                break
+            if count > self.retries or block in self.held:
+                continue
+            if os.path.exists(self._path("done", block)) or os.path.exists(self._path("leases", block)):
+                continue
+            if self._lease(block):
+                self.stats["retried"] += 1
+                retried.append(block)
+        return retried
+
+    def _steal(self, max_blocks):
+        now = time.time()
+        if now - self._last_steal_scan < max(self.lease_timeout / 4, 0.5):
+            return []
+        self._last_steal_scan = now
+        stolen = []
+        lease_dir = os.path.join(self.ledger_dir, "leases")
+        for name in sorted(os.listdir(lease_dir), reverse=True):
+            if len(stolen) >= max_blocks:
+                break
+            if not name.isdigit():
+                continue
+            block = int(name)
+            path = self._path("leases", block)
+            if block in self.held:
+                continue
+            if os.path.exists(self._path("done", block)):
+                continue
+            lease = _read_json(path)
+            if lease is None or self._holder_alive(lease.get("holder", ""), path):
+                continue
+            # rename 到唯一的墓碑名只有一个节点能成功，但读租约和 rename 之间另一个节点可能已经收回并建了新租约，
+            # 所以要核对墓碑里仍是那个失联的持有者；不是的话把别人的新租约放回去
+            tombstone = f"{path}.stale.{self.holder}.{time.time_ns()}"
+            try:
+                os.rename(path, tombstone)
+            except OSError:
+                continue
+            moved = _read_json(tombstone)
+            if moved != lease:
+                try:
+                    os.link(tombstone, path)
+                except OSError:
+                    print(f"Warning: could not restore the lease of block {block} taken by {moved and moved.get('holder')}")
+                os.remove(tombstone)
+                continue
+            os.remove(tombstone)
+            print(f"Reclaiming block {block} from {lease.get('holder')} (no heartbeat for {self.lease_timeout:.0f}s)")
+            if self._lease(block):
+                self.stats["stolen"] += 1
+                stolen.append(block)
+        return stolen
+
+    def complete(self, block, ok=True):
+        record = {"holder": self.holder, "ok": ok, "time": time.time()}
+        if ok:
+            _create_exclusive(self._path("done", block), record)
+            self.stats["completed"] += 1
+        else:
+            _create_exclusive(f"{self._path('failed', block)}.{self.holder}.{time.time_ns()}", record)
+            self.stats["failed"] += 1
+            if self._failures().get(block, 0) > self.retries:
+                print(f"Warning: block {block} failed {self.retries + 1} time(s); giving up on it")
+                _create_exclusive(self._path("done", block), record)
+        try:
+            os.remove(self._path("leases", block))
+        except OSError:
+            pass
+        self.held.discard(block)
+
+    def done_count(self):
+        return len(os.listdir(os.path.join(self.ledger_dir, "done")))
+
+    def all_done(self):
+        return self.done_count() >= len(self.blocks)
+
+    def close(self):
+        self._stop.set()
+        if self._heartbeat_thread is not None:
+            self._heartbeat_thread.join()
+
+
+def status(ledger_dir, lease_timeout=120.0):
+    manifest = _read_json(os.path.join(ledger_dir, MANIFEST_FILENAME)) or {}
+    now = time.time()
+    nodes = {}
+    for name in sorted(os.listdir(os.path.join(ledger_dir, "nodes"))):
+        age = now - os.path.getmtime(os.path.join(ledger_dir, "nodes", name))
+        nodes[name] = {"heartbeat_age_s": round(age, 1), "alive": age < lease_timeout, "leases": 0, "done": 0}
+    for name in nodes:
+        nodes[name]["failed"] = 0
+    for sub, field in (("leases", "leases"), ("done", "done"), ("failed", "failed")):
+        if not os.path.isdir(os.path.join(ledger_dir, sub)):
+            continue
+        for name in os.listdir(os.path.join(ledger_dir, sub)):
+            record = _read_json(os.path.join(ledger_dir, sub, name)) or {}
+            holder = record.get("holder")
+            if holder in nodes:
+                nodes[holder][field] += 1
+    done = len(os.listdir(os.path.join(ledger_dir, "done")))
+    failed = len(os.listdir(os.path.join(ledger_dir, "failed"))) if os.path.isdir(os.path.join(ledger_dir, "failed")) else 0
+    return {"blocks": manifest.get("blocks", 0), "done": done, "failures": failed, "nodes": nodes}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Inspect an evaluation work ledger")
+    parser.add_argument("ledger_dir")
+    parser.add_argument("--lease-timeout", type=float, default=120.0)
+    args = parser.parse_args()
+    for root, dirs, files in os.walk(args.ledger_dir):
+        if MANIFEST_FILENAME in files:
+            print(f"{root}: {json.dumps(status(root, args.lease_timeout), indent=2)}")
+
+
+if __name__ == "__main__":
+    main()